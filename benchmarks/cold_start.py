@@ -0,0 +1,87 @@
+"""
+Relatório de tempo de import do worker (cold start).
+
+Mede, num interpretador novo, o custo de import do caminho até o primeiro claim
+(o que workers.py importa no topo) e dos módulos carregados no warm-up, usando
+`python -X importtime`.
+
+Uso:
+    python -m benchmarks.cold_start [--top 15] [--out cold_start.json]
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+from utils.startup import WORKER_WARM_UP_MODULES
+
+# O que workers.py importa antes de conectar na fila e começar o claim
+CLAIM_PATH_MODULES = (
+    "dotenv",
+    "pymongo",
+    "utils.logging_utils",
+    "utils.memory_budget",
+    "utils.metrics",
+    "utils.queue_utils",
+    "utils.startup",
+)
+
+
+def _importtime(modules, preloaded=()):
+    """Importa `modules` (após `preloaded`) num processo novo; retorna (segundos, [(cumulativo_us, módulo)])."""
+    code = "".join(f"import {m}\n" for m in preloaded)
+    code += "import time\n_t = time.perf_counter()\n"
+    code += "".join(f"import {m}\n" for m in modules)
+    code += "print(time.perf_counter() - _t)\n"
+    started = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, check=True)
+    wall = time.perf_counter() - started
+
+    entries = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        entries.append((int(cumulative), name[1:].rstrip()))
+    return float(proc.stdout.strip().splitlines()[-1]), wall, entries
+
+
+def run_report(top=15):
+    report = {}
+    loaded = set()
+    for phase, modules, preloaded in (
+        ("claim_path", CLAIM_PATH_MODULES, ()),
+        ("warm_up", WORKER_WARM_UP_MODULES, CLAIM_PATH_MODULES),
+    ):
+        seconds, wall, entries = _importtime(modules, preloaded)
+        # Só módulos de primeiro nível (sem indentação) e ainda não contados na fase anterior
+        top_level = [e for e in entries if not e[1].startswith(" ") and e[1] not in loaded]
+        loaded.update(name for _, name in top_level)
+        slowest = sorted(top_level, reverse=True)[:top]
+        report[phase] = {
+            "import_seconds": round(seconds, 4),
+            "process_seconds": round(wall, 4),
+            "slowest": [{"module": name.strip(), "cumulative_seconds": round(us / 1e6, 4)} for us, name in slowest],
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tempo de import do worker (cold start).")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--out", help="Grava o relatório em JSON")
+    args = parser.parse_args()
+
+    report = run_report(args.top)
+    for phase, entry in report.items():
+        print(f"{phase}: {entry['import_seconds']:.2f}s de import ({entry['process_seconds']:.2f}s de processo)")
+        for item in entry["slowest"]:
+            print(f"    {item['cumulative_seconds']:>7.3f}s  {item['module']}")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Relatório precisão x velocidade das opções do extrator.
+
+Roda extract_landmarks_from_video em cada vídeo com uma grade de configurações e
+compara os landmarks com a configuração de referência (model_complexity=1, todos
+os frames, resolução original), nos frames que ambas processaram.
+
+Uso:
+    python -m benchmarks.extraction_report video1.mp4 [video2.mp4 ...] [--out relatorio.json]
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from services.pose_extractor import extract_landmarks_from_video, extraction_options
+
+CONFIGS = {
+    "baseline": {},
+    "complexity0": {"model_complexity": 0},
+    "side640": {"max_inference_side": 640},
+    "side480": {"max_inference_side": 480},
+    "fps15": {"target_fps": 15},
+    "fps10": {"target_fps": 10},
+    "fps15_side640": {"target_fps": 15, "max_inference_side": 640},
+    "fps15_side480_c0": {"target_fps": 15, "max_inference_side": 480, "model_complexity": 0},
+    "ffmpeg_side640": {"decoder": "ffmpeg", "max_inference_side": 640},
+    "ffmpeg_fps15_side640": {"decoder": "ffmpeg", "target_fps": 15, "max_inference_side": 640},
+}
+
+# Erro considerado "acerto" no PCK, em fração da diagonal normalizada da imagem
+PCK_THRESHOLD = 0.05
+
+
+def _compare(baseline, poses):
+    """Erro médio (x, y normalizados) e PCK contra a referência, nos frames em comum."""
+    common, base_idx, pose_idx = np.intersect1d(baseline.frame_indices, poses.frame_indices, return_indices=True)
+    if not len(common):
+        return {"common_frames": 0, "mean_error": None, "pck": None}
+    diff = baseline.xy[base_idx] - poses.xy[pose_idx]
+    error = np.linalg.norm(diff, axis=-1)
+    return {
+        "common_frames": int(len(common)),
+        "mean_error": float(error.mean()),
+        "pck": float((error < PCK_THRESHOLD).mean()),
+    }
+
+
+def run_report(video_paths, configs=CONFIGS, max_frames=300):
+    report = []
+    for path in video_paths:
+        baseline = None
+        for name, overrides in configs.items():
+            options = extraction_options(max_frames=max_frames, **overrides)
+            start = time.perf_counter()
+            _, poses = extract_landmarks_from_video(path, frame_mode="none", **options)
+            elapsed = time.perf_counter() - start
+
+            if name == "baseline":
+                baseline = poses
+            entry = {
+                "video": path,
+                "config": name,
+                "options": options,
+                "seconds": round(elapsed, 3),
+                "detected_frames": len(poses),
+                "speedup": None,
+            }
+            if baseline is not None:
+                entry.update(_compare(baseline, poses))
+            report.append(entry)
+
+        base_time = next(e["seconds"] for e in report if e["video"] == path and e["config"] == "baseline")
+        for entry in report:
+            if entry["video"] == path and entry["seconds"]:
+                entry["speedup"] = round(base_time / entry["seconds"], 2)
+    return report
+
+
+def _print_table(report):
+    print(f"{'vídeo':<30} {'config':<20} {'tempo(s)':>9} {'speedup':>8} {'detect':>7} {'erro':>8} {'PCK':>6}")
+    for e in report:
+        error = f"{e['mean_error']:.4f}" if e.get("mean_error") is not None else "-"
+        pck = f"{e['pck']:.2f}" if e.get("pck") is not None else "-"
+        print(
+            f"{e['video'][-30:]:<30} {e['config']:<20} {e['seconds']:>9.2f} {e['speedup'] or 0:>8.2f} "
+            f"{e['detected_frames']:>7} {error:>8} {pck:>6}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Relatório precisão x velocidade do extrator de landmarks.")
+    parser.add_argument("videos", nargs="+")
+    parser.add_argument("--max-frames", type=int, default=300)
+    parser.add_argument("--out", help="Grava o relatório completo em JSON")
+    args = parser.parse_args()
+
+    report = run_report(args.videos, max_frames=args.max_frames)
+    _print_table(report)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
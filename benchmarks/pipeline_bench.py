@@ -0,0 +1,247 @@
+"""
+Benchmark offline do pipeline completo.
+
+Gera vídeos sintéticos em várias resoluções/durações e mede cada etapa
+(extract_landmarks_from_video, analyze_poses, generate_comparative_video,
+generate_pdf_report) e o job inteiro (process_job, o mesmo caminho do worker),
+usando mongomock (ou um mongod local via --mongo-uri), um S3 em sistema de
+arquivos e feedback stub. O relatório JSON traz throughput, percentis de
+latência e o pico de memória de cada cenário (acima do RSS do início do
+cenário); com --baseline compara latência e memória com um relatório salvo e
+sai com código 1 se algum cenário regrediu além da tolerância.
+
+Uso:
+    python -m benchmarks.pipeline_bench [--quick] [--out atual.json] [--baseline base.json]
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from benchmarks.standins import LocalS3Client, SyntheticExtractor, make_landmarks, make_video, stub_feedback
+from services.job_pipeline import JobContext, process_job
+from services.pose_analyzer import analyze_poses
+from services.pose_extractor import extract_landmarks_from_video, extraction_options, read_frames
+from services.video_generator import generate_comparative_video
+from utils.helpers import generate_pdf_report
+from utils.metrics import current_rss_bytes
+
+BUCKET = "bench"
+
+# (nome, largura, altura, segundos)
+VIDEOS = [
+    ("270p_2s", 480, 270, 2),
+    ("720p_2s", 1280, 720, 2),
+    ("720p_5s", 1280, 720, 5),
+    ("1080p_5s", 1920, 1080, 5),
+]
+QUICK_VIDEOS = VIDEOS[:2]
+
+# Regressão: p50 ou pico de memória acima de (1 + tolerância) x baseline
+DEFAULT_TOLERANCE = 0.2
+# Variações de memória abaixo disso são ruído do alocador, não regressão
+MEMORY_SLACK_BYTES = 32 * 1024 * 1024
+RSS_SAMPLE_SECONDS = 0.005
+
+
+class _RssSampler:
+    """
+    Amostra o RSS atual em uma thread enquanto o cenário roda. ru_maxrss só cresce
+    no processo inteiro (cenários seguintes herdariam o pico dos anteriores); aqui o
+    pico é medido acima do RSS do início do cenário.
+    """
+
+    def __enter__(self):
+        gc.collect()
+        self.start = self.peak = current_rss_bytes()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(RSS_SAMPLE_SECONDS):
+            self.peak = max(self.peak, current_rss_bytes())
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss_bytes())
+
+    @property
+    def delta_bytes(self):
+        return self.peak - self.start
+
+
+def _measure(func, repeat, units=1):
+    """Roda func `repeat` vezes; retorna latências (s), percentis, throughput (units/s) e pico de RSS do cenário."""
+    latencies = []
+    with _RssSampler() as rss:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            latencies.append(time.perf_counter() - start)
+    latencies = np.array(latencies)
+    return {
+        "repeat": repeat,
+        "p50_seconds": round(float(np.percentile(latencies, 50)), 4),
+        "p90_seconds": round(float(np.percentile(latencies, 90)), 4),
+        "p99_seconds": round(float(np.percentile(latencies, 99)), 4),
+        "mean_seconds": round(float(latencies.mean()), 4),
+        "throughput_per_second": round(units / float(latencies.mean()), 2),
+        "peak_rss_delta_bytes": rss.delta_bytes,
+    }
+
+
+def _mongo_queue(mongo_uri):
+    if mongo_uri:
+        from pymongo import MongoClient
+        return MongoClient(mongo_uri).bench_pipeline.jobs_fila
+    try:
+        import mongomock
+    except ImportError:
+        sys.exit("mongomock não instalado: pip install mongomock (ou use --mongo-uri de um mongod local)")
+    return mongomock.MongoClient().bench_pipeline.jobs_fila
+
+
+def run_benchmarks(workdir, videos=VIDEOS, repeat=3, max_frames=150, mongo_uri=None, stages=True):
+    report = {}
+    s3_client = LocalS3Client(os.path.join(workdir, "s3"))
+    queue = _mongo_queue(mongo_uri)
+    extractor = SyntheticExtractor()
+    options = extraction_options(max_frames=max_frames)
+
+    for name, width, height, seconds in videos:
+        ref_path = make_video(os.path.join(workdir, f"{name}_ref.mp4"), width, height, seconds, seed=1)
+        exec_path = make_video(os.path.join(workdir, f"{name}_exec.mp4"), width, height, seconds, seed=2)
+        for key, path in ((f"{name}_ref.mp4", ref_path), (f"{name}_exec.mp4", exec_path)):
+            with open(path, "rb") as f:
+                s3_client.put_object(Bucket=BUCKET, Key=key, Body=f.read())
+
+        n_frames = min(int(seconds * 30), max_frames)
+        ref_poses = make_landmarks(n_frames, seed=1)
+        exec_poses = make_landmarks(n_frames, seed=2)
+
+        if stages:
+            report[f"extract/{name}"] = _measure(
+                lambda: extract_landmarks_from_video(exec_path, max_frames=max_frames, frame_mode="none"),
+                repeat, n_frames,
+            )
+            report[f"analyze/{name}"] = _measure(lambda: analyze_poses(ref_poses, exec_poses), repeat, n_frames)
+
+            frames_ref = read_frames(ref_path, ref_poses.frame_indices, "small")
+            frames_exec = read_frames(exec_path, exec_poses.frame_indices, "small")
+            video_out = os.path.join(workdir, "comparativo.mp4")
+            report[f"video/{name}"] = _measure(
+                lambda: generate_comparative_video(frames_ref, ref_poses, frames_exec, exec_poses, output_path=video_out),
+                repeat, n_frames,
+            )
+            insights, avg_error, _ = analyze_poses(ref_poses, exec_poses)
+            pdf_out = os.path.join(workdir, "relatorio.pdf")
+            report[f"pdf/{name}"] = _measure(
+                lambda: generate_pdf_report("Bench", insights, avg_error, "comparativos/bench.mp4", pdf_out, "ok"),
+                repeat,
+            )
+
+        def full_job():
+            job_id = queue.insert_one({
+                "student": f"bench_{name}",
+                "ref_path": f"https://r2.local/{BUCKET}/{name}_ref.mp4",
+                "exec_path": f"https://r2.local/{BUCKET}/{name}_exec.mp4",
+                "status": "processing",
+            }).inserted_id
+            ctx = JobContext(
+                queue.find_one({"_id": job_id}), s3_client, BUCKET, stub_feedback,
+                extraction_pool=extractor, extraction_options=options,
+            )
+            status, _ = process_job(queue, ctx)
+            if status != "done":
+                raise RuntimeError(queue.find_one({"_id": job_id}).get("error_message"))
+
+        report[f"job/{name}"] = _measure(full_job, repeat, n_frames)
+
+    return report
+
+
+def compare(current, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Lista de regressões: cenários cujo p50 ou pico de memória passou de
+    (1 + tolerance) x baseline (memória com folga de MEMORY_SLACK_BYTES).
+    """
+    regressions = []
+    for name, entry in current.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if base["p50_seconds"]:
+            ratio = entry["p50_seconds"] / base["p50_seconds"]
+            if ratio > 1 + tolerance:
+                regressions.append({"scenario": name, "metric": "p50_seconds", "baseline": base["p50_seconds"],
+                                    "current": entry["p50_seconds"], "ratio": round(ratio, 2)})
+        # Relatórios antigos traziam o ru_maxrss do processo, que não serve para comparar
+        base_memory = base.get("peak_rss_delta_bytes")
+        if base_memory is not None and entry["peak_rss_delta_bytes"] > base_memory * (1 + tolerance) + MEMORY_SLACK_BYTES:
+            regressions.append({"scenario": name, "metric": "peak_rss_delta_bytes", "baseline": base_memory,
+                                "current": entry["peak_rss_delta_bytes"],
+                                "ratio": round(entry["peak_rss_delta_bytes"] / max(base_memory, 1), 2)})
+    return regressions
+
+
+def _print_table(report):
+    print(f"{'cenário':<22} {'p50(s)':>8} {'p90(s)':>8} {'p99(s)':>8} {'frames/s':>10} {'+pico RSS(MB)':>14}")
+    for name, e in report.items():
+        print(
+            f"{name:<22} {e['p50_seconds']:>8.3f} {e['p90_seconds']:>8.3f} {e['p99_seconds']:>8.3f} "
+            f"{e['throughput_per_second']:>10.1f} {e['peak_rss_delta_bytes'] / 2**20:>14.0f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline do pipeline do worker.")
+    parser.add_argument("--quick", action="store_true", help="Só os vídeos pequenos e uma repetição")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-frames", type=int, default=150)
+    parser.add_argument("--jobs-only", action="store_true", help="Mede só o job completo, sem as etapas isoladas")
+    parser.add_argument("--mongo-uri", help="mongod local em vez do mongomock")
+    parser.add_argument("--out", help="Grava o relatório em JSON")
+    parser.add_argument("--baseline", help="Relatório JSON anterior para comparação")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="pipeline_bench_") as workdir:
+        report = run_benchmarks(
+            workdir,
+            videos=QUICK_VIDEOS if args.quick else VIDEOS,
+            repeat=1 if args.quick else args.repeat,
+            max_frames=args.max_frames,
+            mongo_uri=args.mongo_uri,
+            stages=not args.jobs_only,
+        )
+    _print_table(report)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for r in regressions:
+            if r["metric"] == "p50_seconds":
+                print(f"[Regressão] {r['scenario']}: {r['baseline']:.3f}s -> {r['current']:.3f}s ({r['ratio']}x)")
+            else:
+                print(
+                    f"[Regressão] {r['scenario']}: pico de memória {r['baseline'] / 2**20:.0f} MB -> "
+                    f"{r['current'] / 2**20:.0f} MB ({r['ratio']}x)"
+                )
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
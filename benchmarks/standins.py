@@ -0,0 +1,315 @@
+"""
+Stand-ins locais para rodar o pipeline sem serviços externos: um cliente S3 que
+grava no sistema de arquivos (e um endpoint HTTP S3 sobre ele, para o boto3 de
+verdade), geradores de vídeos e landmarks sintéticos, um extrator sintético
+(decodifica os frames de verdade, mas não roda o MediaPipe) e um feedback stub.
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+import cv2
+import numpy as np
+from botocore.exceptions import ClientError
+
+from services.pose_extractor import read_frames
+from services.pose_sequence import PoseSequence
+
+
+def _client_error(code, operation):
+    return ClientError({"Error": {"Code": code, "Message": code}}, operation)
+
+
+class _Body:
+    def __init__(self, data):
+        self._data = data
+
+    def read(self):
+        return self._data
+
+    def iter_chunks(self, chunk_size=1024 * 1024):
+        for start in range(0, len(self._data), chunk_size):
+            yield self._data[start:start + chunk_size]
+
+
+class LocalS3Client:
+    """Subconjunto da API do boto3 usado pelo worker, com os objetos em `root/<bucket>/<key>`."""
+
+    class exceptions:
+        class NoSuchKey(Exception):
+            pass
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, bucket, key):
+        return os.path.join(self.root, bucket, key)
+
+    def _read(self, bucket, key, operation):
+        path = self._path(bucket, key)
+        if not os.path.exists(path):
+            if operation == "GetObject":
+                raise self.exceptions.NoSuchKey(key)
+            raise _client_error("404", operation)
+        with open(path, "rb") as f:
+            return f.read()
+
+    def _write(self, bucket, key, data):
+        path = self._path(bucket, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+
+    def head_object(self, Bucket, Key):
+        data = self._read(Bucket, Key, "HeadObject")
+        return {"ContentLength": len(data), "ETag": f'"{hashlib.md5(data).hexdigest()}"'}
+
+    def get_object(self, Bucket, Key, Range=None, IfMatch=None):
+        data = self._read(Bucket, Key, "GetObject")
+        if IfMatch and IfMatch.strip('"') != hashlib.md5(data).hexdigest():
+            raise _client_error("PreconditionFailed", "GetObject")
+        if Range:
+            start, end = Range.replace("bytes=", "").split("-")
+            data = data[int(start):int(end) + 1]
+        return {"Body": _Body(data), "ContentLength": len(data)}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self._write(Bucket, Key, Body if isinstance(Body, bytes) else Body.read())
+        return {}
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs=None, Callback=None, Config=None):
+        with open(Filename, "rb") as f:
+            data = f.read()
+        self._write(Bucket, Key, data)
+        if Callback:
+            Callback(len(data))
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, **kwargs):
+        self._write(Bucket, Key, Fileobj.read())
+
+    def delete_object(self, Bucket, Key):
+        path = self._path(Bucket, Key)
+        if os.path.exists(path):
+            os.remove(path)
+        return {}
+
+
+_S3_XMLNS = "http://s3.amazonaws.com/doc/2006-03-01/"
+
+
+class _S3Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive: o pool de conexões do cliente importa
+
+    def setup(self):
+        super().setup()
+        # Conexão nova: simula o handshake TCP/TLS até o R2
+        time.sleep(self.server.connect_latency)
+
+    def log_message(self, *args):
+        pass
+
+    def _target(self):
+        url = urlparse(self.path)
+        bucket, _, key = unquote(url.path).lstrip("/").partition("/")
+        return bucket, key, {name: values[0] for name, values in parse_qs(url.query, keep_blank_values=True).items()}
+
+    def _read_body(self):
+        data = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        self.server.network_delay(len(data))
+        return data
+
+    def _reply(self, status, body=b"", headers=None):
+        if body:
+            self.server.network_delay(len(body))
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body and self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _xml(self, status, root, fields):
+        inner = "".join(f"<{name}>{value}</{name}>" for name, value in fields.items())
+        body = f'<?xml version="1.0" encoding="UTF-8"?><{root} xmlns="{_S3_XMLNS}">{inner}</{root}>'.encode()
+        self._reply(status, body, {"Content-Type": "application/xml"})
+
+    def _object(self, bucket, key):
+        try:
+            return self.server.store._read(bucket, key, "GetObject")
+        except LocalS3Client.exceptions.NoSuchKey:
+            return None
+
+    def do_PUT(self):
+        bucket, key, query = self._target()
+        data = self._read_body()
+        if "partNumber" in query:
+            self.server.uploads[query["uploadId"]][int(query["partNumber"])] = data
+        else:
+            self.server.store._write(bucket, key, data)
+        self._reply(200, headers={"ETag": f'"{hashlib.md5(data).hexdigest()}"'})
+
+    def do_POST(self):
+        bucket, key, query = self._target()
+        body = self._read_body()
+        if "uploads" in query:
+            upload_id = uuid.uuid4().hex
+            self.server.uploads[upload_id] = {}
+            self._xml(200, "InitiateMultipartUploadResult", {"Bucket": bucket, "Key": key, "UploadId": upload_id})
+            return
+        parts = self.server.uploads.pop(query["uploadId"])
+        numbers = [int(n) for n in re.findall(rb"<PartNumber>(\d+)</PartNumber>", body)]
+        data = b"".join(parts[n] for n in numbers)
+        self.server.store._write(bucket, key, data)
+        etag = f'"{hashlib.md5(data).hexdigest()}"'
+        self._xml(200, "CompleteMultipartUploadResult", {"Bucket": bucket, "Key": key, "ETag": etag})
+
+    def do_GET(self):
+        bucket, key, _ = self._target()
+        data = self._object(bucket, key)
+        if data is None:
+            self._xml(404, "Error", {"Code": "NoSuchKey", "Message": key})
+            return
+        etag = f'"{hashlib.md5(data).hexdigest()}"'
+        match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        if match:
+            start = int(match.group(1))
+            end = int(match.group(2)) if match.group(2) else len(data) - 1
+            headers = {"ETag": etag, "Content-Range": f"bytes {start}-{end}/{len(data)}"}
+            self._reply(206, data[start:end + 1], headers)
+        else:
+            self._reply(200, data, {"ETag": etag})
+
+    def do_HEAD(self):
+        bucket, key, _ = self._target()
+        data = self._object(bucket, key)
+        if data is None:
+            self._reply(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("ETag", f'"{hashlib.md5(data).hexdigest()}"')
+        self.end_headers()
+
+    def do_DELETE(self):
+        bucket, key, _ = self._target()
+        self.server.store.delete_object(bucket, key)
+        self._reply(204)
+
+
+class LocalS3Server(ThreadingHTTPServer):
+    """
+    Endpoint HTTP compatível com o S3 (PUT, GET com Range, HEAD, DELETE e upload
+    multipart, em path style) sobre um LocalS3Client, para testar o cliente boto3
+    de verdade: pool de conexões, keep-alive, multipart e retries. Simula a rede
+    com `latency` (s por requisição), `bandwidth` (bytes/s por conexão) e
+    `connect_latency` (s por conexão nova).
+    """
+
+    daemon_threads = True
+
+    def __init__(self, root, latency=0.0, bandwidth=None, connect_latency=0.0, host="127.0.0.1", port=0):
+        super().__init__((host, port), _S3Handler)
+        self.store = LocalS3Client(root)
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.connect_latency = connect_latency
+        self.uploads = {}
+        self._thread = None
+
+    @property
+    def endpoint_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def network_delay(self, nbytes):
+        delay = self.latency + (nbytes / self.bandwidth if self.bandwidth else 0.0)
+        if delay:
+            time.sleep(delay)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="local-s3", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+
+def make_landmarks(n_frames, seed=0, fps=30.0):
+    """PoseSequence sintética: um esqueleto em pé com movimento suave e ruído."""
+    rng = np.random.default_rng(seed)
+    base = rng.uniform(0.3, 0.7, size=(33, 2))
+    base[:, 1] = np.sort(base[:, 1])
+    t = np.arange(n_frames, dtype=np.float32)[:, None, None] / fps
+    phase = rng.uniform(0, 2 * np.pi, size=(1, 33, 1))
+    xy = base[None] + 0.05 * np.sin(2 * np.pi * 0.5 * t + phase) + rng.normal(0, 0.003, size=(n_frames, 33, 2))
+    landmarks = np.empty((n_frames, 33, 4), dtype=np.float32)
+    landmarks[..., :2] = xy
+    landmarks[..., 2] = rng.normal(0, 0.05, size=(n_frames, 33))
+    landmarks[..., 3] = 0.9
+    return PoseSequence(landmarks, np.arange(n_frames, dtype=np.int32), fps)
+
+
+def make_video(path, width, height, seconds, fps=30, seed=0):
+    """Grava um MP4 sintético (figura de palitos se movendo sobre fundo com ruído)."""
+    rng = np.random.default_rng(seed)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    background = rng.integers(0, 60, size=(height, width, 3), dtype=np.uint8)
+    poses = make_landmarks(int(seconds * fps), seed, fps)
+    scale = np.array([width, height], dtype=np.float32)
+    for i in range(len(poses)):
+        frame = background.copy()
+        points = (poses.xy[i] * scale).astype(np.int32)
+        cv2.polylines(frame, [points[[11, 13, 15]], points[[12, 14, 16]], points[[23, 25, 27]],
+                              points[[24, 26, 28]], points[[11, 12, 24, 23, 11]]], False, (230, 230, 230), 6)
+        cv2.circle(frame, tuple(int(v) for v in points[0]), max(4, height // 30), (230, 230, 230), -1)
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+def video_frame_count(path):
+    cap = cv2.VideoCapture(path)
+    count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    cap.release()
+    return count, fps
+
+
+class SyntheticExtractor:
+    """
+    Mesma interface do ExtractionPool (submit/extract). Decodifica os frames
+    do vídeo normalmente e devolve landmarks sintéticos, para medir o restante
+    do pipeline sem depender de o MediaPipe detectar uma pessoa.
+    """
+
+    def submit(self, video_path, frame_mode="full", **options):
+        future = Future()
+        future.set_result(self.extract(video_path, frame_mode, **options))
+        return future
+
+    def extract(self, video_path, frame_mode="full", **options):
+        count, fps = video_frame_count(video_path)
+        count = min(count, options.get("max_frames") or count)
+        seed = int(hashlib.md5(video_path.encode()).hexdigest()[:8], 16)
+        poses = make_landmarks(count, seed, fps)
+        return read_frames(video_path, poses.frame_indices, frame_mode), poses
+
+
+def stub_feedback(joint_errors):
+    return "Feedback de benchmark: " + ", ".join(f"{joint} {error:.1f}°" for joint, error in joint_errors.items())
@@ -0,0 +1,117 @@
+"""
+Benchmark de transferências com o R2 contra um endpoint S3 local (LocalS3Server).
+
+Sobe e baixa artefatos de vários tamanhos com N jobs em paralelo no mesmo
+processo, comparando o cliente padrão do boto3 (pool de 10 conexões,
+TransferConfig padrão) com o cliente de utils.r2_utils (pool maior, keep-alive,
+retries e TRANSFER_CONFIG). A rede é simulada no servidor: latência por
+requisição, banda por conexão e custo de conexão nova.
+
+Uso:
+    python -m benchmarks.transfer_bench [--sizes-mb 4 32 128] [--jobs 1 4 8] [--out transfer.json]
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.client import Config
+
+from benchmarks.standins import LocalS3Server
+from utils.metrics import TRANSFERS
+from utils.r2_utils import TRANSFER_CONFIG, download_to_path, get_r2_client, upload_file
+
+BUCKET = "bench"
+
+
+def _default_client(endpoint_url):
+    # Como o get_r2_client antigo; checksums só quando exigidos, para o stand-in aceitar o corpo
+    return boto3.client(
+        "s3", aws_access_key_id="local", aws_secret_access_key="local", endpoint_url=endpoint_url,
+        region_name="auto",
+        config=Config(signature_version="s3v4", request_checksum_calculation="when_required",
+                      response_checksum_validation="when_required"),
+    )
+
+
+PROFILES = {
+    "default": (_default_client, TransferConfig()),
+    "tuned": (lambda url: get_r2_client("local", "local", url), TRANSFER_CONFIG),
+}
+
+
+def _run(client, transfer_config, workdir, path, size_mb, jobs):
+    """Sobe e baixa `jobs` cópias do arquivo em paralelo; retorna (segundos do upload, segundos do download)."""
+    keys = [f"{size_mb}mb/job{i}.bin" for i in range(jobs)]
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        start = time.perf_counter()
+        list(pool.map(lambda key: upload_file(client, path, BUCKET, key, config=transfer_config), keys))
+        upload = time.perf_counter() - start
+
+        start = time.perf_counter()
+        list(pool.map(lambda key: download_to_path(client, BUCKET, key, os.path.join(workdir, key.replace("/", "_"))), keys))
+        download = time.perf_counter() - start
+    return upload, download
+
+
+def run_benchmarks(workdir, sizes_mb, jobs_list, latency, bandwidth, connect_latency):
+    report = {}
+    with LocalS3Server(os.path.join(workdir, "s3"), latency, bandwidth, connect_latency) as server:
+        for size_mb in sizes_mb:
+            path = os.path.join(workdir, f"artifact_{size_mb}mb.bin")
+            with open(path, "wb") as f:
+                f.write(os.urandom(size_mb * 1024 * 1024))
+            for profile, (make_client, transfer_config) in PROFILES.items():
+                client = make_client(server.endpoint_url)
+                for jobs in jobs_list:
+                    upload, download = _run(client, transfer_config, workdir, path, size_mb, jobs)
+                    total_mb = size_mb * jobs
+                    report[f"{profile}/{size_mb}mb/x{jobs}"] = {
+                        "upload_seconds": round(upload, 3),
+                        "download_seconds": round(download, 3),
+                        "upload_mb_per_second": round(total_mb / upload, 1),
+                        "download_mb_per_second": round(total_mb / download, 1),
+                    }
+    report["transfers"] = TRANSFERS.to_dict()
+    return report
+
+
+def _print_table(report):
+    print(f"{'cenário':<22} {'upload(s)':>10} {'MB/s':>8} {'download(s)':>12} {'MB/s':>8}")
+    for name, e in report.items():
+        if name == "transfers":
+            continue
+        print(
+            f"{name:<22} {e['upload_seconds']:>10.3f} {e['upload_mb_per_second']:>8.1f} "
+            f"{e['download_seconds']:>12.3f} {e['download_mb_per_second']:>8.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de upload/download com o R2 (stand-in local).")
+    parser.add_argument("--sizes-mb", type=int, nargs="+", default=[4, 32, 128])
+    parser.add_argument("--jobs", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Latência por requisição")
+    parser.add_argument("--bandwidth-mbps", type=float, default=200.0, help="Banda por conexão (Mbit/s)")
+    parser.add_argument("--connect-ms", type=float, default=60.0, help="Custo de cada conexão nova (TCP + TLS)")
+    parser.add_argument("--out", help="Grava o relatório em JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="transfer_bench_") as workdir:
+        report = run_benchmarks(
+            workdir, args.sizes_mb, args.jobs,
+            latency=args.latency_ms / 1000, bandwidth=args.bandwidth_mbps * 1e6 / 8,
+            connect_latency=args.connect_ms / 1000,
+        )
+    _print_table(report)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import logging
+
+from services.frame_source import PANEL_SIZE, probe_video
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LANE = "default"
+LARGE_LANE = "large"
+
+# Limites de entrada: acima disso o vídeo é recusado em qualquer lane
+MAX_VIDEO_SIDE = 4096
+MIN_VIDEO_SIDE = 64
+
+# Calibração grosseira (benchmarks/pipeline_bench.py): custos por frame do extrator e do renderizador
+INFERENCE_SECONDS_PER_FRAME = 0.03
+DECODE_SECONDS_PER_MEGAPIXEL = 0.004
+RENDER_SECONDS_PER_FRAME = 0.003
+# Memória fixa de um job (grafo, encoder, PDF) e frames em voo no decoder por vídeo
+BASE_JOB_BYTES = 150 * 1024 * 1024
+DECODE_BUFFER_FRAMES = 8
+# Tamanho estimado do MP4 comparativo por frame renderizado (2 painéis, libx264 CRF 23)
+OUTPUT_BYTES_PER_FRAME = 24 * 1024
+
+
+class VideoRejected(ValueError):
+    """Vídeo inválido ou fora dos limites: o job falha sem retry, antes das etapas pesadas."""
+
+
+class JobDeferred(Exception):
+    """Job grande demais para esta lane: volta para a fila marcado para outra lane."""
+
+    def __init__(self, lane, estimate):
+        super().__init__(f"Job adiado para a lane '{lane}'")
+        self.lane = lane
+        self.estimate = estimate
+
+
+def validate_probe(name, probe):
+    if not probe["readable"]:
+        raise VideoRejected(f"Vídeo de {name} ilegível ou corrompido")
+    width, height = probe["width"], probe["height"]
+    if min(width, height) < MIN_VIDEO_SIDE or max(width, height) > MAX_VIDEO_SIDE:
+        raise VideoRejected(f"Resolução do vídeo de {name} fora dos limites: {width}x{height}")
+    if probe["fps"] <= 0:
+        raise VideoRejected(f"Vídeo de {name} sem taxa de quadros válida")
+
+
+def estimate_job_cost(probes, options, frame_mode, tmpfs_input_bytes=0, output_in_tmpfs=False):
+    """
+    Estima pico de memória (bytes) e custo de CPU (segundos) de um job a partir dos
+    metadados dos vídeos, das opções do extrator e do modo de frames escolhido.
+    Arquivos no tmpfs ocupam RAM: tmpfs_input_bytes (vídeos de entrada já baixados
+    para lá) e, com output_in_tmpfs, o MP4 comparativo estimado entram na memória.
+    Retorna dict com memory_bytes, cpu_seconds, frames, output_bytes e frame_mode.
+    """
+    max_frames = options["max_frames"]
+
+    memory = BASE_JOB_BYTES
+    cpu = 0.0
+    total_frames = 0
+    max_inferred = 0
+    for probe in probes:
+        frames = min(probe["frame_count"] or max_frames, max_frames)
+        if options.get("max_seconds"):
+            frames = min(frames, int(options["max_seconds"] * probe["fps"]))
+        # Mesma regra de passo do extrator (target_fps tem precedência sobre frame_stride)
+        if options.get("target_fps"):
+            stride = max(1, int(round(probe["fps"] / options["target_fps"])))
+        else:
+            stride = max(1, int(options.get("frame_stride") or 1))
+        inferred = -(-frames // stride)
+        frame_bytes = probe["width"] * probe["height"] * 3
+        kept_bytes = {"full": frame_bytes, "small": PANEL_SIZE[0] * PANEL_SIZE[1] * 3}.get(frame_mode, 0)
+
+        memory += inferred * kept_bytes + DECODE_BUFFER_FRAMES * frame_bytes
+        megapixels = probe["width"] * probe["height"] / 1e6
+        cpu += frames * megapixels * DECODE_SECONDS_PER_MEGAPIXEL + inferred * INFERENCE_SECONDS_PER_FRAME
+        total_frames += inferred
+        max_inferred = max(max_inferred, inferred)
+
+    cpu += total_frames // 2 * RENDER_SECONDS_PER_FRAME
+    # O vídeo comparativo tem um frame por par, até o maior dos dois vídeos
+    output_bytes = max_inferred * OUTPUT_BYTES_PER_FRAME
+    memory += tmpfs_input_bytes + (output_bytes if output_in_tmpfs else 0)
+    return {
+        "memory_bytes": int(memory), "cpu_seconds": round(cpu, 2), "frames": total_frames,
+        "output_bytes": output_bytes, "frame_mode": frame_mode,
+    }
+
+
+class AdmissionController:
+    """
+    Decide se um job roda neste worker a partir dos metadados dos vídeos:
+    recusa vídeos inválidos, adia jobs acima dos limites da lane padrão para a
+    lane "large" e reserva a memória estimada no orçamento do host (MemoryBudget),
+    o que faz jobs grandes esperarem em vez de derrubar a instância.
+    """
+
+    def __init__(self, budget=None, lane=DEFAULT_LANE, large_memory_bytes=None, large_cpu_seconds=None,
+                 wait_timeout=None):
+        self.budget = budget
+        self.lane = lane
+        self.large_memory_bytes = large_memory_bytes
+        self.large_cpu_seconds = large_cpu_seconds
+        self.wait_timeout = wait_timeout
+
+    def is_large(self, estimate):
+        return bool(
+            (self.large_memory_bytes and estimate["memory_bytes"] > self.large_memory_bytes)
+            or (self.large_cpu_seconds and estimate["cpu_seconds"] > self.large_cpu_seconds)
+        )
+
+    def admit(self, estimate):
+        """
+        Admite o job (reservando memória) ou lança JobDeferred. Retorna a função
+        que devolve a reserva, a ser chamada no fim do job.
+        """
+        if self.lane == DEFAULT_LANE and self.is_large(estimate):
+            raise JobDeferred(LARGE_LANE, estimate)
+        if self.budget is None:
+            return lambda: None
+
+        nbytes = estimate["memory_bytes"]
+        started_waiting = self.budget.used_bytes + nbytes > self.budget.total_bytes
+        if started_waiting:
+            logger.info(f"Aguardando memória: job precisa de ~{nbytes / 2**20:.0f} MB", extra={"estimate": estimate})
+        if not self.budget.acquire(nbytes, self.wait_timeout):
+            raise TimeoutError("Tempo esgotado aguardando orçamento de memória")
+        return lambda: self.budget.release(nbytes)
+
+
+def probe_inputs(paths):
+    """Probe e validação dos vídeos {nome: caminho}; lança VideoRejected se algum for inválido."""
+    probes = {}
+    for name, path in paths.items():
+        probes[name] = probe_video(path)
+        validate_probe(name, probes[name])
+    return probes
@@ -0,0 +1,114 @@
+import io
+import logging
+
+import numpy as np
+
+from services.pose_sequence import PoseSequence
+
+logger = logging.getLogger(__name__)
+
+# Etapas cujo resultado é um valor simples (chave no R2 ou texto), guardado direto no documento
+VALUE_STAGES = ("feedback", "video", "pdf")
+SERIES_ARRAYS = ("angles_ref", "angles_exec", "errors", "pairs")
+
+
+class JobCheckpoints:
+    """
+    Checkpoints das etapas de um job, para retomar tentativas em vez de recomeçar.
+    Resumos e valores simples ficam em `checkpoint.<etapa>` no documento da fila;
+    arrays (landmarks e séries de ângulos) vão para o R2 em `checkpoints/<job_id>/`.
+    Falhas ao gravar um checkpoint só geram aviso: o job segue sem ele.
+    """
+
+    def __init__(self, queue, job_filter, s3_client, bucket_name, task, prefix="checkpoints/"):
+        self.queue = queue
+        self.job_filter = job_filter
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.prefix = f"{prefix}{task['_id']}/"
+        self.saved = dict(task.get("checkpoint") or {})
+
+    def _put(self, name, data):
+        key = f"{self.prefix}{name}"
+        self.s3_client.put_object(Bucket=self.bucket_name, Key=key, Body=data)
+        return key
+
+    def _get(self, key):
+        return self.s3_client.get_object(Bucket=self.bucket_name, Key=key)["Body"].read()
+
+    def _serialize(self, stage, result):
+        if stage == "extract":
+            return {
+                "ref": self._put("landmarks_ref.npz", result["landmarks_ref"].to_bytes()),
+                "exec": self._put("landmarks_exec.npz", result["landmarks_exec"].to_bytes()),
+            }
+        if stage == "analyze":
+            series = result["series"]
+            buffer = io.BytesIO()
+            np.savez(buffer, **{name: series[name] for name in SERIES_ARRAYS})
+            return {
+                "series": self._put("series.npz", buffer.getvalue()),
+                "joints": list(series["joints"]),
+                "alignment_cost": series["alignment_cost"],
+                "insights": result["insights"],
+                "avg_error": float(result["avg_error"]),
+                "avg_errors": result["avg_errors"],
+            }
+        if stage in VALUE_STAGES:
+            return result
+        return None
+
+    def save(self, stage, result):
+        """Grava o checkpoint de uma etapa concluída (chamado pelo StageGraph via on_complete)."""
+        try:
+            value = self._serialize(stage, result)
+            if value is None:
+                return
+            self.queue.update_one(self.job_filter, {"$set": {f"checkpoint.{stage}": value}})
+            self.saved[stage] = value
+        except Exception as e:
+            logger.warning(f"Falha ao gravar checkpoint da etapa {stage}: {e}")
+
+    def restore(self):
+        """Resultados das etapas já concluídas em tentativas anteriores, para pré-carregar o grafo."""
+        results = {stage: self.saved[stage] for stage in VALUE_STAGES if stage in self.saved}
+        analysis = self.saved.get("analyze")
+        if analysis:
+            try:
+                with np.load(io.BytesIO(self._get(analysis["series"]))) as data:
+                    series = {name: data[name] for name in SERIES_ARRAYS}
+                series.update(joints=analysis["joints"], alignment_cost=analysis["alignment_cost"])
+                results["analyze"] = {
+                    "series": series,
+                    "insights": analysis["insights"],
+                    "avg_error": analysis["avg_error"],
+                    "avg_errors": analysis["avg_errors"],
+                }
+            except Exception as e:
+                logger.warning(f"Checkpoint da análise indisponível ({e}); a etapa será refeita.")
+        if results:
+            logger.info(f"Retomando job a partir dos checkpoints: {sorted(results)}")
+        return results
+
+    def landmarks(self):
+        """(landmarks_ref, landmarks_exec) da extração anterior, ou None se não houver checkpoint."""
+        extracted = self.saved.get("extract")
+        if not extracted:
+            return None
+        try:
+            return PoseSequence.from_bytes(self._get(extracted["ref"])), PoseSequence.from_bytes(self._get(extracted["exec"]))
+        except Exception as e:
+            logger.warning(f"Checkpoint de landmarks indisponível ({e}); a extração será refeita.")
+            return None
+
+    def clear(self):
+        """Remove os arrays do R2 (chamado quando o job termina: sucesso ou erro definitivo)."""
+        keys = list((self.saved.get("extract") or {}).values())
+        if self.saved.get("analyze"):
+            keys.append(self.saved["analyze"]["series"])
+        for key in keys:
+            try:
+                self.s3_client.delete_object(Bucket=self.bucket_name, Key=key)
+            except Exception as e:
+                logger.warning(f"Falha ao remover checkpoint {key}: {e}")
+        self.saved.clear()
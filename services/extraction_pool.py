@@ -0,0 +1,84 @@
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from services.pose_extractor import create_pose, extract_landmarks_from_video
+from utils.logging_utils import configure_logging
+from utils.metrics import pid_cpu_seconds
+
+logger = logging.getLogger(__name__)
+
+# Modelos Pose já inicializados neste processo (um por model_complexity)
+_poses = {}
+
+
+def _get_pose(model_complexity):
+    pose = _poses.get(model_complexity)
+    if pose is None:
+        pose = _poses[model_complexity] = create_pose(model_complexity)
+    return pose
+
+
+def _warm_up(model_complexities):
+    """Initializer dos processos do pool: carrega os grafos do MediaPipe uma única vez."""
+    configure_logging()
+    for model_complexity in model_complexities:
+        _get_pose(model_complexity)
+
+
+def _extract(video_path, frame_mode, options):
+    pose = _get_pose(options.get("model_complexity", 1))
+    return extract_landmarks_from_video(video_path, frame_mode=frame_mode, pose=pose, **options)
+
+
+def _ping():
+    return True
+
+
+class ExtractionPool:
+    """
+    Pool de processos de longa duração, cada um com um Pose do MediaPipe já
+    inicializado e reaproveitado entre jobs. Permite extrair os vídeos de
+    referência e execução ao mesmo tempo em hosts com vários núcleos.
+    Os frames voltam do processo filho via pickle: prefira frame_mode "small"
+    ou "none" para manter a transferência pequena.
+    """
+
+    def __init__(self, workers=2, model_complexities=(1,)):
+        self.workers = workers
+        self.model_complexities = tuple(model_complexities)
+        self._executor = None
+        self._start()
+
+    def _start(self):
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_warm_up,
+            initargs=(self.model_complexities,),
+        )
+        # Com spawn, o primeiro submit sobe todos os processos; os modelos carregam em segundo plano
+        self._executor.submit(_ping)
+
+    def submit(self, video_path, frame_mode="full", **options):
+        """Agenda a extração de um vídeo; retorna um Future de (frames, PoseSequence)."""
+        try:
+            return self._executor.submit(_extract, video_path, frame_mode, options)
+        except BrokenProcessPool:
+            logger.warning("Pool de extração quebrado; recriando processos.")
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._start()
+            return self._executor.submit(_extract, video_path, frame_mode, options)
+
+    def extract(self, video_path, frame_mode="full", **options):
+        """Mesma assinatura de extract_landmarks_from_video, executando num processo do pool."""
+        return self.submit(video_path, frame_mode, **options).result()
+
+    def cpu_seconds(self):
+        """CPU acumulada dos processos vivos do pool (para JobMetrics: cai quando um processo é recriado)."""
+        processes = getattr(self._executor, "_processes", None) or {}
+        return sum(pid_cpu_seconds(pid) for pid in list(processes))
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,200 @@
+import subprocess
+
+import cv2
+import numpy as np
+
+# Tamanho de cada painel do vídeo comparativo (largura, altura)
+PANEL_SIZE = (480, 270)
+
+FRAME_MODES = ("full", "small", "none")
+
+
+def resize_to_panel(frame, size=PANEL_SIZE):
+    if (frame.shape[1], frame.shape[0]) == size:
+        return frame
+    return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+
+class VideoFrameReader:
+    """
+    Frames de um vídeo relidos sob demanda, numa segunda passada em streaming.
+    Indexável como uma lista de frames na ordem de `frame_indices`; o acesso
+    sequencial (não decrescente) decodifica o vídeo uma única vez e só mantém
+    o frame atual em memória.
+    """
+
+    def __init__(self, video_path, frame_indices, size=PANEL_SIZE):
+        self.video_path = video_path
+        self.frame_indices = [int(i) for i in frame_indices]
+        self.size = size
+        self._cap = None
+        self._next_source_index = 0
+        self._position = -1
+        self._frame = None
+
+    def __len__(self):
+        return len(self.frame_indices)
+
+    def _open(self):
+        self.release()
+        self._cap = cv2.VideoCapture(self.video_path)
+        self._next_source_index = 0
+        self._position = -1
+        self._frame = None
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        if i == self._position:
+            return self._frame
+        if self._cap is None or i < self._position:
+            self._open()
+
+        target = self.frame_indices[i]
+        while self._next_source_index < target:
+            if not self._cap.grab():
+                raise IndexError(f"Frame {target} não encontrado em {self.video_path}")
+            self._next_source_index += 1
+
+        ret, frame = self._cap.read()
+        if not ret:
+            raise IndexError(f"Frame {target} não encontrado em {self.video_path}")
+        self._next_source_index += 1
+        self._position = i
+        self._frame = resize_to_panel(frame, self.size) if self.size else frame
+        return self._frame
+
+    def release(self):
+        if self._cap is not None:
+            self._cap.release()
+            self._cap = None
+
+    def __del__(self):
+        self.release()
+
+
+def inference_size(width, height, max_side=None):
+    """Tamanho (largura, altura) em que o frame vai para a inferência, mantendo a proporção."""
+    if max_side and max(width, height) > max_side:
+        scale = max_side / max(width, height)
+        return int(round(width * scale)), int(round(height * scale))
+    return width, height
+
+
+class FFmpegFrameSource:
+    """
+    Frames prontos para a inferência vindos de um ffmpeg em subprocesso: o
+    decoder já aplica o passo entre frames (select), a redução (scale) e a
+    conversão para rgb24, e cada frame é lido com readinto num único buffer
+    reutilizado. Iterável em (índice do frame no vídeo, frame RGB); o frame é
+    sobrescrito na iteração seguinte, então quem precisar guardá-lo copia.
+    """
+
+    def __init__(self, ffmpeg, video_path, width, height, stride=1, limit=None, max_side=None):
+        self.ffmpeg = ffmpeg
+        self.video_path = video_path
+        self.stride = max(1, int(stride))
+        self.limit = limit
+        self.size = inference_size(width, height, max_side)
+        self._buffer = np.empty((self.size[1], self.size[0], 3), dtype=np.uint8)
+        self._proc = None
+
+    def _command(self):
+        filters = []
+        if self.stride > 1:
+            filters.append(f"select='not(mod(n\\,{self.stride}))'")
+        filters.append(f"scale={self.size[0]}:{self.size[1]}:flags=area")
+        command = [self.ffmpeg, "-v", "error", "-nostdin", "-i", self.video_path, "-an", "-sn",
+                   "-vf", ",".join(filters), "-vsync", "0"]
+        if self.limit is not None:
+            command += ["-frames:v", str(-(-self.limit // self.stride))]
+        return command + ["-f", "rawvideo", "-pix_fmt", "rgb24", "pipe:1"]
+
+    def _read_frame(self):
+        view = memoryview(self._buffer).cast("B")
+        filled = 0
+        while filled < len(view):
+            n = self._proc.stdout.readinto(view[filled:])
+            if not n:
+                return None  # fim do stream (um frame incompleto é descartado)
+            filled += n
+        return self._buffer
+
+    def __iter__(self):
+        self._proc = subprocess.Popen(self._command(), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                      bufsize=self._buffer.nbytes)
+        try:
+            index = 0
+            while True:
+                frame = self._read_frame()
+                if frame is None:
+                    return
+                yield index, frame
+                index += self.stride
+        finally:
+            self.close()
+
+    def close(self):
+        if self._proc is not None:
+            self._proc.stdout.close()
+            if self._proc.poll() is None:
+                self._proc.kill()
+            self._proc.wait()
+            self._proc = None
+
+
+def _fourcc_name(value):
+    code = int(value)
+    name = "".join(chr((code >> 8 * i) & 0xFF) for i in range(4))
+    return name.strip("\x00 ") if name.isprintable() else ""
+
+
+def probe_video(video_path):
+    """
+    Metadados do vídeo lidos do container, sem decodificar o stream inteiro:
+    width, height, fps, frame_count, codec (FourCC) e readable (se o primeiro
+    frame decodifica).
+    """
+    cap = cv2.VideoCapture(video_path)
+    try:
+        info = {
+            "width": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            "height": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            "fps": float(cap.get(cv2.CAP_PROP_FPS) or 0.0),
+            "frame_count": max(int(cap.get(cv2.CAP_PROP_FRAME_COUNT)), 0),
+            "codec": _fourcc_name(cap.get(cv2.CAP_PROP_FOURCC)),
+            "readable": cap.isOpened() and cap.grab(),
+        }
+    finally:
+        cap.release()
+    return info
+
+
+def probe_frame_budget(video_path, max_frames, probe=None):
+    """Retorna (frames que serão lidos, largura, altura) a partir das propriedades do container."""
+    probe = probe or probe_video(video_path)
+    count = probe["frame_count"] or max_frames
+    return min(count, max_frames), probe["width"], probe["height"]
+
+
+def choose_frame_mode(video_paths, budget_bytes, max_frames=300, probes=None):
+    """
+    Escolhe como o extrator guarda os frames para caber no orçamento de memória do job:
+    - "full": cópias na resolução original;
+    - "small": cópias já reduzidas para PANEL_SIZE;
+    - "none": nenhuma cópia, o renderizador relê o vídeo (VideoFrameReader).
+    """
+    full_bytes = 0
+    small_bytes = 0
+    for i, path in enumerate(video_paths):
+        frames, width, height = probe_frame_budget(path, max_frames, probes[i] if probes else None)
+        full_bytes += frames * width * height * 3
+        small_bytes += frames * PANEL_SIZE[0] * PANEL_SIZE[1] * 3
+
+    if full_bytes <= budget_bytes:
+        return "full"
+    if small_bytes <= budget_bytes:
+        return "small"
+    return "none"
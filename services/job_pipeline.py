@@ -0,0 +1,777 @@
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, closing
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+
+import numpy as np
+
+from services.admission import JobDeferred, estimate_job_cost, probe_inputs
+from services.checkpoints import JobCheckpoints
+from services.frame_source import FRAME_MODES, choose_frame_mode
+from services.landmark_cache import extract_landmarks_cached, landmark_cache_key
+from services.pose_analyzer import RunningJointStats, analyze_pose_series, summarize_errors
+from services.pose_extractor import (
+    DECODERS, DEFAULT_EXTRACTION_OPTIONS, extract_landmarks_from_video, iter_pose_frames, read_frames,
+)
+from services.pose_sequence import PoseSequence
+from services.reference_templates import render_reference_strip
+from services.video_generator import (
+    ComparativeVideoWriter, save_and_upload_comparative_video, upload_comparative_video,
+)
+from utils.artifacts import JobArtifacts, tmpfs_dir_for, tmpfs_resident_bytes
+from utils.helpers import generate_and_upload_pdf
+from utils.metrics import JobMetrics
+from utils.r2_utils import download_many, download_to_path, head_many
+from utils.stage_graph import Stage, StageFailed, StageGraph
+
+logger = logging.getLogger(__name__)
+
+# "batch": extrai tudo, depois analisa e renderiza; "streaming": as três etapas sobrepostas, frame a frame
+PIPELINES = ("batch", "streaming")
+# Frames por vídeo em trânsito entre a extração e a renderização no modo streaming
+STREAM_WINDOW = 8
+
+
+def extract_key_from_url(url):
+    if not url:
+        logger.error("URL fornecida é None ou vazia!")
+        return None
+    try:
+        parsed = urlparse(url)
+        return os.path.basename(parsed.path) if parsed.path else None
+    except Exception as e:
+        logger.error(f"Falha ao extrair chave da URL: {e}")
+        return None
+
+
+class SharedReference:
+    """
+    Vídeo de referência compartilhado pelos jobs de um lote (mesmo ref_path):
+    baixado e extraído uma vez, reaproveitado pelos jobs seguintes e removido
+    só em close(), ao fim do lote. Os landmarks extraídos ficam por opções do
+    extrator (jobs do lote podem ter decoder ou max_frames próprios) e modo de frames.
+    """
+
+    def __init__(self):
+        self.artifacts = JobArtifacts()
+        self.head = None
+        self.path = None
+        self.extracted = {}  # (chave das opções, frame_mode) -> (frames, PoseSequence)
+        self.lock = threading.Lock()
+
+    def matches(self, head):
+        return self.head is not None and self.head["key"] == head["key"] and self.head["etag"] == head["etag"]
+
+    @staticmethod
+    def options_key(head, options):
+        # Mesma chave do cache de landmarks: objeto + ETag + opções do extrator
+        return landmark_cache_key(head["key"], head["etag"], **options)
+
+    def get(self, head, options, frame_mode=None):
+        """(frames, landmarks) extraídos com as mesmas opções; sem frame_mode, de qualquer modo."""
+        key = self.options_key(head, options)
+        for (options_key, mode), value in self.extracted.items():
+            if options_key == key and frame_mode in (None, mode):
+                return value
+        return None
+
+    def put(self, head, options, frame_mode, frames, landmarks):
+        self.extracted[(self.options_key(head, options), frame_mode)] = (frames, landmarks)
+
+    def close(self):
+        self.artifacts.close()
+        self.extracted.clear()
+        self.head = self.path = None
+
+
+class JobContext:
+    """
+    Tudo o que as etapas de um job precisam: o documento da fila, os clientes
+    externos (injetáveis, para rodar com stand-ins locais) e as configurações.
+    """
+
+    def __init__(self, task, s3_client, bucket_name, feedback_fn, landmark_cache=None, extraction_pool=None,
+                 extraction_options=None, frame_mode=None, frame_memory_bytes=512 * 1024 * 1024,
+                 alignment="none", encoder_options=None, shared_reference=None, admission=None,
+                 pipeline="batch", references=None):
+        self.task = task
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.feedback_fn = feedback_fn
+        self.landmark_cache = landmark_cache
+        self.extraction_pool = extraction_pool
+        self.extraction_options = extraction_options or dict(DEFAULT_EXTRACTION_OPTIONS)
+        if task.get("decoder") in DECODERS:
+            # Decoder escolhido por job (ex.: "ffmpeg" para vídeos de celular em alta resolução)
+            self.extraction_options = {**self.extraction_options, "decoder": task["decoder"]}
+        self.frame_mode = frame_mode
+        self.frame_memory_bytes = frame_memory_bytes
+        self.alignment = alignment
+        self.encoder_options = encoder_options
+        self.shared_reference = shared_reference
+        self.admission = admission
+        self.references = references  # ReferenceStore (coleção `references`), opcional
+        # Pipeline por job (campo "pipeline" do documento) ou o padrão do worker
+        self.pipeline = task.get("pipeline") if task.get("pipeline") in PIPELINES else pipeline
+        self.checkpoints = None
+        self.student = task.get("student", "Desconhecido")
+        # Chaves de destino são determinísticas, então o PDF não precisa esperar o upload do vídeo
+        self.video_key = f"comparativos/{self.student}_comparativo.mp4"
+        self.pdf_key = f"relatorios/{self.student}_relatorio.pdf"
+        self.artifacts = JobArtifacts()
+        # CPU dos processos do pool entra nas métricas do job junto com a do próprio processo
+        pool_cpu = getattr(extraction_pool, "cpu_seconds", None)
+        self.metrics = JobMetrics(cpu_sources=[pool_cpu] if pool_cpu else ())
+
+    def temp_path(self, suffix, size_hint=None):
+        """Arquivo temporário do job (tmpfs quando cabe), removido em cleanup()."""
+        return self.artifacts.path(suffix, size_hint)
+
+    def cleanup(self):
+        """Remove os artefatos temporários do job (chamado também em caso de erro)."""
+        self.artifacts.close()
+
+
+# --- Etapas ---
+def download_stage(ctx, results):
+    ref_key = extract_key_from_url(ctx.task.get('ref_path'))
+    exec_key = extract_key_from_url(ctx.task.get('exec_path'))
+
+    if not ref_key or not exec_key:
+        raise ValueError("Chaves de vídeo inválidas")
+
+    # HEAD verifica existência e dá o tamanho, que decide entre tmpfs e disco
+    logger.info("Baixando vídeos temporários...")
+    ref_head, exec_head = head_many(ctx.s3_client, ctx.bucket_name, [ref_key, exec_key])
+    exec_path = ctx.temp_path(".mp4", exec_head["size"])
+
+    template_doc = ctx.references.find(ref_key, ref_head["etag"], ctx.extraction_options) if ctx.references else None
+    if template_doc is not None:
+        # Referência pré-computada (job "reference"): baixa só a faixa de painéis, não o vídeo
+        strip_path = ctx.temp_path(".mp4")
+        strip_obj, exec_obj = download_many(
+            ctx.s3_client, ctx.bucket_name, [(template_doc["strip_key"], strip_path), (exec_key, exec_path, exec_head)]
+        )
+        template = ctx.references.load(template_doc, strip_path)
+        ctx.metrics.add("bytes_downloaded", strip_obj["size"] + exec_obj["size"])
+        logger.info(f"Referência {ref_key} pré-computada ({len(template.landmarks)} frames)")
+        logger.info(f"Tamanho do arquivo de execução: {exec_obj['size']} bytes")
+        return {"ref_path": None, "exec_path": exec_path, "ref": ref_head, "exec": exec_obj, "template": template}
+
+    shared = ctx.shared_reference
+
+    if shared is None:
+        ref_path = ctx.temp_path(".mp4", ref_head["size"])
+        # Baixa os dois vídeos em paralelo, com o corpo indo direto para o arquivo
+        ref_obj, exec_obj = download_many(
+            ctx.s3_client, ctx.bucket_name, [(ref_key, ref_path, ref_head), (exec_key, exec_path, exec_head)]
+        )
+        ctx.metrics.add("bytes_downloaded", ref_obj["size"] + exec_obj["size"])
+    else:
+        # Em lote, a referência é baixada pelo primeiro job e reaproveitada (mesma chave e ETag);
+        # a execução baixa em paralelo, como fora do lote
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            exec_future = pool.submit(download_to_path, ctx.s3_client, ctx.bucket_name, exec_key, exec_path, exec_head)
+            with shared.lock:
+                if not shared.matches(ref_head):
+                    shared.close()
+                    shared.path = shared.artifacts.path(".mp4", ref_head["size"])
+                    shared.head = download_to_path(ctx.s3_client, ctx.bucket_name, ref_key, shared.path, ref_head)
+                    ctx.metrics.add("bytes_downloaded", ref_head["size"])
+                else:
+                    logger.info(f"Referência {ref_key} reaproveitada do lote")
+                ref_path, ref_obj = shared.path, shared.head
+            exec_obj = exec_future.result()
+        ctx.metrics.add("bytes_downloaded", exec_obj["size"])
+
+    logger.info(f"Tamanho do arquivo de referência: {ref_obj['size']} bytes")
+    logger.info(f"Tamanho do arquivo de execução: {exec_obj['size']} bytes")
+    return {"ref_path": ref_path, "exec_path": exec_path, "ref": ref_obj, "exec": exec_obj}
+
+
+def admit_stage(ctx, results):
+    download = results["download"]
+    options = ctx.extraction_options
+
+    # Metadados do container: vídeo ilegível ou fora dos limites é recusado antes da inferência
+    template = download.get("template")
+    if template is not None:
+        # A referência foi validada no job "reference"; o probe vem do documento
+        probes = [template.probe, probe_inputs({"execução": download["exec_path"]})["execução"]]
+    else:
+        probes = probe_inputs({"referência": download["ref_path"], "execução": download["exec_path"]})
+        probes = [probes["referência"], probes["execução"]]
+
+    # Define como os frames ficam em memória conforme o orçamento do job
+    if job_graph(ctx) is STREAMING_JOB_GRAPH:
+        # Em streaming só uma janela de frames fica em memória: a estimativa é a do modo "none"
+        frame_mode = "none"
+    elif ctx.frame_mode in FRAME_MODES:
+        frame_mode = ctx.frame_mode
+    else:
+        frame_mode = choose_frame_mode(
+            [download["ref_path"], download["exec_path"]], ctx.frame_memory_bytes, options["max_frames"], probes
+        )
+    # Entradas e vídeo de saída no tmpfs (/dev/shm) contam como RAM
+    inputs = [download["ref_path"], download["exec_path"]]
+    if template is not None:
+        inputs.append(template.strip_path)
+    estimate = estimate_job_cost(
+        probes, options, frame_mode,
+        tmpfs_input_bytes=tmpfs_resident_bytes(inputs), output_in_tmpfs=tmpfs_dir_for() is not None,
+    )
+    logger.info(
+        f"Estimativa do job: ~{estimate['memory_bytes'] / 2**20:.0f} MB, ~{estimate['cpu_seconds']:.0f}s de CPU",
+        extra={"estimate": estimate},
+    )
+    if ctx.admission:
+        # Pode lançar JobDeferred (lane "large") ou esperar memória livre no host
+        ctx.artifacts.callback(ctx.admission.admit(estimate))
+    return {"probes": probes, "estimate": estimate, "frame_mode": frame_mode}
+
+
+def extract_stage(ctx, results):
+    download = results["download"]
+    options = ctx.extraction_options
+    frame_mode = results["admit"]["frame_mode"]
+    logger.info(f"Modo de frames: {frame_mode}")
+
+    restored = ctx.checkpoints.landmarks() if ctx.checkpoints else None
+    if restored:
+        # Landmarks de uma tentativa anterior: só decodifica os frames, sem inferência
+        landmarks_ref, landmarks_exec = restored
+        logger.info("Landmarks restaurados do checkpoint")
+        template = download.get("template")
+        return {
+            "frames_ref": (
+                template.panels() if template is not None
+                else read_frames(download["ref_path"], landmarks_ref.frame_indices, frame_mode)
+            ),
+            "landmarks_ref": landmarks_ref,
+            "frames_exec": read_frames(download["exec_path"], landmarks_exec.frame_indices, frame_mode),
+            "landmarks_exec": landmarks_exec,
+        }
+
+    # Processamento com MediaPipe
+    logger.info("Começando extração de frames...")
+    pool = ctx.extraction_pool
+    if pool:
+        # Execução roda em paralelo num processo do pool enquanto a referência é resolvida
+        exec_future = pool.submit(download["exec_path"], frame_mode=frame_mode, **options)
+
+    frames_ref, landmarks_ref = _extract_reference(ctx, download, frame_mode, pool)
+    logger.info("Frames de referência extraídos!")
+    if pool:
+        frames_exec, landmarks_exec = exec_future.result()
+    else:
+        frames_exec, landmarks_exec = extract_landmarks_from_video(
+            download["exec_path"], frame_mode=frame_mode, **options
+        )
+    logger.info("Frames de execução extraídos!")
+
+    if not frames_ref or not landmarks_ref:
+        logger.error(f"Falha ao extrair landmarks do vídeo de referência.")
+    if not frames_exec or not landmarks_exec:
+        logger.error(f"Falha ao extrair landmarks do vídeo de execução.")
+
+    if not frames_ref or not landmarks_ref or not frames_exec or not landmarks_exec:
+        raise ValueError("Falha na extração de landmarks")
+
+    ctx.metrics.add("frames_processed", len(landmarks_ref) + len(landmarks_exec))
+
+    return {
+        "frames_ref": frames_ref, "landmarks_ref": landmarks_ref,
+        "frames_exec": frames_exec, "landmarks_exec": landmarks_exec,
+    }
+
+
+def _extract_reference(ctx, download, frame_mode, pool):
+    template = download.get("template")
+    if template is not None:
+        logger.info("Landmarks e painéis de referência pré-computados")
+        return template.panels(), template.landmarks
+
+    shared = ctx.shared_reference
+    reused = shared.get(download["ref"], ctx.extraction_options, frame_mode) if shared is not None else None
+    if reused is not None:
+        frames_ref, landmarks_ref = reused
+        logger.info("Landmarks de referência reaproveitados do lote")
+        if frame_mode == "none":
+            # O leitor preguiçoso é consumido na renderização; cada job abre o seu
+            frames_ref = read_frames(download["ref_path"], landmarks_ref.frame_indices, frame_mode)
+        return frames_ref, landmarks_ref
+
+    # Vídeos de referência se repetem entre alunos: consulta o cache por chave + ETag
+    frames_ref, landmarks_ref = extract_landmarks_cached(
+        ctx.landmark_cache, download["ref_path"], download["ref"]["key"], download["ref"]["etag"],
+        frame_mode=frame_mode, extractor=pool.extract if pool else None, **ctx.extraction_options
+    )
+    if shared is not None and len(landmarks_ref):
+        shared.put(download["ref"], ctx.extraction_options, frame_mode, frames_ref, landmarks_ref)
+    return frames_ref, landmarks_ref
+
+
+def analyze_stage(ctx, results):
+    extracted = results["extract"]
+    template = results["download"].get("template")
+    logger.info("Analisando poses...")
+    series = analyze_pose_series(
+        extracted["landmarks_ref"], extracted["landmarks_exec"], align=(ctx.alignment == "dtw"),
+        angles_ref=template.angles if template is not None else None,
+    )
+    insights, avg_error, avg_errors = summarize_errors(series)
+    if series["alignment_cost"] is not None:
+        logger.info(f"Custo do alinhamento DTW: {series['alignment_cost']:.2f}°")
+    return {"series": series, "insights": insights, "avg_error": avg_error, "avg_errors": avg_errors}
+
+
+def feedback_stage(ctx, results):
+    # Sai assim que a análise termina, em paralelo com a renderização do vídeo
+    logger.info("Solicitando feedback inteligente...")
+    return ctx.feedback_fn(results["analyze"]["avg_errors"])
+
+
+def video_stage(ctx, results):
+    extracted = results["extract"]
+    series = results["analyze"]["series"]
+
+    logger.info("Gerando e enviando vídeo comparativo...")
+    video_url = save_and_upload_comparative_video(
+        extracted["frames_ref"], extracted["landmarks_ref"], extracted["frames_exec"], extracted["landmarks_exec"],
+        upload_path=ctx.video_key,
+        s3_client=ctx.s3_client,
+        bucket_name=ctx.bucket_name,
+        pairs=series["pairs"] if series["alignment_cost"] is not None else None,
+        encoder_options=ctx.encoder_options,
+        joint_errors=series["errors"],
+        output_path=ctx.temp_path(".mp4"),
+        on_uploaded=lambda size: ctx.metrics.add("bytes_uploaded", size),
+        # Painéis de uma referência pré-computada já vêm com o esqueleto
+        draw_reference=results["download"].get("template") is None,
+    )
+
+    if not video_url:
+        raise RuntimeError("Falha ao gerar ou enviar vídeo comparativo para o R2.")
+    return video_url
+
+
+def _prefetch(items, window, name):
+    """
+    Consome `items` numa thread, no máximo `window` itens à frente de quem itera
+    (memória limitada). Um erro da thread é relançado no consumidor; fechar o
+    gerador para a thread e fecha `items`.
+    """
+    buffer = queue.Queue(maxsize=window)
+    stop = threading.Event()
+    failure = []
+    end = object()
+
+    def produce():
+        try:
+            with closing(items) if hasattr(items, "close") else ExitStack():
+                for item in items:
+                    if stop.is_set():
+                        break
+                    buffer.put(item)
+        except Exception as e:
+            failure.append(e)
+        finally:
+            buffer.put(end)
+
+    thread = threading.Thread(target=produce, name=name, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is end:
+                break
+            yield item
+        if failure:
+            raise failure[0]
+    finally:
+        stop.set()
+        while thread.is_alive():
+            # Libera a thread que esteja bloqueada no put
+            try:
+                buffer.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+
+def _reference_items(ctx, download, cache_key):
+    """
+    (índice, painel, pose) da referência para o streaming. Com landmarks do lote ou
+    do cache, só decodifica os frames; senão roda a inferência (ver stream_stage).
+    Retorna (itens, True se houve inferência). Com referência pré-computada os
+    painéis já vêm anotados.
+    """
+    template = download.get("template")
+    if template is not None:
+        landmarks = template.landmarks
+        return zip(landmarks.frame_indices, template.panels(), landmarks.landmarks), False
+
+    shared = ctx.shared_reference
+    landmarks = None
+    reused = shared.get(download["ref"], ctx.extraction_options) if shared is not None else None
+    if reused is not None:
+        landmarks = reused[1]
+        logger.info("Landmarks de referência reaproveitados do lote")
+    elif ctx.landmark_cache and cache_key:
+        landmarks = ctx.landmark_cache.get(cache_key)
+        if landmarks is not None:
+            logger.info(f"Hit de landmarks para {download['ref']['key']}")
+
+    if landmarks is None:
+        return iter_pose_frames(download["ref_path"], **ctx.extraction_options), True
+    frames = read_frames(download["ref_path"], landmarks.frame_indices, "none")
+    return zip(landmarks.frame_indices, frames, landmarks.landmarks), False
+
+
+def stream_stage(ctx, results):
+    """
+    Extração, análise e renderização sobrepostas (pipeline "streaming"): as duas
+    extrações rodam em threads e cada par (referência, execução) que chega atualiza
+    as estatísticas por articulação e já vira um frame do vídeo, que sobe para o R2
+    no fim. Os frames são pareados pela posição (sem DTW) e só STREAM_WINDOW frames
+    por vídeo ficam em memória. Retorna o mesmo resultado de analyze_stage, mais
+    "video" (a chave enviada).
+    """
+    download = results["download"]
+    options = ctx.extraction_options
+    template = download.get("template")
+    etag = download["ref"]["etag"]
+    cache_key = landmark_cache_key(download["ref"]["key"], etag, **options) if etag else None
+    ref_source, inferred = _reference_items(ctx, download, cache_key)
+
+    stats = RunningJointStats()
+    ref_indices, ref_poses = [], []
+    n_exec = 0
+    last_ref = last_exec = errors = None
+    output_path = ctx.temp_path(".mp4")
+
+    logger.info("Começando extração, análise e renderização em streaming...")
+    with ExitStack() as stack:
+        ref_items = stack.enter_context(closing(_prefetch(ref_source, STREAM_WINDOW, "stream-ref")))
+        exec_items = stack.enter_context(closing(_prefetch(
+            iter_pose_frames(download["exec_path"], **options), STREAM_WINDOW, "stream-exec"
+        )))
+        writer = stack.enter_context(ComparativeVideoWriter(output_path, encoder_options=ctx.encoder_options))
+
+        while True:
+            item_ref = next(ref_items, None)
+            item_exec = next(exec_items, None)
+            if item_ref is None and item_exec is None:
+                break
+            if item_ref is not None:
+                last_ref = item_ref
+                ref_indices.append(item_ref[0])
+                ref_poses.append(item_ref[2])
+            if item_exec is not None:
+                last_exec = item_exec
+                n_exec += 1
+            if last_ref is None or last_exec is None:
+                continue
+            if item_ref is not None and item_exec is not None:
+                angle_ref = template.angles[len(ref_indices) - 1] if template is not None else None
+                errors = stats.update(last_ref[2], last_exec[2], angle_ref)
+            # Depois que o vídeo mais curto acaba, repete o seu último frame (como no modo batch)
+            pose_ref = last_ref[2] if template is None else None  # painel pré-computado já anotado
+            writer.write(last_ref[1], pose_ref, last_exec[1], last_exec[2], errors)
+
+    if not ref_indices:
+        logger.error("Falha ao extrair landmarks do vídeo de referência.")
+    if not n_exec:
+        logger.error("Falha ao extrair landmarks do vídeo de execução.")
+    if not stats.count:
+        raise ValueError("Falha na extração de landmarks")
+
+    ctx.metrics.add("frames_processed", len(ref_indices) + n_exec)
+    logger.info(f"Vídeo gerado em streaming: {writer.frames_written} frames", extra={"joint_stats": stats.to_dict()})
+
+    if inferred:
+        # Landmarks da referência ficam para os próximos jobs (lote e cache), como no modo batch
+        fps = results["admit"]["probes"][0]["fps"] or 30.0
+        landmarks_ref = PoseSequence(np.array(ref_poses), ref_indices, fps)
+        if ctx.landmark_cache and cache_key:
+            ctx.landmark_cache.put(cache_key, landmarks_ref)
+        if ctx.shared_reference is not None:
+            ctx.shared_reference.put(download["ref"], options, "none", None, landmarks_ref)
+
+    video_url = upload_comparative_video(
+        output_path, ctx.video_key, ctx.s3_client, ctx.bucket_name,
+        on_uploaded=lambda size: ctx.metrics.add("bytes_uploaded", size)
+    )
+    if not video_url:
+        raise RuntimeError("Falha ao enviar vídeo comparativo para o R2.")
+
+    insights, avg_error, avg_errors = stats.summary()
+    return {
+        "series": stats.series(), "insights": insights, "avg_error": avg_error, "avg_errors": avg_errors,
+        "video": video_url,
+    }
+
+
+def streamed_video_stage(ctx, results):
+    # O vídeo já subiu dentro de stream_stage (a análise restaurada de um checkpoint também implica o upload)
+    return results["analyze"].get("video") or ctx.video_key
+
+
+def reference_download_stage(ctx, results):
+    ref_key = extract_key_from_url(ctx.task.get('ref_path'))
+    if not ref_key:
+        raise ValueError("Chave do vídeo de referência inválida")
+    if ctx.references is None:
+        raise ValueError("Coleção references não configurada")
+
+    head = head_many(ctx.s3_client, ctx.bucket_name, [ref_key])[0]
+    ref_path = ctx.temp_path(".mp4", head["size"])
+    download_to_path(ctx.s3_client, ctx.bucket_name, ref_key, ref_path, head)
+    ctx.metrics.add("bytes_downloaded", head["size"])
+    logger.info(f"Tamanho do arquivo de referência: {head['size']} bytes")
+    return {"ref_path": ref_path, "ref": head}
+
+
+def reference_extract_stage(ctx, results):
+    download = results["download"]
+    probe = probe_inputs({"referência": download["ref_path"]})["referência"]
+
+    # Painéis em PANEL_SIZE bastam para a faixa; os landmarks também vão para o cache
+    pool = ctx.extraction_pool
+    frames, landmarks = extract_landmarks_cached(
+        ctx.landmark_cache, download["ref_path"], download["ref"]["key"], download["ref"]["etag"],
+        frame_mode="small", extractor=pool.extract if pool else None, **ctx.extraction_options
+    )
+    if not len(landmarks):
+        raise ValueError("Falha na extração de landmarks")
+    ctx.metrics.add("frames_processed", len(landmarks))
+    return {"probe": probe, "frames": frames, "landmarks": landmarks}
+
+
+def reference_publish_stage(ctx, results):
+    download = results["download"]
+    extracted = results["reference_extract"]
+
+    logger.info("Renderizando painéis da referência...")
+    strip_path = ctx.temp_path(".mp4")
+    written = render_reference_strip(extracted["frames"], extracted["landmarks"], strip_path)
+    if written != len(extracted["landmarks"]):
+        raise RuntimeError(f"Faixa de painéis incompleta: {written} de {len(extracted['landmarks'])} frames")
+
+    doc, sent = ctx.references.publish(
+        download["ref"]["key"], download["ref"]["etag"], ctx.extraction_options, extracted["landmarks"],
+        extracted["probe"], strip_path, trainer=ctx.task.get("trainer"),
+    )
+    ctx.metrics.add("bytes_uploaded", sent)
+    return doc["_id"]
+
+
+def pdf_stage(ctx, results):
+    analysis = results["analyze"]
+
+    logger.info("Gerando e enviando PDF...")
+    # PDF gerado em memória (sem arquivo local)
+    pdf_url = generate_and_upload_pdf(
+        student_name=ctx.student,
+        insights=analysis["insights"],
+        avg_error=analysis["avg_error"],
+        video_url=ctx.video_key,
+        output_path_local=None,
+        output_path_r2=ctx.pdf_key,
+        s3_client=ctx.s3_client,
+        bucket_name=ctx.bucket_name,
+        full_feedback=results["feedback"],
+        on_uploaded=lambda size: ctx.metrics.add("bytes_uploaded", size)
+    )
+
+    if not pdf_url:
+        raise RuntimeError("Falha ao gerar ou enviar o PDF para o R2.")
+    return pdf_url
+
+
+# Grafo de um job de comparação:
+#   download -> extract -> analyze -> feedback -> pdf
+#                                  \-> video (render + upload, em paralelo com feedback/pdf)
+JOB_GRAPH = StageGraph([
+    Stage("download", download_stage),
+    Stage("admit", admit_stage, deps=["download"]),
+    Stage("extract", extract_stage, deps=["download", "admit"]),
+    Stage("analyze", analyze_stage, deps=["extract"]),
+    Stage("feedback", feedback_stage, deps=["analyze"]),
+    Stage("video", video_stage, deps=["extract", "analyze"]),
+    Stage("pdf", pdf_stage, deps=["analyze", "feedback"]),
+])
+
+# Grafo do pipeline "streaming": extração, análise e vídeo numa etapa só
+#   download -> admit -> analyze (stream) -> feedback -> pdf
+#                                         \-> video
+STREAMING_JOB_GRAPH = StageGraph([
+    Stage("download", download_stage),
+    Stage("admit", admit_stage, deps=["download"]),
+    Stage("analyze", stream_stage, deps=["download", "admit"]),
+    Stage("feedback", feedback_stage, deps=["analyze"]),
+    Stage("video", streamed_video_stage, deps=["analyze"]),
+    Stage("pdf", pdf_stage, deps=["analyze", "feedback"]),
+])
+
+
+# Job "reference" (type = "reference"): pré-computa a referência para os jobs de aluno
+#   download -> reference_extract -> reference_publish (faixa de painéis + artefatos + documento)
+REFERENCE_JOB_GRAPH = StageGraph([
+    Stage("download", reference_download_stage),
+    Stage("reference_extract", reference_extract_stage, deps=["download"]),
+    Stage("reference_publish", reference_publish_stage, deps=["download", "reference_extract"]),
+])
+
+
+def job_graph(ctx):
+    """
+    Grafo do job: o de referência para type "reference"; senão conforme ctx.pipeline
+    (o streaming pareia por posição, então não atende alinhamento DTW).
+    """
+    if ctx.task.get("type") == "reference":
+        return REFERENCE_JOB_GRAPH
+    if ctx.pipeline == "streaming" and ctx.alignment != "dtw":
+        return STREAMING_JOB_GRAPH
+    return JOB_GRAPH
+
+
+def run_job(ctx, max_workers=4):
+    """
+    Executa o grafo do job; retorna os resultados por etapa (video, pdf, feedback, ...).
+    Tempo, CPU e memória de cada etapa ficam em `ctx.metrics`. Com `ctx.checkpoints`,
+    etapas concluídas em tentativas anteriores são puladas e cada etapa nova é gravada.
+    """
+    checkpoints = ctx.checkpoints
+    try:
+        results = job_graph(ctx).run(
+            ctx, max_workers=max_workers, observer=ctx.metrics.stage,
+            results=checkpoints.restore() if checkpoints else None,
+            on_complete=checkpoints.save if checkpoints else None,
+        )
+    finally:
+        ctx.cleanup()
+    for name, record in ctx.metrics.stages.items():
+        logger.info(f"Etapa {name}: {record['wall_seconds']:.2f}s", extra={"stage": name, **record})
+    return results
+
+
+def _job_outputs(results):
+    """Campos gravados no documento do job concluído, conforme o tipo do job."""
+    if "reference_publish" in results:
+        return {"reference_id": results["reference_publish"]}
+    return {"video_url": results["video"], "report_url": results["pdf"], "feedback": results["feedback"]}
+
+
+def _root_error(error):
+    return error.error if isinstance(error, StageFailed) else error
+
+
+def is_retryable(error):
+    """
+    Erros de entrada (ValueError: chaves inválidas, vídeo recusado, nenhuma pose
+    detectada) não melhoram com nova tentativa.
+    """
+    return not isinstance(_root_error(error), ValueError)
+
+
+def retry_delay(attempt, base_seconds=30, max_seconds=600):
+    """Backoff exponencial entre tentativas: base, 2x base, 4x base... até max_seconds."""
+    return min(base_seconds * 2 ** max(attempt - 1, 0), max_seconds)
+
+
+def process_job(queue, ctx, job_filter=None, max_workers=4, max_attempts=3, retry_base_seconds=30):
+    """
+    Executa o job e grava o resultado (ou o erro) e as métricas no documento da fila.
+    `job_filter` restringe a escrita final (ex.: ao dono do lease). Cada etapa concluída
+    vira checkpoint; em erro transitório o job volta para 'pending' (com `not_before`)
+    e a próxima tentativa retoma da última etapa concluída, até `max_attempts`.
+    Retorna (status, métricas), com status 'done', 'retry', 'error', 'deferred' ou
+    'lost' (lease perdido: outro worker é dono do job e o resultado foi descartado).
+    """
+    task = ctx.task
+    job_filter = job_filter or {"_id": task["_id"]}
+    attempt = task.get("attempts", 1)
+    log_fields = {"job_id": str(task["_id"]), "student": ctx.student, "attempt": attempt}
+    logger.info(f"Processando: {ctx.student} (tentativa {attempt}/{max_attempts})", extra=log_fields)
+    ctx.checkpoints = JobCheckpoints(queue, job_filter, ctx.s3_client, ctx.bucket_name, task)
+
+    try:
+        if attempt > max_attempts:
+            # Worker morreu no meio do job repetidas vezes: não insiste mais
+            raise ValueError(f"Número máximo de tentativas ({max_attempts}) excedido")
+
+        # Etapas rodam como grafo: feedback e PDF saem em paralelo com o vídeo
+        results = run_job(ctx, max_workers=max_workers)
+        metrics = ctx.metrics.to_dict()
+
+        # Atualiza job no MongoDB
+        logger.info("Atualizando status do job no MongoDB para 'done'...", extra=log_fields)
+        result = queue.update_one(
+            job_filter,
+            {
+                "$set": {
+                    "status": "done",
+                    **_job_outputs(results),
+                    "metrics": metrics,
+                    "processed_at": datetime.utcnow()
+                },
+                "$unset": {"lease_expires_at": "", "not_before": "", "checkpoint": "", "error_message": ""}
+            }
+        )
+        if result.matched_count == 0:
+            logger.warning(f"Lease perdido; resultado de {ctx.student} descartado.", extra={**log_fields, "status": "lost"})
+            return "lost", metrics
+        ctx.checkpoints.clear()
+
+        logger.info(f"✅ Finalizado: {ctx.student}", extra={**log_fields, "status": "done", "metrics": metrics})
+        return "done", metrics
+
+    except Exception as e:
+        metrics = ctx.metrics.to_dict()
+        now = datetime.utcnow()
+        if isinstance(_root_error(e), JobDeferred):
+            # Não é falha: o job volta para a fila na lane indicada, sem gastar tentativa
+            deferred = _root_error(e)
+            logger.info(f"{ctx.student}: {deferred}", extra={**log_fields, "status": "deferred", "estimate": deferred.estimate})
+            queue.update_one(
+                job_filter,
+                {
+                    "$set": {"status": "pending", "lane": deferred.lane, "estimate": deferred.estimate},
+                    "$unset": {"lease_expires_at": ""},
+                    "$inc": {"attempts": -1},
+                }
+            )
+            return "deferred", metrics
+
+        if attempt < max_attempts and is_retryable(e):
+            delay = retry_delay(attempt, retry_base_seconds)
+            logger.warning(
+                f"Erro transitório em {ctx.student}: {e}; nova tentativa em {delay}s",
+                exc_info=True, extra={**log_fields, "status": "retry", "metrics": metrics},
+            )
+            update = {"status": "pending", "not_before": now + timedelta(seconds=delay)}
+            status = "retry"
+        else:
+            logger.exception(f"Erro ao processar {ctx.student}: {e}", extra={**log_fields, "status": "error", "metrics": metrics})
+            update = {"status": "error", "processed_at": now}
+            status = "error"
+
+        # Checkpoints só servem à próxima tentativa: num erro definitivo são descartados
+        unset = {"lease_expires_at": ""} if status == "retry" else {"lease_expires_at": "", "checkpoint": ""}
+        result = queue.update_one(
+            job_filter,
+            {
+                "$set": {**update, "error_message": str(e), "metrics": metrics},
+                "$unset": unset
+            }
+        )
+        if result.matched_count == 0:
+            logger.warning(f"Lease perdido; erro de {ctx.student} não registrado.", extra={**log_fields, "status": "lost"})
+            return "lost", metrics
+        if status == "error":
+            ctx.checkpoints.clear()
+        return status, metrics
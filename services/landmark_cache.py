@@ -0,0 +1,122 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+from services.pose_extractor import extract_landmarks_from_video, extraction_options, read_frames
+from services.pose_sequence import PoseSequence
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 2
+
+
+def landmark_cache_key(object_key, etag, **params):
+    """Chave de conteúdo: objeto no R2 + ETag + parâmetros do extrator."""
+    payload = json.dumps(
+        {"v": CACHE_VERSION, "key": object_key, "etag": etag, "params": params},
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LandmarkCache:
+    """
+    Cache de landmarks em dois níveis:
+    - disco local com LRU e limite de tamanho (sempre ativo);
+    - R2 compartilhado entre workers (opcional, quando s3_client é passado).
+    """
+
+    def __init__(self, cache_dir, max_bytes, s3_client=None, bucket_name=None, prefix="landmark_cache/"):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _local_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def _read_local(self, key):
+        path = self._local_path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)  # marca como usado recentemente (LRU por mtime)
+            return data
+        except FileNotFoundError:
+            return None
+
+    def _write_local(self, key, data):
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self._local_path(key))
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".npz"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+                total -= size
+            except FileNotFoundError:
+                pass
+
+    def get(self, key):
+        """Retorna a PoseSequence em cache ou None."""
+        data = self._read_local(key)
+        if data is None and self.s3_client:
+            try:
+                data = self.s3_client.get_object(Bucket=self.bucket_name, Key=f"{self.prefix}{key}.npz")["Body"].read()
+                self._write_local(key, data)
+            except self.s3_client.exceptions.NoSuchKey:
+                data = None
+            except Exception as e:
+                logger.warning(f"Falha ao ler cache compartilhado: {e}")
+                data = None
+        return PoseSequence.from_bytes(data) if data is not None else None
+
+    def put(self, key, poses):
+        data = poses.to_bytes()
+        self._write_local(key, data)
+        if self.s3_client:
+            try:
+                self.s3_client.put_object(Bucket=self.bucket_name, Key=f"{self.prefix}{key}.npz", Body=data)
+            except Exception as e:
+                logger.warning(f"Falha ao gravar cache compartilhado: {e}")
+
+
+def extract_landmarks_cached(cache, video_path, object_key, etag, frame_mode="full", extractor=None, **options):
+    """
+    Igual a extract_landmarks_from_video, mas consulta o cache antes.
+    Num hit a inferência do MediaPipe é pulada; só os frames são decodificados.
+    `extractor` permite trocar a função de extração (ex.: ExtractionPool.extract).
+    """
+    options = extraction_options(**options)
+    key = landmark_cache_key(object_key, etag, **options)
+    cached = cache.get(key) if cache and etag else None
+
+    if cached is not None:
+        logger.info(f"Hit de landmarks para {object_key}")
+        return read_frames(video_path, cached.frame_indices, frame_mode), cached
+
+    extractor = extractor or extract_landmarks_from_video
+    frames, poses = extractor(video_path, frame_mode=frame_mode, **options)
+    if cache and etag and len(poses):
+        cache.put(key, poses)
+    return frames, poses
@@ -0,0 +1,112 @@
+import math
+
+import numpy as np
+
+# Direções do backtracking
+_DIAG, _UP, _LEFT = 0, 1, 2
+
+
+def default_band(n, m, ratio=0.1):
+    """Meia-largura padrão da banda Sakoe-Chiba: 10% da sequência mais longa."""
+    return max(1, int(math.ceil(ratio * max(n, m))))
+
+
+def _band_limits(n, m, band):
+    """Limites [lo, hi) da banda em cada linha, seguindo a diagonal (n x m) e sempre conectados."""
+    limits = []
+    prev_hi = 1
+    for i in range(n):
+        center = int(round(i * (m - 1) / (n - 1))) if n > 1 else 0
+        lo = max(0, center - band)
+        hi = min(m, center + band + 1)
+        if n == 1:
+            lo, hi = 0, m
+        lo = min(lo, prev_hi)  # garante caminho a partir da linha anterior
+        if i == 0:
+            lo = 0
+        if i == n - 1:
+            hi = m
+        limits.append((lo, hi))
+        prev_hi = hi
+    return limits
+
+
+def dtw_align(x, y, band=None):
+    """
+    Alinha duas sequências de vetores (ex.: ângulos articulares por frame) com DTW.
+    x: (N, D), y: (M, D). Custo local = diferença absoluta média entre os vetores.
+    Usa banda Sakoe-Chiba de meia-largura `band`: tempo O(N·w), custos acumulados em
+    O(M) (duas linhas) e ponteiros de backtracking em int8 só dentro da banda.
+    Cada linha é resolvida de forma vetorizada: o termo horizontal do DTW vira um
+    mínimo acumulado sobre a soma acumulada dos custos.
+    Retorna (path, cost): path (P, 2) com pares (i, j) em ordem crescente e cost = custo
+    total dividido pelo tamanho do caminho.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if x.ndim == 1:
+        x = x[:, None]
+    if y.ndim == 1:
+        y = y[:, None]
+    n, m = len(x), len(y)
+    if n == 0 or m == 0:
+        return np.empty((0, 2), dtype=np.intp), 0.0
+
+    band = default_band(n, m) if band is None else max(1, int(band))
+    limits = _band_limits(n, m, band)
+
+    prev = np.full(m, np.inf)
+    cur = np.full(m, np.inf)
+    prev_lo, prev_hi = 0, 0
+    pointers = []
+
+    for i, (lo, hi) in enumerate(limits):
+        local = np.abs(x[i] - y[lo:hi])
+        local = np.nan_to_num(local, nan=0.0).mean(axis=1)
+
+        if i == 0:
+            entry = np.full(hi - lo, np.inf)
+            entry[0] = local[0]
+            from_diag = np.ones(hi - lo, dtype=bool)
+        else:
+            up = prev[lo:hi]
+            diag = np.empty(hi - lo)
+            diag[0] = prev[lo - 1] if lo > 0 else np.inf
+            diag[1:] = prev[lo:hi - 1]
+            from_diag = diag <= up
+            entry = local + np.where(from_diag, diag, up)
+
+        # D[j] = min(entry[j], D[j-1] + local[j]) = S[j] + min_{k<=j}(entry[k] - S[k])
+        cumulative = np.cumsum(local)
+        offset = entry - cumulative
+        best = np.minimum.accumulate(offset)
+        row = cumulative + best
+
+        steps = np.where(from_diag, _DIAG, _UP).astype(np.int8)
+        steps[best < offset] = _LEFT
+        pointers.append((lo, steps))
+
+        prev[prev_lo:prev_hi] = np.inf
+        cur[lo:hi] = row
+        prev, cur = cur, prev
+        prev_lo, prev_hi = lo, hi
+
+    total = prev[m - 1]
+
+    # Backtracking a partir de (N-1, M-1)
+    i, j = n - 1, m - 1
+    path = [(i, j)]
+    while i > 0 or j > 0:
+        lo, steps = pointers[i]
+        step = steps[j - lo]
+        if step == _DIAG:
+            i, j = i - 1, j - 1
+        elif step == _UP:
+            i -= 1
+        else:
+            j -= 1
+        path.append((i, j))
+    path.reverse()
+
+    path = np.array(path, dtype=np.intp)
+    return path, float(total / len(path))
@@ -1,5 +1,8 @@
 import numpy as np
 
+from services.pose_alignment import dtw_align
+from services.pose_sequence import PoseSequence
+
 # Articulações que vamos analisar (tripletos de índices do MediaPipe)
 JOINTS = {
     "Ombro Direito": (12, 14, 16),
@@ -10,47 +13,70 @@ JOINTS = {
     "Quadril Esquerdo": (23, 25, 27),
 }
 
-def calculate_angle(a, b, c):
-    """Calcula o ângulo entre três pontos"""
-    a = np.array([a.x, a.y])
-    b = np.array([b.x, b.y])
-    c = np.array([c.x, c.y])
+JOINT_NAMES = list(JOINTS)
+# (J, 3): índices a, b, c de cada articulação, na ordem de JOINT_NAMES
+JOINT_INDICES = np.array(list(JOINTS.values()), dtype=np.intp)
 
+def calculate_angle(a, b, c):
+    """
+    Calcula o ângulo (em graus) no ponto b entre três pontos.
+    Vetorizado: a, b e c podem ter qualquer formato (..., D), com D = 2 (x, y) ou 3 (x, y, z).
+    """
     ba = a - b
     bc = c - b
 
-    cosine_angle = np.dot(ba, bc) / (np.linalg.norm(ba) * np.linalg.norm(bc))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cosine_angle = np.sum(ba * bc, axis=-1) / (np.linalg.norm(ba, axis=-1) * np.linalg.norm(bc, axis=-1))
     angle = np.arccos(np.clip(cosine_angle, -1.0, 1.0))
     return np.degrees(angle)
 
-def analyze_poses(ref_landmarks, exec_landmarks):
+def joint_angles(poses, use_3d=False):
     """
-    Compara landmarks entre referência e execução.
-    Retorna:
-    - insights em texto
-    - erro médio total
-    - erros médios por articulação (para usar com OpenAI)
+    Ângulos de todas as articulações de JOINTS em todos os frames, de uma vez.
+    Aceita PoseSequence ou array (T, 33, 2|3|4). Retorna array (T, J) em graus.
     """
-    if not ref_landmarks or not exec_landmarks:
-        return [], 0.0, {}
+    landmarks = poses.landmarks if isinstance(poses, PoseSequence) else np.asarray(poses, dtype=np.float32)
+    points = landmarks[..., :3] if use_3d else landmarks[..., :2]
+    a, b, c = (points[:, JOINT_INDICES[:, k]].astype(np.float64) for k in range(3))
+    return calculate_angle(a, b, c)
+
+def analyze_pose_series(ref_landmarks, exec_landmarks, use_3d=False, align=False, band=None, angles_ref=None):
+    """
+    Séries de ângulos por frame da referência e da execução e o erro absoluto por frame.
+    Sem alinhamento os frames são pareados pela posição (como zip); com align=True os
+    pares vêm do DTW sobre os vetores de ângulos (banda Sakoe-Chiba de meia-largura band).
+    Retorna dict com "joints" (nomes), "angles_ref", "angles_exec" e "errors" (arrays (P, J)),
+    "pairs" (P, 2) com os índices (ref, exec) de cada par e "alignment_cost" (None sem DTW).
+    angles_ref (T, J) evita recalcular os ângulos de uma referência pré-computada.
+    """
+    if angles_ref is None:
+        angles_ref = joint_angles(ref_landmarks, use_3d)
+    angles_exec = joint_angles(exec_landmarks, use_3d)
+
+    if align:
+        pairs, alignment_cost = dtw_align(angles_ref, angles_exec, band)
+    else:
+        n = min(len(angles_ref), len(angles_exec))
+        pairs = np.repeat(np.arange(n, dtype=np.intp)[:, None], 2, axis=1)
+        alignment_cost = None
 
-    diffs = []
-    for ref, exe in zip(ref_landmarks, exec_landmarks):
-        for joint, (a, b, c) in JOINTS.items():
-            angle_ref = calculate_angle(ref[a], ref[b], ref[c])
-            angle_exe = calculate_angle(exe[a], exe[b], exe[c])
-            diff = abs(angle_ref - angle_exe)
-            diffs.append((joint, diff))
-
-    # Agrupa os erros por articulação
-    errors_by_joint = {}
-    for joint, diff in diffs:
-        if joint not in errors_by_joint:
-            errors_by_joint[joint] = []
-        errors_by_joint[joint].append(diff)
-
-    # Calcula os erros médios por articulação
-    avg_errors = {joint: np.mean(errors) for joint, errors in errors_by_joint.items()}
+    angles_ref = angles_ref[pairs[:, 0]]
+    angles_exec = angles_exec[pairs[:, 1]]
+    return {
+        "joints": JOINT_NAMES,
+        "angles_ref": angles_ref,
+        "angles_exec": angles_exec,
+        "errors": np.abs(angles_ref - angles_exec),
+        "pairs": pairs,
+        "alignment_cost": alignment_cost,
+    }
+
+def summarize_errors(series):
+    """Resume as séries de erro em (insights, erro médio total, erros médios por articulação)."""
+    return _summarize_means(series["joints"], series["errors"].mean(axis=0))
+
+def _summarize_means(joints, mean_errors):
+    avg_errors = {joint: float(error) for joint, error in zip(joints, mean_errors)}
     avg_error_total = np.mean(list(avg_errors.values()))
 
     # Gera insights amigáveis
@@ -60,3 +86,83 @@ def analyze_poses(ref_landmarks, exec_landmarks):
             insights.append(f"Ajustar {joint}: diferença média de {avg_diff:.1f}°.")
 
     return insights, avg_error_total, avg_errors
+
+class RunningJointStats:
+    """
+    Estatísticas do erro por articulação atualizadas par a par, para o modo
+    streaming: média e variância online (Welford) e erro máximo. Os frames não
+    são guardados; só os ângulos de cada par (P x J), que compõem a mesma série
+    de analyze_pose_series sem alinhamento.
+    """
+
+    def __init__(self, use_3d=False):
+        self.use_3d = use_3d
+        self.count = 0
+        self.mean = np.zeros(len(JOINT_NAMES))
+        self.max = np.zeros(len(JOINT_NAMES))
+        self._m2 = np.zeros(len(JOINT_NAMES))
+        self._angles_ref = []
+        self._angles_exec = []
+
+    def update(self, pose_ref, pose_exec, angle_ref=None):
+        """
+        Acrescenta um par de poses (33, 4); retorna o erro de cada articulação no par.
+        angle_ref (J,) reaproveita os ângulos já calculados da referência.
+        """
+        if angle_ref is None:
+            angle_ref = joint_angles(np.asarray(pose_ref)[None], self.use_3d)[0]
+        angle_exec = joint_angles(np.asarray(pose_exec)[None], self.use_3d)[0]
+        errors = np.abs(angle_ref - angle_exec)
+
+        self.count += 1
+        delta = errors - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (errors - self.mean)
+        np.fmax(self.max, errors, out=self.max)
+        self._angles_ref.append(angle_ref)
+        self._angles_exec.append(angle_exec)
+        return errors
+
+    @property
+    def variance(self):
+        return self._m2 / self.count if self.count else np.zeros_like(self._m2)
+
+    def series(self):
+        """Mesmo formato de analyze_pose_series(..., align=False)."""
+        shape = (self.count, len(JOINT_NAMES))
+        angles_ref = np.array(self._angles_ref).reshape(shape)
+        angles_exec = np.array(self._angles_exec).reshape(shape)
+        return {
+            "joints": JOINT_NAMES,
+            "angles_ref": angles_ref,
+            "angles_exec": angles_exec,
+            "errors": np.abs(angles_ref - angles_exec),
+            "pairs": np.repeat(np.arange(self.count, dtype=np.intp)[:, None], 2, axis=1),
+            "alignment_cost": None,
+        }
+
+    def summary(self):
+        """(insights, erro médio total, erros médios por articulação), como summarize_errors."""
+        return _summarize_means(JOINT_NAMES, self.mean)
+
+    def to_dict(self):
+        """Média, desvio padrão e máximo do erro por articulação."""
+        std = np.sqrt(self.variance)
+        return {
+            joint: {"mean": float(self.mean[j]), "std": float(std[j]), "max": float(self.max[j])}
+            for j, joint in enumerate(JOINT_NAMES)
+        }
+
+def analyze_poses(ref_landmarks, exec_landmarks, use_3d=False, align=False):
+    """
+    Compara landmarks (PoseSequence) entre referência e execução.
+    Retorna:
+    - insights em texto
+    - erro médio total
+    - erros médios por articulação (para usar com OpenAI)
+    Com use_3d=True os ângulos usam x, y e z; com align=True os frames são pareados por DTW.
+    """
+    if not len(ref_landmarks) or not len(exec_landmarks):
+        return [], 0.0, {}
+
+    return summarize_errors(analyze_pose_series(ref_landmarks, exec_landmarks, use_3d, align))
@@ -1,34 +1,241 @@
+import logging
+import threading
+from contextlib import contextmanager, nullcontext
+
 import cv2
-import mediapipe as mp
+import numpy as np
+
+from services.frame_source import PANEL_SIZE, FFmpegFrameSource, VideoFrameReader, resize_to_panel
+from services.video_encoder import find_ffmpeg
+from services.pose_sequence import PoseSequence
+
+logger = logging.getLogger(__name__)
+
+
+def _mp_pose():
+    # MediaPipe (~1s de import) só carrega em quem de fato roda inferência
+    import mediapipe as mp
+    return mp.solutions.pose
+
+
+# Opções do extrator (também compõem a chave do cache de landmarks)
+DEFAULT_EXTRACTION_OPTIONS = {
+    "max_frames": 300,           # limite de frames lidos do vídeo
+    "max_seconds": None,         # limite por duração, usando CAP_PROP_FPS
+    "frame_stride": 1,           # processa 1 a cada N frames
+    "target_fps": None,          # alternativa ao stride: fps alvo da análise
+    "max_inference_side": None,  # reduz o frame para este lado máximo antes do pose.process
+    "model_complexity": 1,       # 0 (lite), 1 (full) ou 2 (heavy)
+    "decoder": "opencv",         # "opencv" (cv2.VideoCapture) ou "ffmpeg" (pipe rgb24 já reduzido)
+}
+
+DECODERS = ("opencv", "ffmpeg")
+
+def extraction_options(**overrides):
+    """Opções completas do extrator (padrões + overrides não nulos)."""
+    options = dict(DEFAULT_EXTRACTION_OPTIONS)
+    unknown = set(overrides) - set(options)
+    if unknown:
+        raise ValueError(f"Opções de extração desconhecidas: {sorted(unknown)}")
+    options.update({k: v for k, v in overrides.items() if v is not None})
+    if options["decoder"] not in DECODERS:
+        raise ValueError(f"Decoder desconhecido: {options['decoder']}")
+    return options
+
+def _frame_limit(fps, max_frames, max_seconds):
+    limit = max_frames
+    if max_seconds:
+        limit = min(limit, int(round(max_seconds * fps)))
+    return limit
+
+def _stride(fps, frame_stride, target_fps):
+    if target_fps:
+        return max(1, int(round(fps / target_fps)))
+    return max(1, int(frame_stride))
+
+def _inference_frame(frame, max_side):
+    """Converte para RGB, reduzindo antes se o maior lado passar de max_side (landmarks são normalizados)."""
+    height, width = frame.shape[:2]
+    if max_side and max(height, width) > max_side:
+        scale = max_side / max(height, width)
+        frame = cv2.resize(frame, (int(round(width * scale)), int(round(height * scale))), interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+def _opencv_frames(cap, limit, stride, max_side):
+    """(índice, frame RGB para inferência, frame BGR original) lidos pelo cv2.VideoCapture."""
+    frame_count = 0
+    while cap.isOpened() and frame_count < limit:
+        if frame_count % stride:
+            # Frame pulado: grab() ainda demuxa e decodifica (frames P/B dependem dele), mas
+            # pula o retrieve e as conversões de cor/escala; o ganho real vem da inferência evitada
+            if not cap.grab():
+                break
+            frame_count += 1
+            continue
+
+        ret, frame = cap.read()
+        if not ret:
+            break
+        yield frame_count, _inference_frame(frame, max_side), frame
+        frame_count += 1
+
+def _ffmpeg_frames(source):
+    for index, rgb in source:
+        yield index, rgb, None
+
+def _frame_source(cap, video_path, decoder, limit, stride, max_side):
+    """Escolhe o decoder; sem ffmpeg disponível cai para o cv2.VideoCapture."""
+    if decoder == "ffmpeg":
+        ffmpeg = find_ffmpeg()
+        # O primeiro frame dá o tamanho já com a rotação aplicada (como o ffmpeg entrega)
+        ret, first = cap.read()
+        if ffmpeg and ret:
+            cap.release()
+            source = FFmpegFrameSource(ffmpeg, video_path, first.shape[1], first.shape[0], stride, limit, max_side)
+            return _ffmpeg_frames(source)
+        logger.warning("ffmpeg indisponível; usando cv2.VideoCapture.")
+        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+    return _opencv_frames(cap, limit, stride, max_side)
 
-mp_pose = mp.solutions.pose
+def create_pose(model_complexity=1):
+    return _mp_pose().Pose(static_image_mode=False, model_complexity=model_complexity, enable_segmentation=False)
 
-def extract_landmarks_from_video(video_path, max_frames=300):
-    """Extrai landmarks e frames de um vídeo usando MediaPipe (limitado a max_frames)."""
+# Poses ociosas do processo, por model_complexity (reaproveitadas pelo modo streaming)
+_idle_poses = {}
+_idle_lock = threading.Lock()
+
+@contextmanager
+def borrowed_pose(model_complexity=1):
+    """
+    Empresta um Pose do processo (criado só quando não há um livre) e o devolve
+    ao fim do uso; cada uso simultâneo recebe o seu, então é seguro entre threads.
+    """
+    with _idle_lock:
+        idle = _idle_poses.setdefault(model_complexity, [])
+        pose = idle.pop() if idle else None
+    if pose is None:
+        pose = create_pose(model_complexity)
+    try:
+        yield pose
+    finally:
+        with _idle_lock:
+            _idle_poses[model_complexity].append(pose)
+
+def extract_landmarks_from_video(video_path, max_frames=300, model_complexity=1, frame_mode="full",
+                                 frame_stride=1, target_fps=None, max_inference_side=None, max_seconds=None,
+                                 decoder="opencv", pose=None):
+    """
+    Extrai landmarks e frames de um vídeo usando MediaPipe.
+    Lê no máximo max_frames frames (e no máximo max_seconds segundos, se informado) e
+    processa 1 a cada frame_stride frames (ou o stride que aproxima target_fps); os
+    frames pulados não são decodificados. Com max_inference_side o frame é reduzido
+    antes da inferência.
+    decoder="ffmpeg" decodifica num ffmpeg em subprocesso que já entrega os frames
+    reduzidos e em RGB (passo, escala e conversão de cor dentro do decoder); nesse
+    modo frame_mode="full" guarda os frames já em PANEL_SIZE.
+    Retorna (frames, PoseSequence) com apenas os frames em que uma pose foi detectada.
+    frame_mode controla os frames guardados: "full" (resolução original), "small"
+    (já em PANEL_SIZE) ou "none" (um VideoFrameReader que relê o vídeo depois).
+    Um `pose` já inicializado (ver create_pose) pode ser reutilizado entre vídeos;
+    ele é resetado antes do uso e não é fechado aqui.
+    """
     cap = cv2.VideoCapture(video_path)
     frames = []
     landmarks_list = []
+    frame_indices = []
 
     if not cap.isOpened():
-        print(f"[ERRO] Não foi possível abrir o vídeo: {video_path}")
-        return [], []
+        logger.error(f"Não foi possível abrir o vídeo: {video_path}")
+        return [], PoseSequence.empty()
 
-    with mp_pose.Pose(static_image_mode=False, model_complexity=1, enable_segmentation=False) as pose:
-        frame_count = 0
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    limit = _frame_limit(fps, max_frames, max_seconds)
+    stride = _stride(fps, frame_stride, target_fps)
 
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if not ret or frame_count >= max_frames:
-                break
+    owns_pose = pose is None
+    if owns_pose:
+        pose = create_pose(model_complexity)
+    else:
+        pose.reset()  # descarta o tracking do vídeo anterior
 
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            results = pose.process(frame_rgb)
+    try:
+        for index, rgb, frame in _frame_source(cap, video_path, decoder, limit, stride, max_inference_side):
+            results = pose.process(rgb)
 
             if results.pose_landmarks:
-                frames.append(frame.copy())  # Guarda o frame original
+                if frame is None and frame_mode in ("full", "small"):
+                    # Frame do ffmpeg: o buffer é reutilizado, então guarda uma cópia do painel em BGR
+                    frames.append(cv2.cvtColor(resize_to_panel(rgb), cv2.COLOR_RGB2BGR))
+                elif frame_mode == "full":
+                    frames.append(frame.copy())  # Guarda o frame original
+                elif frame_mode == "small":
+                    frames.append(resize_to_panel(frame))
                 landmarks_list.append(results.pose_landmarks.landmark)
+                frame_indices.append(index)
+    finally:
+        if owns_pose:
+            pose.close()
 
-            frame_count += 1
+    cap.release()
+    if frame_mode == "none":
+        frames = VideoFrameReader(video_path, frame_indices, PANEL_SIZE)
+    return frames, PoseSequence.from_mediapipe(landmarks_list, frame_indices, fps)
+
+def iter_pose_frames(video_path, max_frames=300, model_complexity=1, frame_stride=1, target_fps=None,
+                     max_inference_side=None, max_seconds=None, decoder="opencv", pose=None):
+    """
+    Versão em streaming de extract_landmarks_from_video (mesmas opções): gera
+    (índice do frame, painel BGR em PANEL_SIZE, pose (33, 4)) para cada frame com
+    pose detectada, conforme a inferência avança. Só o frame atual fica em memória.
+    Sem `pose`, usa um emprestado do processo (ver borrowed_pose).
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        logger.error(f"Não foi possível abrir o vídeo: {video_path}")
+        return
+
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    limit = _frame_limit(fps, max_frames, max_seconds)
+    stride = _stride(fps, frame_stride, target_fps)
+
+    try:
+        with borrowed_pose(model_complexity) if pose is None else nullcontext(pose) as pose:
+            pose.reset()  # descarta o tracking do vídeo anterior
+            for index, rgb, frame in _frame_source(cap, video_path, decoder, limit, stride, max_inference_side):
+                results = pose.process(rgb)
+                if not results.pose_landmarks:
+                    continue
+                if frame is None:
+                    panel = cv2.cvtColor(resize_to_panel(rgb), cv2.COLOR_RGB2BGR)
+                else:
+                    panel = resize_to_panel(frame)
+                landmarks = np.array(
+                    [(lm.x, lm.y, lm.z, lm.visibility) for lm in results.pose_landmarks.landmark], dtype=np.float32
+                )
+                yield index, panel, landmarks
+    finally:
+        cap.release()
+
+def read_frames(video_path, frame_indices, frame_mode="full"):
+    """Decodifica apenas os frames indicados (sem inferência), na ordem de frame_indices."""
+    if frame_mode == "none":
+        return VideoFrameReader(video_path, frame_indices, PANEL_SIZE)
+
+    wanted = set(int(i) for i in frame_indices)
+    last = max(wanted) if wanted else -1
+    cap = cv2.VideoCapture(video_path)
+    frames = []
+    index = 0
+
+    while cap.isOpened() and index <= last:
+        if index in wanted:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.append(resize_to_panel(frame) if frame_mode == "small" else frame)
+        elif not cap.grab():
+            break
+        index += 1
 
     cap.release()
-    return frames, landmarks_list
+    return frames
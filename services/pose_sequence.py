@@ -0,0 +1,86 @@
+import io
+
+import numpy as np
+
+NUM_LANDMARKS = 33
+# Colunas do último eixo de PoseSequence.landmarks
+X, Y, Z, VISIBILITY = range(4)
+
+
+class PoseSequence:
+    """
+    Sequência de poses de um vídeo.
+    - landmarks: float32 (T, 33, 4) com x, y, z e visibility (coordenadas normalizadas do MediaPipe)
+    - frame_indices: int32 (T,) com o índice do frame de origem de cada pose
+    - fps: fps do vídeo de origem
+    Fatiar (seq[a:b]) retorna outra PoseSequence que compartilha a memória (sem cópia).
+    """
+
+    __slots__ = ("landmarks", "frame_indices", "fps")
+
+    def __init__(self, landmarks, frame_indices=None, fps=30.0):
+        landmarks = np.asarray(landmarks, dtype=np.float32)
+        if landmarks.ndim != 3 or landmarks.shape[1:] != (NUM_LANDMARKS, 4):
+            raise ValueError(f"landmarks deve ter formato (T, {NUM_LANDMARKS}, 4), recebido {landmarks.shape}")
+        if frame_indices is None:
+            frame_indices = np.arange(len(landmarks), dtype=np.int32)
+        frame_indices = np.asarray(frame_indices, dtype=np.int32)
+        if len(frame_indices) != len(landmarks):
+            raise ValueError("frame_indices e landmarks têm tamanhos diferentes")
+
+        self.landmarks = landmarks
+        self.frame_indices = frame_indices
+        self.fps = float(fps)
+
+    @classmethod
+    def empty(cls, fps=30.0):
+        return cls(np.empty((0, NUM_LANDMARKS, 4), dtype=np.float32), fps=fps)
+
+    @classmethod
+    def from_mediapipe(cls, landmark_lists, frame_indices, fps=30.0):
+        """Converte listas de landmarks protobuf do MediaPipe (results.pose_landmarks.landmark)."""
+        if not landmark_lists:
+            return cls.empty(fps)
+        landmarks = np.array(
+            [[(lm.x, lm.y, lm.z, lm.visibility) for lm in frame] for frame in landmark_lists],
+            dtype=np.float32,
+        )
+        return cls(landmarks, frame_indices, fps)
+
+    def __len__(self):
+        return len(self.landmarks)
+
+    def __getitem__(self, item):
+        """Índice inteiro retorna a pose (33, 4) do frame; fatia retorna uma PoseSequence (view)."""
+        if isinstance(item, slice):
+            return PoseSequence(self.landmarks[item], self.frame_indices[item], self.fps)
+        return self.landmarks[item]
+
+    def __repr__(self):
+        return f"PoseSequence(frames={len(self)}, fps={self.fps:.2f})"
+
+    @property
+    def xy(self):
+        return self.landmarks[..., :2]
+
+    @property
+    def xyz(self):
+        return self.landmarks[..., :3]
+
+    def save(self, file):
+        """Grava em formato .npz (caminho ou arquivo aberto em modo binário)."""
+        np.savez(file, landmarks=self.landmarks, frame_indices=self.frame_indices, fps=np.float32(self.fps))
+
+    @classmethod
+    def load(cls, file):
+        with np.load(file) as npz:
+            return cls(npz["landmarks"], npz["frame_indices"], float(npz["fps"]))
+
+    def to_bytes(self):
+        buffer = io.BytesIO()
+        self.save(buffer)
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls.load(io.BytesIO(data))
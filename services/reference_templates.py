@@ -0,0 +1,123 @@
+import io
+import logging
+from datetime import datetime
+
+import numpy as np
+
+from services.frame_source import PANEL_SIZE, VideoFrameReader, resize_to_panel
+from services.landmark_cache import landmark_cache_key
+from services.pose_analyzer import joint_angles
+from services.pose_sequence import PoseSequence
+from services.video_encoder import VideoEncoder
+from services.video_generator import draw_pose
+from utils.r2_utils import upload_bytes, upload_file
+
+logger = logging.getLogger(__name__)
+
+# Muda quando o formato dos artefatos muda (documentos antigos deixam de ser usados)
+TEMPLATE_VERSION = 1
+# A faixa de painéis é codificada uma vez e lida em todo job de aluno: vale um CRF mais baixo
+STRIP_ENCODER_OPTIONS = {"preset": "medium", "crf": 18}
+
+
+def render_reference_strip(frames, landmarks, output_path, encoder_options=None):
+    """
+    Codifica os painéis da referência (PANEL_SIZE, já com o esqueleto desenhado),
+    um por pose de `landmarks`, na mesma ordem. Retorna o número de frames escritos.
+    """
+    with VideoEncoder(output_path, PANEL_SIZE, **(encoder_options or STRIP_ENCODER_OPTIONS)) as encoder:
+        for frame, pose in zip(frames, landmarks.landmarks):
+            panel = resize_to_panel(frame)
+            encoder.write(draw_pose(panel.copy() if panel is frame else panel, pose))
+    return encoder.frames_written
+
+
+class ReferenceTemplate:
+    """
+    Artefatos pré-computados de um vídeo de referência: landmarks, série de ângulos
+    por articulação (T, J) e a faixa de painéis já anotados, baixada em `strip_path`.
+    """
+
+    def __init__(self, doc, landmarks, angles, strip_path):
+        self.doc = doc
+        self.landmarks = landmarks
+        self.angles = angles
+        self.strip_path = strip_path
+        self.probe = doc["probe"]
+
+    def panels(self):
+        """Painéis da referência na ordem dos landmarks, decodificados sob demanda."""
+        return VideoFrameReader(self.strip_path, range(len(self.landmarks)), PANEL_SIZE)
+
+
+class ReferenceStore:
+    """
+    Coleção `references`: um documento por vídeo de referência (chave + ETag no R2)
+    e opções do extrator, gerado por um job do tipo "reference". Os arrays e a faixa
+    de painéis ficam no R2 em `references/<id>/`; o documento guarda as chaves e o
+    probe do vídeo, para os jobs de aluno nem baixarem a referência.
+    """
+
+    def __init__(self, collection, s3_client, bucket_name, prefix="references/"):
+        self.collection = collection
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+
+    @staticmethod
+    def template_id(object_key, etag, options):
+        # Mesma chave de conteúdo do cache de landmarks: objeto + ETag + opções do extrator
+        return landmark_cache_key(object_key, etag, **options)
+
+    def find(self, object_key, etag, options):
+        """Documento pronto para a referência, ou None (sem ETag não há como validar a versão)."""
+        if not etag:
+            return None
+        try:
+            return self.collection.find_one(
+                {"_id": self.template_id(object_key, etag, options), "status": "ready", "version": TEMPLATE_VERSION}
+            )
+        except Exception as e:
+            logger.warning(f"Falha ao consultar references: {e}")
+            return None
+
+    def _get(self, key):
+        return self.s3_client.get_object(Bucket=self.bucket_name, Key=key)["Body"].read()
+
+    def load(self, doc, strip_path):
+        """Carrega landmarks e ângulos do documento; a faixa de painéis já deve estar em strip_path."""
+        landmarks = PoseSequence.from_bytes(self._get(doc["landmarks_key"]))
+        with np.load(io.BytesIO(self._get(doc["angles_key"]))) as data:
+            angles = data["angles"]
+        return ReferenceTemplate(doc, landmarks, angles, strip_path)
+
+    def publish(self, object_key, etag, options, landmarks, probe, strip_path, trainer=None):
+        """Sobe os artefatos e grava o documento; retorna (documento, bytes enviados)."""
+        template_id = self.template_id(object_key, etag, options)
+        prefix = f"{self.prefix}{template_id}/"
+        angles = io.BytesIO()
+        np.savez(angles, angles=joint_angles(landmarks))
+
+        sent = upload_bytes(self.s3_client, landmarks.to_bytes(), self.bucket_name, f"{prefix}landmarks.npz")
+        sent += upload_bytes(self.s3_client, angles.getvalue(), self.bucket_name, f"{prefix}angles.npz")
+        sent += upload_file(self.s3_client, strip_path, self.bucket_name, f"{prefix}panels.mp4", content_type="video/mp4")
+
+        doc = {
+            "_id": template_id,
+            "object_key": object_key,
+            "etag": etag,
+            "options": dict(options),
+            "trainer": trainer,
+            "status": "ready",
+            "version": TEMPLATE_VERSION,
+            "frames": len(landmarks),
+            "fps": landmarks.fps,
+            "probe": probe,
+            "landmarks_key": f"{prefix}landmarks.npz",
+            "angles_key": f"{prefix}angles.npz",
+            "strip_key": f"{prefix}panels.mp4",
+            "created_at": datetime.utcnow(),
+        }
+        self.collection.replace_one({"_id": template_id}, doc, upsert=True)
+        logger.info(f"Referência {object_key} pré-computada ({len(landmarks)} frames)", extra={"reference_id": template_id})
+        return doc, sent
@@ -0,0 +1,105 @@
+import logging
+import shutil
+import subprocess
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Presets de container: faststart move o moov para o início (download progressivo);
+# fragmented gera MP4 fragmentado, reproduzível antes de o arquivo terminar.
+MOVFLAGS = {
+    "faststart": "+faststart",
+    "fragmented": "frag_keyframe+empty_moov+default_base_moof",
+}
+
+
+def find_ffmpeg():
+    """Binário do ffmpeg: o empacotado pelo imageio-ffmpeg ou o do PATH (None se não houver)."""
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        return shutil.which("ffmpeg")
+
+
+class VideoEncoder:
+    """
+    Codifica frames BGR (uint8, altura x largura x 3) à medida que são produzidos,
+    sem manter a lista de frames em memória.
+    Usa ffmpeg/libx264 via stdin (preset, CRF e movflags configuráveis); sem ffmpeg,
+    cai para cv2.VideoWriter (mp4v).
+    """
+
+    def __init__(self, path, size, fps=30, preset="veryfast", crf=23, movflags="faststart"):
+        self.path = path
+        self.size = size  # (largura, altura)
+        self.fps = fps
+        self.frames_written = 0
+        self._proc = None
+        self._writer = None
+
+        ffmpeg = find_ffmpeg()
+        if ffmpeg:
+            width, height = size
+            command = [
+                ffmpeg, "-y", "-loglevel", "error",
+                "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-r", str(fps),
+                "-i", "-",
+                "-an", "-c:v", "libx264", "-preset", preset, "-crf", str(crf), "-pix_fmt", "yuv420p",
+                "-movflags", MOVFLAGS.get(movflags, movflags),
+                path,
+            ]
+            self._proc = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+        else:
+            logger.warning("ffmpeg não encontrado; usando cv2.VideoWriter (mp4v).")
+            self._writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, size)
+            if not self._writer.isOpened():
+                raise IOError(f"VideoWriter não abriu corretamente para {path}")
+
+    def write(self, frame):
+        if self._proc:
+            try:
+                self._proc.stdin.write(memoryview(np.ascontiguousarray(frame)))
+            except BrokenPipeError:
+                raise IOError(f"ffmpeg encerrou inesperadamente: {self._stderr()}")
+        else:
+            self._writer.write(frame)
+        self.frames_written += 1
+
+    def _stderr(self):
+        self._proc.wait()
+        return self._proc.stderr.read().decode("utf-8", "replace").strip()
+
+    def close(self):
+        """Finaliza o arquivo e retorna o caminho."""
+        if self._proc:
+            self._proc.stdin.close()
+            if self._proc.wait() != 0:
+                raise IOError(f"ffmpeg falhou (código {self._proc.returncode}): {self._stderr()}")
+            self._proc.stderr.close()
+            self._proc = None
+        elif self._writer is not None:
+            self._writer.release()
+            self._writer = None
+        return self.path
+
+    def abort(self):
+        if self._proc:
+            self._proc.kill()
+            self._proc.wait()
+            self._proc = None
+        elif self._writer is not None:
+            self._writer.release()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
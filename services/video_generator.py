@@ -1,111 +1,209 @@
+import logging
 import cv2
 import numpy as np
-import mediapipe as mp
 import os
 import tempfile
-from mediapipe.framework.formats import landmark_pb2
-
-mp_drawing = mp.solutions.drawing_utils
-mp_pose = mp.solutions.pose
-
-def draw_landmarks_on_frame(frame, landmarks_list):
-    if landmarks_list:
-        mp_landmarks = landmark_pb2.NormalizedLandmarkList(landmark=landmarks_list)
-        mp_drawing.draw_landmarks(
-            frame,
-            mp_landmarks,
-            mp_pose.POSE_CONNECTIONS,
-            landmark_drawing_spec=mp_drawing.DrawingSpec(color=(0, 255, 0), thickness=2, circle_radius=2),
-            connection_drawing_spec=mp_drawing.DrawingSpec(color=(0, 0, 255), thickness=2, circle_radius=2)
-        )
-    return frame
-
-from moviepy.editor import ImageSequenceClip
-
-def generate_comparative_video(frames_ref, landmarks_ref, frames_exec, landmarks_exec):
+
+from services.frame_source import PANEL_SIZE
+from services.pose_analyzer import JOINT_INDICES
+from services.video_encoder import VideoEncoder
+from utils.r2_utils import upload_file
+
+logger = logging.getLogger(__name__)
+
+# Mesmas conexões de mp.solutions.pose.POSE_CONNECTIONS, como array de índices (K, 2)
+POSE_CONNECTIONS = np.array([
+    (0, 1), (0, 4), (1, 2), (2, 3), (3, 7), (4, 5), (5, 6), (6, 8), (9, 10), (11, 12),
+    (11, 13), (11, 23), (12, 14), (12, 24), (13, 15), (14, 16), (15, 17), (15, 19), (15, 21),
+    (16, 18), (16, 20), (16, 22), (17, 19), (18, 20), (23, 24), (23, 25), (24, 26), (25, 27),
+    (26, 28), (27, 29), (27, 31), (28, 30), (28, 32), (29, 31), (30, 32),
+], dtype=np.intp)
+
+# Cores em BGR, como no DrawingSpec usado antes com o mp_drawing
+LANDMARK_COLOR = (0, 255, 0)
+CONNECTION_COLOR = (0, 0, 255)
+VISIBILITY_THRESHOLD = 0.5
+# Erro angular (graus) a partir do qual a articulação fica totalmente vermelha
+MAX_ERROR_COLOR = 30.0
+
+def _error_colors(joint_errors):
+    """Cor BGR por articulação de JOINTS, de verde (0°) a vermelho (>= MAX_ERROR_COLOR)."""
+    level = np.clip(np.nan_to_num(np.asarray(joint_errors, dtype=np.float32)) / MAX_ERROR_COLOR, 0.0, 1.0)
+    return [(0, int(255 * (1 - t)), int(255 * t)) for t in level]
+
+def draw_pose(panel, pose, joint_errors=None):
+    """
+    Desenha o esqueleto de uma pose (array (33, 4) de uma PoseSequence) direto no painel,
+    já na resolução final. Todos os ossos saem de uma única chamada a cv2.polylines.
+    Com joint_errors (um erro por articulação de JOINTS), o vértice de cada articulação
+    é colorido conforme o erro.
+    """
+    if pose is None or not len(pose):
+        return panel
+
+    height, width = panel.shape[:2]
+    points = np.empty((len(pose), 2), dtype=np.int32)
+    points[:, 0] = pose[:, 0] * width
+    points[:, 1] = pose[:, 1] * height
+    visible = (
+        (pose[:, 3] >= VISIBILITY_THRESHOLD)
+        & (pose[:, 0] >= 0) & (pose[:, 0] <= 1)
+        & (pose[:, 1] >= 0) & (pose[:, 1] <= 1)
+    )
+
+    bones = POSE_CONNECTIONS[visible[POSE_CONNECTIONS[:, 0]] & visible[POSE_CONNECTIONS[:, 1]]]
+    if len(bones):
+        cv2.polylines(panel, points[bones], False, CONNECTION_COLOR, 2)
+
+    for x, y in points[visible]:
+        cv2.circle(panel, (int(x), int(y)), 2, LANDMARK_COLOR, 2)
+
+    if joint_errors is not None:
+        for vertex, color in zip(JOINT_INDICES[:, 1], _error_colors(joint_errors)):
+            if visible[vertex]:
+                cv2.circle(panel, tuple(int(v) for v in points[vertex]), 6, color, -1)
+    return panel
+
+def draw_landmarks_on_frame(frame, pose):
+    """Desenha o esqueleto de uma pose sobre o frame (na resolução do próprio frame)."""
+    return draw_pose(frame, pose)
+
+def _fill_panel(panel, frame):
+    """Copia o frame para o painel, reduzindo direto no buffer de destino quando necessário."""
+    if frame.shape[:2] == panel.shape[:2]:
+        np.copyto(panel, frame)
+    else:
+        cv2.resize(frame, (panel.shape[1], panel.shape[0]), dst=panel, interpolation=cv2.INTER_LINEAR)
+
+class ComparativeVideoWriter:
+    """
+    Canvas lado a lado (referência | execução) ligado a um VideoEncoder: cada par
+    de frames é reduzido, desenhado e codificado assim que chega, então serve
+    tanto para listas de frames quanto para pares produzidos em streaming.
+    """
+
+    def __init__(self, output_path, fps=30, encoder_options=None):
+        target_width, target_height = PANEL_SIZE
+        self.canvas = np.zeros((target_height, target_width * 2, 3), dtype=np.uint8)
+        self.panel_ref = self.canvas[:, :target_width]
+        self.panel_exec = self.canvas[:, target_width:]
+        self.encoder = VideoEncoder(output_path, (target_width * 2, target_height), fps=fps, **(encoder_options or {}))
+
+    @property
+    def frames_written(self):
+        return self.encoder.frames_written
+
+    def draw(self, frame_ref, pose_ref, frame_exec, pose_exec, joint_errors=None):
+        """Monta o par no canvas; joint_errors (um por articulação) colore o painel de execução."""
+        _fill_panel(self.panel_ref, frame_ref)
+        _fill_panel(self.panel_exec, frame_exec)
+        draw_pose(self.panel_ref, pose_ref)
+        draw_pose(self.panel_exec, pose_exec, joint_errors)
+
+    def encode(self):
+        self.encoder.write(self.canvas)
+
+    def write(self, frame_ref, pose_ref, frame_exec, pose_exec, joint_errors=None):
+        self.draw(frame_ref, pose_ref, frame_exec, pose_exec, joint_errors)
+        self.encode()
+
+    def close(self):
+        return self.encoder.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return self.encoder.__exit__(exc_type, exc, tb)
+
+def _frame_pairs(n_ref, n_exec, pairs=None):
+    """Pares (ref, exec) a renderizar: os do alinhamento, ou frame a frame repetindo o último do mais curto."""
+    if pairs is not None:
+        return [(int(i), int(j)) for i, j in pairs]
+    return [(min(i, n_ref - 1), min(i, n_exec - 1)) for i in range(max(n_ref, n_exec))]
+
+def generate_comparative_video(frames_ref, landmarks_ref, frames_exec, landmarks_exec, pairs=None,
+                               output_path=None, fps=30, encoder_options=None, joint_errors=None,
+                               draw_reference=True):
+    """
+    Gera o vídeo lado a lado (referência | execução) codificando cada frame assim que é
+    montado. Cada frame é reduzido primeiro e desenhado depois, direto num canvas
+    pré-alocado. Retorna o caminho do MP4 gerado (output_path ou um arquivo temporário) ou None.
+    encoder_options vai para VideoEncoder (preset, crf, movflags); joint_errors (P, J),
+    um erro por par renderizado, colore as articulações do painel de execução.
+    draw_reference=False usa os frames de referência como vêm (painéis já anotados).
+    """
     if len(frames_ref) == 0 or len(frames_exec) == 0:
-        print("[ERRO] Lista de frames vazia.")
+        logger.error("Lista de frames vazia.")
         return None
 
-    target_width = 480
-    target_height = 270
-    min_frames = max(len(frames_ref), len(frames_exec))
-    combined_frames = []
-
-    for i in range(min_frames):
-        try:
-            frame_ref = frames_ref[i] if i < len(frames_ref) else frames_ref[-1]
-            frame_exec = frames_exec[i] if i < len(frames_exec) else frames_exec[-1]
-            landmark_ref = landmarks_ref[i] if i < len(landmarks_ref) else landmarks_ref[-1]
-            landmark_exec = landmarks_exec[i] if i < len(landmarks_exec) else landmarks_exec[-1]
-
-            frame_ref = draw_landmarks_on_frame(frame_ref.copy(), landmark_ref)
-            frame_exec = draw_landmarks_on_frame(frame_exec.copy(), landmark_exec)
-
-            frame_ref = cv2.resize(frame_ref, (target_width, target_height))
-            frame_exec = cv2.resize(frame_exec, (target_width, target_height))
-
-            combined = np.hstack((frame_ref, frame_exec))
-            combined_rgb = cv2.cvtColor(combined, cv2.COLOR_BGR2RGB)
-            combined_frames.append(combined_rgb)
-        except Exception as e:
-            print(f"[ERRO] Erro ao processar frame {i}: {e}")
-
-    # Cria arquivo temporário seguro
-    temp_file = tempfile.NamedTemporaryFile(suffix=".mp4", delete=False)
-    temp_output_path = temp_file.name
-    temp_file.close()
+    if output_path is None:
+        # Cria arquivo temporário seguro
+        temp_file = tempfile.NamedTemporaryFile(suffix=".mp4", delete=False)
+        output_path = temp_file.name
+        temp_file.close()
 
     try:
-        print(f"[INFO] Gerando vídeo com MoviePy: {temp_output_path}")
-        clip = ImageSequenceClip(combined_frames, fps=30)
-        clip.write_videofile(temp_output_path, codec="libx264", audio=False, logger=None)
-        print(f"[INFO] Vídeo gerado com sucesso: {temp_output_path}")
+        logger.info(f"Gerando vídeo: {output_path}")
+        with ComparativeVideoWriter(output_path, fps, encoder_options) as writer:
+            for i, (i_ref, i_exec) in enumerate(_frame_pairs(len(frames_ref), len(frames_exec), pairs)):
+                try:
+                    landmark_ref = None
+                    if draw_reference:
+                        landmark_ref = landmarks_ref[i_ref] if i_ref < len(landmarks_ref) else landmarks_ref[-1]
+                    landmark_exec = landmarks_exec[i_exec] if i_exec < len(landmarks_exec) else landmarks_exec[-1]
+                    errors = None
+                    if joint_errors is not None and len(joint_errors):
+                        errors = joint_errors[min(i, len(joint_errors) - 1)]
+
+                    writer.draw(frames_ref[i_ref], landmark_ref, frames_exec[i_exec], landmark_exec, errors)
+                except Exception as e:
+                    logger.error(f"Erro ao processar frame {i}: {e}")
+                    continue
+                writer.encode()
+        logger.info(f"Vídeo gerado com sucesso: {output_path} ({writer.frames_written} frames)")
     except Exception as e:
-        print(f"[ERRO] Falha ao gerar vídeo com MoviePy: {e}")
+        logger.error(f"Falha ao gerar vídeo: {e}")
+        if os.path.exists(output_path):
+            os.remove(output_path)
         return None
 
-    if not os.path.exists(temp_output_path):
-        print("[ERRO] Vídeo não foi gerado no caminho esperado.")
+    if not os.path.exists(output_path) or writer.frames_written == 0:
+        logger.error("Vídeo não foi gerado no caminho esperado.")
         return None
 
-    try:
-        with open(temp_output_path, "rb") as f:
-            video_bytes = f.read()
-        os.remove(temp_output_path)
-        return video_bytes
-    except Exception as e:
-        print(f"[ERRO] Falha ao ler ou apagar o vídeo gerado: {e}")
-        return None
+    return output_path
 
-def save_and_upload_comparative_video(frames_ref, landmarks_ref, frames_exec, landmarks_exec, upload_path, s3_client, bucket_name):
-    print("[UPLOAD] Iniciando geração do vídeo comparativo...", flush=True)
+def save_and_upload_comparative_video(frames_ref, landmarks_ref, frames_exec, landmarks_exec, upload_path, s3_client, bucket_name,
+                                      pairs=None, encoder_options=None, joint_errors=None, output_path=None,
+                                      on_uploaded=None, draw_reference=True):
+    logger.info("Iniciando geração do vídeo comparativo...")
 
-    video_bytes = generate_comparative_video(frames_ref, landmarks_ref, frames_exec, landmarks_exec)
+    video_path = generate_comparative_video(
+        frames_ref, landmarks_ref, frames_exec, landmarks_exec, pairs,
+        output_path=output_path, encoder_options=encoder_options, joint_errors=joint_errors,
+        draw_reference=draw_reference
+    )
 
-    if not video_bytes:
-        print("[ERRO] Vídeo não foi gerado corretamente.", flush=True)
+    if not video_path:
+        logger.error("Vídeo não foi gerado corretamente.")
         return None
+    return upload_comparative_video(video_path, upload_path, s3_client, bucket_name, on_uploaded)
 
+def upload_comparative_video(video_path, upload_path, s3_client, bucket_name, on_uploaded=None):
+    """Sobe o MP4 gerado para o R2 e remove o arquivo local. Retorna a chave ou None em caso de falha."""
     try:
-        # Cria um arquivo temporário para armazenar os bytes
-        with tempfile.NamedTemporaryFile(suffix=".mp4", delete=False) as temp_file:
-            temp_file.write(video_bytes)  # Escreve os bytes no arquivo temporário
-            temp_file_path = temp_file.name  # Obtém o caminho do arquivo temporário
-
-        # Agora, use o caminho do arquivo temporário para o upload
-        s3_client.upload_file(
-            Filename=temp_file_path,  # Caminho do arquivo temporário
-            Bucket=bucket_name,
-            Key=upload_path,
-            ExtraArgs={"ContentType": "video/mp4"}
-        )
-        print(f"[UPLOAD] Vídeo enviado com sucesso para {upload_path}", flush=True)
-
-        os.remove(temp_file_path)  # Remove o arquivo temporário após o upload
+        # Sobe o arquivo gerado pelo encoder diretamente, sem cópia intermediária (multipart se for grande)
+        size = upload_file(s3_client, video_path, bucket_name, upload_path, content_type="video/mp4")
+        logger.info(f"Vídeo enviado com sucesso para {upload_path}", extra={"key": upload_path, "bytes": size})
+        if on_uploaded:
+            on_uploaded(size)
         return upload_path
 
     except Exception as e:
-        print(f"[ERRO] Falha ao subir vídeo para R2: {e}", flush=True)
+        logger.error(f"Falha ao subir vídeo para R2: {e}")
         return None
 
+    finally:
+        if os.path.exists(video_path):
+            os.remove(video_path)
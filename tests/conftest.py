@@ -0,0 +1,69 @@
+import os
+
+import mongomock
+import pytest
+
+from benchmarks.standins import LocalS3Client, SyntheticExtractor, make_video, stub_feedback
+from services.job_pipeline import JobContext
+from services.pose_extractor import extraction_options
+
+BUCKET = "tests"
+
+
+@pytest.fixture
+def bucket():
+    return BUCKET
+
+
+@pytest.fixture
+def queue():
+    return mongomock.MongoClient().tests.jobs_fila
+
+
+@pytest.fixture
+def s3(tmp_path):
+    return LocalS3Client(str(tmp_path / "s3"))
+
+
+@pytest.fixture
+def videos(tmp_path, s3):
+    """Sobe um vídeo de referência e um de execução curtos no S3 local; retorna as URLs."""
+    urls = {}
+    for name, seed in (("ref", 1), ("exec", 2)):
+        path = make_video(str(tmp_path / f"{name}.mp4"), 160, 120, 1, seed=seed)
+        with open(path, "rb") as f:
+            s3.put_object(Bucket=BUCKET, Key=f"{name}.mp4", Body=f.read())
+        urls[name] = f"https://r2.local/{BUCKET}/{name}.mp4"
+    return urls
+
+
+@pytest.fixture
+def make_context(s3):
+    """Fábrica de JobContext com stand-ins: extrator sintético e feedback stub."""
+
+    def make(task, feedback_fn=stub_feedback, extractor=None, **kwargs):
+        return JobContext(
+            task, s3, BUCKET, feedback_fn,
+            extraction_pool=extractor or SyntheticExtractor(),
+            extraction_options=extraction_options(max_frames=20),
+            **kwargs,
+        )
+
+    return make
+
+
+@pytest.fixture
+def s3_keys(s3):
+    """Lista as chaves gravadas no S3 local sob um prefixo."""
+
+    def keys(prefix=""):
+        root = os.path.join(s3.root, BUCKET)
+        found = []
+        for directory, _, files in os.walk(root):
+            for name in files:
+                key = os.path.relpath(os.path.join(directory, name), root).replace(os.sep, "/")
+                if key.startswith(prefix):
+                    found.append(key)
+        return sorted(found)
+
+    return keys
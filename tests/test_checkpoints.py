@@ -0,0 +1,88 @@
+import numpy as np
+
+from benchmarks.standins import make_landmarks
+from services.checkpoints import SERIES_ARRAYS, JobCheckpoints
+from services.pose_analyzer import analyze_pose_series, summarize_errors
+
+
+def _stage_results():
+    landmarks_ref, landmarks_exec = make_landmarks(24, seed=1), make_landmarks(20, seed=2)
+    series = analyze_pose_series(landmarks_ref, landmarks_exec, align=True)
+    insights, avg_error, avg_errors = summarize_errors(series)
+    return {
+        "extract": {"landmarks_ref": landmarks_ref, "landmarks_exec": landmarks_exec, "frames_ref": [], "frames_exec": []},
+        "analyze": {"series": series, "insights": insights, "avg_error": avg_error, "avg_errors": avg_errors},
+        "feedback": "feedback",
+        "video": "comparativos/aluno_comparativo.mp4",
+    }
+
+
+def _checkpoints(queue, s3, bucket, job_id):
+    return JobCheckpoints(queue, {"_id": job_id}, s3, bucket, queue.find_one({"_id": job_id}))
+
+
+def test_save_and_restore_across_attempts(queue, s3, bucket):
+    job_id = queue.insert_one({"status": "processing"}).inserted_id
+    stages = _stage_results()
+    checkpoints = _checkpoints(queue, s3, bucket, job_id)
+    for name, result in stages.items():
+        checkpoints.save(name, result)
+
+    # Nova tentativa: só o documento da fila e o R2 sobrevivem
+    assert set(queue.find_one({"_id": job_id})["checkpoint"]) == set(stages)
+    restored = _checkpoints(queue, s3, bucket, job_id)
+    results = restored.restore()
+
+    assert set(results) == {"analyze", "feedback", "video"}
+    assert results["video"] == stages["video"]
+    series, expected = results["analyze"]["series"], stages["analyze"]["series"]
+    for name in SERIES_ARRAYS:
+        np.testing.assert_array_equal(series[name], expected[name])
+    assert series["joints"] == list(expected["joints"])
+    assert results["analyze"]["avg_errors"] == stages["analyze"]["avg_errors"]
+
+    landmarks_ref, landmarks_exec = restored.landmarks()
+    np.testing.assert_array_equal(landmarks_ref.landmarks, stages["extract"]["landmarks_ref"].landmarks)
+    np.testing.assert_array_equal(landmarks_exec.frame_indices, stages["extract"]["landmarks_exec"].frame_indices)
+
+
+def test_clear_removes_arrays(queue, s3, s3_keys, bucket):
+    job_id = queue.insert_one({"status": "processing"}).inserted_id
+    checkpoints = _checkpoints(queue, s3, bucket, job_id)
+    for name, result in _stage_results().items():
+        checkpoints.save(name, result)
+    assert len(s3_keys(f"checkpoints/{job_id}/")) == 3
+
+    checkpoints.clear()
+
+    assert s3_keys(f"checkpoints/{job_id}/") == []
+    assert checkpoints.restore() == {}
+
+
+def test_failed_save_is_only_a_warning(queue, s3, caplog, bucket):
+    job_id = queue.insert_one({"status": "processing"}).inserted_id
+    checkpoints = _checkpoints(queue, s3, bucket, job_id)
+
+    def broken_put(**kwargs):
+        raise OSError("R2 fora do ar")
+
+    s3.put_object = broken_put
+    checkpoints.save("extract", _stage_results()["extract"])
+
+    assert "checkpoint" not in queue.find_one({"_id": job_id})
+    assert checkpoints.landmarks() is None
+    assert "Falha ao gravar checkpoint" in caplog.text
+
+
+def test_missing_arrays_fall_back_to_rerunning(queue, s3, s3_keys, bucket):
+    job_id = queue.insert_one({"status": "processing"}).inserted_id
+    checkpoints = _checkpoints(queue, s3, bucket, job_id)
+    stages = _stage_results()
+    checkpoints.save("extract", stages["extract"])
+    checkpoints.save("analyze", stages["analyze"])
+    for key in s3_keys(f"checkpoints/{job_id}/"):
+        s3.delete_object(Bucket=bucket, Key=key)
+
+    restored = _checkpoints(queue, s3, bucket, job_id)
+    assert "analyze" not in restored.restore()
+    assert restored.landmarks() is None
@@ -0,0 +1,112 @@
+from benchmarks.standins import SyntheticExtractor, stub_feedback
+from services.job_pipeline import SharedReference, process_job, run_job
+from utils.queue_utils import JobLease, claim_next_job
+
+
+class CountingExtractor(SyntheticExtractor):
+    def __init__(self):
+        self.calls = []
+
+    def extract(self, video_path, frame_mode="full", **options):
+        self.calls.append(options.get("max_frames"))
+        return super().extract(video_path, frame_mode, **options)
+
+
+def _insert_job(queue, videos, **fields):
+    return queue.insert_one({
+        "student": "aluno", "ref_path": videos["ref"], "exec_path": videos["exec"], "status": "pending", **fields,
+    }).inserted_id
+
+
+def _fail_once(func, error):
+    state = {"failed": False}
+
+    def wrapper(*args, **kwargs):
+        if not state["failed"]:
+            state["failed"] = True
+            raise error
+        return func(*args, **kwargs)
+
+    return wrapper
+
+
+def test_retry_resumes_only_the_remaining_stages(queue, s3, videos, make_context, s3_keys):
+    job_id = _insert_job(queue, videos)
+    extractor = CountingExtractor()
+    feedback_calls = []
+
+    def feedback(errors):
+        feedback_calls.append(errors)
+        return stub_feedback(errors)
+
+    # Primeira tentativa: o upload do vídeo falha (erro transitório)
+    s3.upload_file = _fail_once(s3.upload_file, OSError("R2 fora do ar"))
+    ctx = make_context(claim_next_job(queue, "w1"), feedback, extractor)
+    status, _ = process_job(queue, ctx, retry_base_seconds=0)
+
+    doc = queue.find_one({"_id": job_id})
+    assert status == "retry" and doc["status"] == "pending"
+    assert {"extract", "analyze", "feedback", "pdf"} <= set(doc["checkpoint"])
+    assert "video" not in doc["checkpoint"]
+    extractions = len(extractor.calls)
+
+    # Segunda tentativa: retoma dos checkpoints, sem nova inferência nem novo feedback
+    ctx = make_context(claim_next_job(queue, "w1"), feedback, extractor)
+    status, metrics = process_job(queue, ctx, retry_base_seconds=0)
+
+    doc = queue.find_one({"_id": job_id})
+    assert status == "done" and doc["status"] == "done"
+    assert set(metrics["stages"]) == {"download", "admit", "extract", "video"}
+    assert len(extractor.calls) == extractions
+    assert len(feedback_calls) == 1
+    assert "checkpoint" not in doc and "error_message" not in doc
+    assert s3_keys(f"checkpoints/{job_id}/") == []
+
+
+def test_terminal_error_drops_checkpoints(queue, s3, videos, make_context, s3_keys):
+    job_id = _insert_job(queue, videos)
+    s3.upload_file = _fail_once(s3.upload_file, OSError("R2 fora do ar"))
+    ctx = make_context(claim_next_job(queue, "w1"))
+    status, _ = process_job(queue, ctx, max_attempts=1)
+
+    doc = queue.find_one({"_id": job_id})
+    assert status == "error" and doc["status"] == "error"
+    assert doc["error_message"].startswith("Etapa 'video' falhou")
+    assert "checkpoint" not in doc
+    assert s3_keys(f"checkpoints/{job_id}/") == []
+
+
+def test_lost_lease_discards_the_result(queue, videos, make_context):
+    job_id = _insert_job(queue, videos)
+    lease = JobLease(queue, job_id, "w1")
+    ctx = make_context(claim_next_job(queue, "w1"))
+
+    def feedback(errors):
+        # Outro worker assume o job no meio do processamento
+        queue.update_one({"_id": job_id}, {"$set": {"worker_id": "w2"}})
+        return stub_feedback(errors)
+
+    ctx.feedback_fn = feedback
+    status, _ = process_job(queue, ctx, lease.owner_filter())
+
+    doc = queue.find_one({"_id": job_id})
+    assert status == "lost"
+    assert doc["status"] == "processing" and doc["worker_id"] == "w2"
+    assert "video_url" not in doc
+
+
+def test_shared_reference_is_reused_only_with_the_same_options(videos, make_context):
+    extractor = CountingExtractor()
+    shared = SharedReference()
+    task = {"_id": 1, "student": "aluno", "ref_path": videos["ref"], "exec_path": videos["exec"]}
+    try:
+        for max_frames in (20, 20, 10):
+            ctx = make_context(task, extractor=extractor, shared_reference=shared, frame_mode="small")
+            ctx.extraction_options = {**ctx.extraction_options, "max_frames": max_frames}
+            results = run_job(ctx)
+            assert len(results["analyze"]["series"]["errors"]) == max_frames
+    finally:
+        shared.close()
+
+    # Referência + execução no primeiro job, só a execução no segundo, as duas de novo no terceiro
+    assert extractor.calls == [20, 20, 20, 10, 10]
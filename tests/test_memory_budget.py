@@ -0,0 +1,24 @@
+from utils.memory_budget import MemoryBudget
+
+
+def test_waits_until_the_reservation_fits():
+    budget = MemoryBudget(100)
+    assert budget.acquire(60)
+    assert not budget.acquire(50, timeout=0.05)
+    budget.release(60)
+    assert budget.acquire(50, timeout=0.05)
+    # Um job maior que o orçamento inteiro só é admitido sozinho
+    budget.release(50)
+    assert budget.acquire(500, timeout=0.05)
+
+
+def test_dead_worker_slot_is_released():
+    budget = MemoryBudget(100, slots=2)
+    # Worker do slot 1 reserva e morre sem devolver
+    budget.bind(1).acquire(90)
+    budget.bind(0)
+    assert not budget.acquire(50, timeout=0.05)
+
+    assert budget.release_slot(1) == 90
+    assert budget.used_bytes == 0
+    assert budget.acquire(50, timeout=0.05)
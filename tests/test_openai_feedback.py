@@ -0,0 +1,112 @@
+import threading
+import time
+
+import mongomock
+import pytest
+
+from utils.openai_feedback import NO_ANALYSIS_FEEDBACK, FeedbackService, StubFeedbackBackend, error_signature
+
+ERRORS = {"Joelho Esquerdo": 12.3, "Cotovelo Direito": 4.0}
+
+
+class BlockingBackend(StubFeedbackBackend):
+    """Segura a chamada até `release` ser sinalizado, para simular pedidos simultâneos."""
+
+    def __init__(self, error=None):
+        super().__init__()
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.error = error
+
+    def complete(self, joint_errors):
+        self.started.set()
+        self.release.wait(5)
+        if self.error is not None:
+            self.calls += 1
+            raise self.error
+        return super().complete(joint_errors)
+
+
+def _concurrent(service, n, errors=ERRORS):
+    results, failures = [], []
+
+    def call():
+        try:
+            results.append(service.get_feedback(errors))
+        except Exception as e:
+            failures.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(n)]
+    for thread in threads:
+        thread.start()
+    return threads, results, failures
+
+
+def _wait_for_waiters(backend):
+    backend.started.wait(5)
+    # Dá tempo para os demais pedidos encontrarem o voo em andamento
+    time.sleep(0.2)
+
+
+def test_identical_concurrent_requests_share_one_backend_call():
+    backend = BlockingBackend()
+    # Sem LRU: um pedido que chegasse depois do voo chamaria o backend de novo
+    service = FeedbackService(backend, cache_size=0)
+    threads, results, failures = _concurrent(service, 8)
+    _wait_for_waiters(backend)
+    backend.release.set()
+    for thread in threads:
+        thread.join()
+
+    assert not failures
+    assert backend.calls == 1
+    assert len(results) == 8 and len(set(results)) == 1
+
+
+def test_similar_errors_hit_the_lru():
+    backend = StubFeedbackBackend()
+    service = FeedbackService(backend)
+    feedback = service.get_feedback(ERRORS)
+
+    assert service.get_feedback({"Joelho Esquerdo": 11.0, "Cotovelo Direito": 5.5}) == feedback
+    assert backend.calls == 1
+
+
+def test_failure_reaches_all_waiters_and_is_not_cached():
+    backend = BlockingBackend(error=ConnectionError("OpenAI fora do ar"))
+    service = FeedbackService(backend)
+    threads, results, failures = _concurrent(service, 4)
+    _wait_for_waiters(backend)
+    backend.release.set()
+    for thread in threads:
+        thread.join()
+
+    assert not results and len(failures) == 4
+    assert all(isinstance(e, ConnectionError) for e in failures)
+    backend.error = None
+    assert service.get_feedback(ERRORS).startswith("Feedback automático")
+
+
+def test_shared_cache_is_reused_across_services():
+    collection = mongomock.MongoClient().tests.feedback_cache
+    first, second = StubFeedbackBackend(), StubFeedbackBackend()
+    feedback = FeedbackService(first, collection=collection).get_feedback(ERRORS)
+
+    assert FeedbackService(second, collection=collection).get_feedback(ERRORS) == feedback
+    assert (first.calls, second.calls) == (1, 0)
+
+
+def test_signature_ignores_nan_joints_and_quantizes():
+    with_nan = {**ERRORS, "Quadril Direito": float("nan")}
+    assert error_signature(with_nan) == error_signature(ERRORS)
+    assert error_signature({"Joelho Esquerdo": 11.0}) == error_signature({"Joelho Esquerdo": 12.4})
+    assert error_signature(ERRORS, model="a") != error_signature(ERRORS, model="b")
+
+
+@pytest.mark.parametrize("errors", [{}, {"Joelho Esquerdo": float("nan"), "Cotovelo Direito": float("nan")}])
+def test_no_finite_errors_skips_cache_and_backend(errors):
+    backend = StubFeedbackBackend()
+    service = FeedbackService(backend)
+
+    assert service.get_feedback(errors) == NO_ANALYSIS_FEEDBACK
+    assert backend.calls == 0 and not service._lru
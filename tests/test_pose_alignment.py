@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from services.pose_alignment import _band_limits, dtw_align
+
+
+def _brute_force_dtw(x, y, limits=None):
+    """DTW de referência, matriz cheia O(N·M); com `limits`, só as células dentro da banda."""
+    n, m = len(x), len(y)
+    cost = np.full((n + 1, m + 1), np.inf)
+    cost[0, 0] = 0.0
+    for i in range(n):
+        lo, hi = limits[i] if limits else (0, m)
+        for j in range(lo, hi):
+            local = np.abs(x[i] - y[j]).mean()
+            cost[i + 1, j + 1] = local + min(cost[i, j], cost[i, j + 1], cost[i + 1, j])
+    return cost[n, m]
+
+
+def _path_cost(x, y, path):
+    return sum(np.abs(x[i] - y[j]).mean() for i, j in path)
+
+
+def _assert_valid_path(path, n, m):
+    assert path[0].tolist() == [0, 0]
+    assert path[-1].tolist() == [n - 1, m - 1]
+    steps = np.diff(path, axis=0)
+    assert ((steps >= 0) & (steps <= 1)).all()
+    assert (steps.sum(axis=1) >= 1).all()
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_full_band_matches_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    n, m = rng.integers(1, 30, size=2)
+    x, y = rng.normal(size=(n, 4)), rng.normal(size=(m, 4))
+
+    path, cost = dtw_align(x, y, band=max(n, m))
+
+    _assert_valid_path(path, n, m)
+    expected = _brute_force_dtw(x, y)
+    assert _path_cost(x, y, path) == pytest.approx(expected)
+    assert cost * len(path) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_banded_matches_brute_force_inside_the_band(seed):
+    rng = np.random.default_rng(100 + seed)
+    n, m = rng.integers(2, 40, size=2)
+    band = int(rng.integers(1, 6))
+    x, y = rng.normal(size=(n, 3)), rng.normal(size=(m, 3))
+
+    path, cost = dtw_align(x, y, band=band)
+
+    _assert_valid_path(path, n, m)
+    limits = _band_limits(n, m, band)
+    assert all(limits[i][0] <= j < limits[i][1] for i, j in path)
+    assert cost * len(path) == pytest.approx(_brute_force_dtw(x, y, limits))
+
+
+def test_time_shifted_sequence_aligns_on_the_shift():
+    t = np.linspace(0, 4 * np.pi, 60)
+    x = np.sin(t)[:, None]
+    y = np.concatenate([np.zeros(10), np.sin(t)])[:, None]
+
+    path, cost = dtw_align(x, y, band=15)
+
+    assert cost == pytest.approx(0.0, abs=0.05)
+    assert {j - i for i, j in path if i > 5} == {10}
+
+
+def test_nan_angles_do_not_break_alignment_and_empty_inputs():
+    x = np.array([[1.0, np.nan], [2.0, np.nan], [3.0, 1.0]])
+    path, cost = dtw_align(x, x)
+    assert np.isfinite(cost)
+    assert path.tolist() == [[0, 0], [1, 1], [2, 2]]
+
+    path, cost = dtw_align(np.empty((0, 2)), x)
+    assert path.shape == (0, 2) and cost == 0.0
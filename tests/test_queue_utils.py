@@ -0,0 +1,111 @@
+import time
+from datetime import datetime, timedelta
+
+from utils.queue_utils import JobLease, JobScheduler, claim_next_job, ensure_queue_indexes
+
+T0 = datetime(2024, 1, 1)
+
+
+def _job(queue, trainer, ref_path, seconds, **fields):
+    return queue.insert_one({
+        "status": "pending", "trainer": trainer, "ref_path": ref_path,
+        "created_at": T0 + timedelta(seconds=seconds), **fields,
+    }).inserted_id
+
+
+def _claimed(batch):
+    return [(job["trainer"], job["ref_path"]) for job in batch]
+
+
+def test_claim_respects_priority_then_age(queue):
+    ensure_queue_indexes(queue)
+    _job(queue, "A", "r1", 0)
+    _job(queue, "B", "r2", 10)
+    urgent = _job(queue, "C", "r3", 20, priority=5)
+
+    scheduler = JobScheduler(queue, "w1", batch_size=1)
+    assert [job["_id"] for job in scheduler.claim()] == [urgent]
+    assert _claimed(scheduler.claim()) == [("A", "r1")]
+    assert _claimed(scheduler.claim()) == [("B", "r2")]
+    assert scheduler.claim() == []
+
+
+def test_fair_share_serves_the_tenant_with_fewer_running_jobs(queue):
+    for i in range(5):
+        _job(queue, "A", f"a{i}", i)
+    _job(queue, "B", "b0", 100)
+
+    first = JobScheduler(queue, "w1", batch_size=1).claim()
+    second = JobScheduler(queue, "w2", batch_size=1).claim()
+
+    # A tem o job mais antigo, mas já tem um em execução: B é atendido antes do segundo de A
+    assert _claimed(first) == [("A", "a0")]
+    assert _claimed(second) == [("B", "b0")]
+
+
+def test_batch_groups_same_reference_without_spending_attempts(queue):
+    for i in range(4):
+        _job(queue, "A", "r1", i)
+    _job(queue, "A", "r2", 10)
+    _job(queue, "B", "r1", 20)
+
+    batch = JobScheduler(queue, "w1", batch_size=3).claim()
+
+    assert _claimed(batch) == [("A", "r1")] * 3
+    assert [job.get("attempts") for job in batch] == [1, None, None]
+    assert all(job["status"] == "processing" and job["worker_id"] == "w1" for job in batch)
+
+    # A tentativa dos extras só conta quando eles começam
+    started = JobLease(queue, batch[1]["_id"], "w1").start_attempt()
+    assert started["attempts"] == 1
+
+
+def test_retry_waits_for_not_before_and_expired_leases_are_reclaimed(queue):
+    now = datetime.utcnow()
+    _job(queue, "A", "r1", 0, not_before=now + timedelta(hours=1))
+    stuck = queue.insert_one({
+        "status": "processing", "worker_id": "morto", "lease_expires_at": now - timedelta(seconds=1), "attempts": 1,
+    }).inserted_id
+
+    task = claim_next_job(queue, "w1")
+
+    assert task["_id"] == stuck and task["worker_id"] == "w1" and task["attempts"] == 2
+    assert claim_next_job(queue, "w1") is None
+
+
+def test_lanes_only_see_their_own_jobs(queue):
+    _job(queue, "A", "r1", 0, lane="large")
+    default_job = _job(queue, "A", "r2", 10)
+
+    assert [job["_id"] for job in JobScheduler(queue, "w1", lane="default").claim()] == [default_job]
+    assert _claimed(JobScheduler(queue, "w2", lane="large").claim()) == [("A", "r1")]
+
+
+def test_lease_renewal_detects_a_lost_lease(queue):
+    job_id = _job(queue, "A", "r1", 0)
+    claim_next_job(queue, "w1", lease_seconds=60)
+    lease = JobLease(queue, job_id, "w1", lease_seconds=60)
+
+    assert lease.renew() and not lease.lost.is_set()
+
+    # Outro worker reivindica o job (ex.: este travou e o lease expirou)
+    queue.update_one({"_id": job_id}, {"$set": {"worker_id": "w2"}})
+
+    assert not lease.renew()
+    assert lease.lost.is_set()
+    assert queue.update_one(lease.owner_filter(), {"$set": {"status": "done"}}).matched_count == 0
+    assert lease.start_attempt() is None
+
+
+def test_heartbeat_flags_the_lost_lease(queue):
+    job_id = _job(queue, "A", "r1", 0)
+    claim_next_job(queue, "w1")
+
+    with JobLease(queue, job_id, "w1", heartbeat_interval=0.02) as lease:
+        queue.update_one({"_id": job_id}, {"$set": {"worker_id": "w2"}})
+        assert lease.lost.wait(2)
+
+    with JobLease(queue, job_id, "w2", lease_seconds=60, heartbeat_interval=0.02) as lease:
+        time.sleep(0.1)
+        assert not lease.lost.is_set()
+    assert queue.find_one({"_id": job_id})["lease_expires_at"] > datetime.utcnow() + timedelta(seconds=50)
@@ -0,0 +1,85 @@
+import threading
+
+import pytest
+
+from utils.stage_graph import Stage, StageFailed, StageGraph
+
+
+def _recording_graph(calls, fail=None):
+    """Mesma forma do grafo do job: download -> extract -> analyze -> (feedback, video) -> pdf."""
+    lock = threading.Lock()
+
+    def stage(name):
+        def func(ctx, results):
+            with lock:
+                calls.append(name)
+            if name == fail:
+                raise RuntimeError(f"{name} quebrou")
+            return name
+
+        return func
+
+    return StageGraph([
+        Stage("download", stage("download")),
+        Stage("extract", stage("extract"), deps=["download"]),
+        Stage("analyze", stage("analyze"), deps=["extract"]),
+        Stage("feedback", stage("feedback"), deps=["analyze"]),
+        Stage("video", stage("video"), deps=["extract", "analyze"]),
+        Stage("pdf", stage("pdf"), deps=["analyze", "feedback"]),
+    ])
+
+
+def test_runs_stages_after_their_dependencies():
+    calls = []
+    graph = _recording_graph(calls)
+    results = graph.run(None, max_workers=4)
+
+    assert set(results) == set(graph.stages)
+    for name, stage in graph.stages.items():
+        assert all(calls.index(dep) < calls.index(name) for dep in stage.deps)
+    assert graph.order.index("download") == 0
+
+
+def test_rejects_cycles_unknown_and_duplicate_stages():
+    noop = lambda ctx, results: None
+    with pytest.raises(ValueError, match="Ciclo"):
+        StageGraph([Stage("a", noop, deps=["b"]), Stage("b", noop, deps=["a"])])
+    with pytest.raises(ValueError, match="inexistentes"):
+        StageGraph([Stage("a", noop, deps=["x"])])
+    with pytest.raises(ValueError, match="duplicada"):
+        StageGraph([Stage("a", noop), Stage("a", noop)])
+
+
+@pytest.mark.parametrize("completed, expected", [
+    (set(), {"download", "extract", "analyze", "feedback", "video", "pdf"}),
+    # Vídeo pendente: precisa dos frames, então download e extract rodam de novo
+    ({"analyze", "feedback", "pdf"}, {"download", "extract", "video"}),
+    # Só o PDF pendente: nada a montante precisa rodar
+    ({"analyze", "feedback", "video"}, {"pdf"}),
+    ({"download", "extract", "analyze", "feedback", "video", "pdf"}, set()),
+])
+def test_needed_skips_stages_that_only_feed_completed_ones(completed, expected):
+    assert _recording_graph([]).needed(completed) == expected
+
+
+def test_run_restores_results_and_reports_new_stages():
+    calls, completed = [], []
+    restored = {"analyze": "restaurado", "feedback": "restaurado", "pdf": "restaurado"}
+    results = _recording_graph(calls).run(
+        None, results=restored, on_complete=lambda name, result: completed.append(name)
+    )
+
+    assert sorted(calls) == ["download", "extract", "video"]
+    assert sorted(completed) == sorted(calls)
+    assert results["analyze"] == "restaurado"
+    assert results["video"] == "video"
+
+
+def test_failure_stops_new_stages_and_raises_stage_failed():
+    calls = []
+    with pytest.raises(StageFailed) as info:
+        _recording_graph(calls, fail="analyze").run(None)
+
+    assert info.value.stage == "analyze"
+    assert isinstance(info.value.__cause__, RuntimeError)
+    assert not {"feedback", "video", "pdf"} & set(calls)
@@ -0,0 +1,78 @@
+import os
+import shutil
+import tempfile
+from contextlib import ExitStack, contextmanager
+
+# Diretório em memória (tmpfs) para artefatos que precisam de caminho no sistema de arquivos
+TMPFS_DIR = os.getenv("ARTIFACT_TMPFS_DIR", "/dev/shm")
+# Maior arquivo aceito no tmpfs e folga mínima que deve sobrar nele
+TMPFS_MAX_FILE = int(os.getenv("ARTIFACT_TMPFS_MAX_MB", "256")) * 1024 * 1024
+TMPFS_RESERVE = 64 * 1024 * 1024
+# Tamanho assumido quando não se sabe de antemão (ex.: vídeo ainda não codificado)
+DEFAULT_SIZE_HINT = 64 * 1024 * 1024
+
+
+def tmpfs_dir_for(size_hint=None):
+    """Retorna TMPFS_DIR se o arquivo cabe nele com folga; senão None (diretório temporário padrão, em disco)."""
+    size = size_hint or DEFAULT_SIZE_HINT
+    if size > TMPFS_MAX_FILE or not os.path.isdir(TMPFS_DIR) or not os.access(TMPFS_DIR, os.W_OK):
+        return None
+    try:
+        free = shutil.disk_usage(TMPFS_DIR).free
+    except OSError:
+        return None
+    return TMPFS_DIR if free - size > TMPFS_RESERVE else None
+
+
+def tmpfs_resident_bytes(paths):
+    """Bytes que os arquivos ocupam no tmpfs (contam como RAM); arquivos em disco não entram."""
+    tmpfs = os.path.realpath(TMPFS_DIR) + os.sep
+    total = 0
+    for path in paths:
+        if path and os.path.realpath(path).startswith(tmpfs):
+            try:
+                total += os.path.getsize(path)
+            except OSError:
+                pass
+    return total
+
+
+@contextmanager
+def temp_artifact_path(suffix="", size_hint=None):
+    """
+    Caminho temporário para artefatos que precisam de arquivo (OpenCV, ffmpeg).
+    Fica no tmpfs quando cabe e é removido ao sair do bloco, inclusive em caso de erro.
+    """
+    fd, path = tempfile.mkstemp(suffix=suffix, dir=tmpfs_dir_for(size_hint))
+    os.close(fd)
+    try:
+        yield path
+    finally:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class JobArtifacts:
+    """Conjunto de artefatos temporários de um job, todos liberados de uma vez em close()."""
+
+    def __init__(self):
+        self._stack = ExitStack()
+
+    def path(self, suffix="", size_hint=None):
+        return self._stack.enter_context(temp_artifact_path(suffix, size_hint))
+
+    def callback(self, func, *args):
+        """Registra uma liberação extra (ex.: devolver a reserva de memória do job) para close()."""
+        self._stack.callback(func, *args)
+
+    def close(self):
+        self._stack.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
@@ -1,6 +1,8 @@
 from fpdf import FPDF
 import os
 
+from utils.r2_utils import upload_bytes
+
 class PDF(FPDF):
     def header(self):
         self.set_font('Arial', 'B', 14)
@@ -17,9 +19,7 @@ class PDF(FPDF):
         self.multi_cell(0, 10, body)
         self.ln()
 
-def generate_pdf_report(student_name, insights, avg_error, video_url, output_path, full_feedback=None):
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)  # Garante que o diretório existe
-
+def build_pdf_report(student_name, insights, avg_error, video_url, full_feedback=None):
     pdf = PDF()
     pdf.add_page()
 
@@ -41,19 +41,31 @@ def generate_pdf_report(student_name, insights, avg_error, video_url, output_pat
         pdf.chapter_title("⚠️ Vídeo não disponível")
         pdf.chapter_body("O vídeo não pôde ser gerado corretamente.")
 
-    pdf.output(output_path)
+    return pdf
 
-def generate_and_upload_pdf(student_name, insights, avg_error, video_url, output_path_local, output_path_r2, s3_client, bucket_name, full_feedback=None):
-    generate_pdf_report(student_name, insights, avg_error, video_url, output_path_local, full_feedback)
+def generate_pdf_bytes(student_name, insights, avg_error, video_url, full_feedback=None):
+    """Gera o PDF inteiramente em memória."""
+    pdf = build_pdf_report(student_name, insights, avg_error, video_url, full_feedback)
+    return pdf.output(dest='S').encode('latin-1')
 
-    with open(output_path_local, "rb") as f:
-        pdf_bytes = f.read()
+def generate_pdf_report(student_name, insights, avg_error, video_url, output_path, full_feedback=None):
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)  # Garante que o diretório existe
+
+    pdf = build_pdf_report(student_name, insights, avg_error, video_url, full_feedback)
+    pdf.output(output_path)
+
+def generate_and_upload_pdf(student_name, insights, avg_error, video_url, output_path_local, output_path_r2, s3_client, bucket_name, full_feedback=None,
+                            on_uploaded=None):
+    # Sem output_path_local o PDF nunca toca o disco
+    if output_path_local:
+        generate_pdf_report(student_name, insights, avg_error, video_url, output_path_local, full_feedback)
+        with open(output_path_local, "rb") as f:
+            pdf_bytes = f.read()
+    else:
+        pdf_bytes = generate_pdf_bytes(student_name, insights, avg_error, video_url, full_feedback)
 
-    s3_client.put_object(
-        Bucket=bucket_name,
-        Key=output_path_r2,
-        Body=pdf_bytes,
-        ContentType='application/pdf'
-    )
+    upload_bytes(s3_client, pdf_bytes, bucket_name, output_path_r2, content_type='application/pdf')
+    if on_uploaded:
+        on_uploaded(len(pdf_bytes))
 
     return output_path_r2  # Retorna apenas a chave; o frontend já monta a URL completa
@@ -0,0 +1,63 @@
+import multiprocessing
+import time
+
+
+class MemoryBudget:
+    """
+    Orçamento de memória compartilhado pelos processos worker de um host.
+    Cada job reserva a memória estimada antes das etapas pesadas e devolve ao
+    terminar; quando o orçamento está cheio o job espera, o que reduz a
+    concorrência efetiva sob carga de vídeos grandes. Um job maior que o
+    orçamento inteiro só é admitido sozinho. Picklable para processos spawn.
+
+    As reservas ficam por slot de worker (`bind(slot)` em cada processo): quando
+    um worker morre segurando memória (ex.: OOM kill), o pai chama
+    `release_slot(slot)` antes de recriá-lo e os bytes voltam ao orçamento.
+    """
+
+    def __init__(self, total_bytes, slots=1, mp_context=None):
+        ctx = mp_context or multiprocessing.get_context("spawn")
+        self.total_bytes = int(total_bytes)
+        self._reserved = ctx.Array("q", max(int(slots), 1), lock=False)
+        self._cond = ctx.Condition()
+        self.slot = 0
+
+    def bind(self, slot):
+        """Associa as reservas deste processo ao slot de worker `slot`."""
+        if not 0 <= slot < len(self._reserved):
+            raise ValueError(f"Slot {slot} fora do orçamento ({len(self._reserved)} slots)")
+        self.slot = slot
+        return self
+
+    def _used(self):
+        return sum(self._reserved)
+
+    @property
+    def used_bytes(self):
+        with self._cond:
+            return self._used()
+
+    def acquire(self, nbytes, timeout=None):
+        """Reserva `nbytes`; bloqueia até caber (ou até `timeout`). Retorna True se reservou."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._used() and self._used() + nbytes > self.total_bytes:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            self._reserved[self.slot] += nbytes
+            return True
+
+    def release(self, nbytes):
+        with self._cond:
+            self._reserved[self.slot] = max(self._reserved[self.slot] - nbytes, 0)
+            self._cond.notify_all()
+
+    def release_slot(self, slot):
+        """Devolve tudo o que o slot reservou (worker morto); retorna os bytes liberados."""
+        with self._cond:
+            freed = self._reserved[slot]
+            self._reserved[slot] = 0
+            self._cond.notify_all()
+            return freed
@@ -0,0 +1,255 @@
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Buckets (segundos) dos histogramas de duração de etapa e de job
+DURATION_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+COUNTERS = ("bytes_downloaded", "bytes_uploaded", "frames_processed")
+
+
+def peak_rss_bytes():
+    """Pico de memória residente do processo (ru_maxrss vem em KiB no Linux e em bytes no macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def current_rss_bytes():
+    """Memória residente atual do processo, de /proc/self/statm (fora do Linux, o pico)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except (OSError, IndexError, ValueError):
+        return peak_rss_bytes()
+
+
+def process_cpu_seconds():
+    """CPU (usuário + sistema) de todas as threads do processo e dos filhos já finalizados."""
+    total = 0.0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        total += usage.ru_utime + usage.ru_stime
+    return total
+
+
+def pid_cpu_seconds(pid):
+    """CPU acumulada (usuário + sistema) de outro processo vivo, de /proc/<pid>/stat (0 se indisponível)."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, IndexError, ValueError):
+        return 0.0
+
+
+class JobMetrics:
+    """
+    Métricas de um job: tempo de parede, CPU e memória por etapa, mais contadores
+    de I/O e frames. `cpu_seconds` soma todas as threads do processo (extração em
+    streaming, downloads paralelos) e as fontes extras de `cpu_sources` (ex.: os
+    processos do ExtractionPool); com etapas em paralelo, a CPU de uma sobreposição
+    entra nas duas. `thread_cpu_seconds` é só a thread que rodou a etapa.
+    Memória: `rss_delta_bytes` é a variação do RSS atual e `peak_rss_bytes` o pico
+    absoluto do processo (ru_maxrss nunca diminui, então um delta do pico zera
+    depois do primeiro job num worker de longa duração).
+    As etapas rodam em threads paralelas, então o registro é protegido por lock.
+    """
+
+    def __init__(self, cpu_sources=()):
+        self.stages = {}
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self._cpu_sources = tuple(cpu_sources)
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+        self._cpu_start = self._cpu()
+        self._rss_start = current_rss_bytes()
+
+    def _cpu(self):
+        return process_cpu_seconds() + sum(source() for source in self._cpu_sources)
+
+    @contextmanager
+    def stage(self, name):
+        wall = time.perf_counter()
+        cpu = self._cpu()
+        thread_cpu = time.thread_time()
+        rss = current_rss_bytes()
+        try:
+            yield
+        finally:
+            record = {
+                "wall_seconds": round(time.perf_counter() - wall, 4),
+                "cpu_seconds": round(max(self._cpu() - cpu, 0.0), 4),
+                "thread_cpu_seconds": round(time.thread_time() - thread_cpu, 4),
+                "rss_delta_bytes": current_rss_bytes() - rss,
+                "peak_rss_bytes": peak_rss_bytes(),
+            }
+            with self._lock:
+                self.stages[name] = record
+
+    def add(self, counter, value):
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + int(value)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "wall_seconds": round(time.perf_counter() - self._start, 4),
+                "cpu_seconds": round(max(self._cpu() - self._cpu_start, 0.0), 4),
+                "peak_rss_bytes": peak_rss_bytes(),
+                "rss_delta_bytes": current_rss_bytes() - self._rss_start,
+                "stages": {name: dict(record) for name, record in self.stages.items()},
+                **self.counters,
+            }
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels.items()) + "}"
+
+
+class TransferStats:
+    """
+    Bytes, tempo e número de transferências com o R2 por direção ("upload" ou
+    "download"), somados por todas as threads do processo. A vazão média é
+    bytes / segundos (no Prometheus, rate(bytes) / rate(seconds)).
+    """
+
+    DIRECTIONS = ("upload", "download")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = {direction: {"bytes": 0, "seconds": 0.0, "count": 0} for direction in self.DIRECTIONS}
+
+    def record(self, direction, nbytes, seconds):
+        with self._lock:
+            totals = self._totals[direction]
+            totals["bytes"] += nbytes
+            totals["seconds"] += seconds
+            totals["count"] += 1
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                direction: {
+                    **totals,
+                    "bytes_per_second": totals["bytes"] / totals["seconds"] if totals["seconds"] else 0.0,
+                }
+                for direction, totals in self._totals.items()
+            }
+
+
+class MetricsRegistry:
+    """Agrega as métricas dos jobs do processo e as expõe no formato texto do Prometheus."""
+
+    def __init__(self, prefix="worker", transfers=None):
+        self.prefix = prefix
+        self.transfers = transfers
+        self._lock = threading.Lock()
+        self._stage_seconds = {}
+        self._job_seconds = _Histogram(DURATION_BUCKETS)
+        self._jobs = {}
+        self._counters = dict.fromkeys(COUNTERS, 0)
+
+    def observe_job(self, metrics, status):
+        """Registra o dicionário de `JobMetrics.to_dict()` de um job finalizado."""
+        with self._lock:
+            self._jobs[status] = self._jobs.get(status, 0) + 1
+            self._job_seconds.observe(metrics["wall_seconds"])
+            for name, record in metrics["stages"].items():
+                histogram = self._stage_seconds.setdefault(name, _Histogram(DURATION_BUCKETS))
+                histogram.observe(record["wall_seconds"])
+            for counter in COUNTERS:
+                self._counters[counter] += metrics.get(counter, 0)
+
+    def _histogram_lines(self, name, histogram, **labels):
+        lines = []
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            lines.append(f"{name}_bucket{_labels(**labels, le=bound)} {count}")
+        lines.append(f"{name}_bucket{_labels(**labels, le='+Inf')} {histogram.count}")
+        suffix = _labels(**labels) if labels else ""
+        lines.append(f"{name}_sum{suffix} {histogram.sum}")
+        lines.append(f"{name}_count{suffix} {histogram.count}")
+        return lines
+
+    def render(self):
+        p = self.prefix
+        with self._lock:
+            lines = [f"# HELP {p}_jobs_total Jobs finalizados por status.", f"# TYPE {p}_jobs_total counter"]
+            lines += [f"{p}_jobs_total{_labels(status=status)} {count}" for status, count in self._jobs.items()]
+
+            lines += [f"# HELP {p}_job_duration_seconds Duração total do job.",
+                      f"# TYPE {p}_job_duration_seconds histogram"]
+            lines += self._histogram_lines(f"{p}_job_duration_seconds", self._job_seconds)
+
+            lines += [f"# HELP {p}_stage_duration_seconds Duração de cada etapa do job.",
+                      f"# TYPE {p}_stage_duration_seconds histogram"]
+            for stage, histogram in sorted(self._stage_seconds.items()):
+                lines += self._histogram_lines(f"{p}_stage_duration_seconds", histogram, stage=stage)
+
+            for counter in COUNTERS:
+                lines += [f"# TYPE {p}_{counter}_total counter", f"{p}_{counter}_total {self._counters[counter]}"]
+
+        if self.transfers is not None:
+            transfers = self.transfers.to_dict()
+            for metric, field, help_text in (
+                ("r2_transfer_bytes_total", "bytes", "Bytes transferidos com o R2."),
+                ("r2_transfer_seconds_total", "seconds", "Tempo gasto em transferências com o R2."),
+                ("r2_transfers_total", "count", "Transferências com o R2."),
+            ):
+                lines += [f"# HELP {p}_{metric} {help_text}", f"# TYPE {p}_{metric} counter"]
+                lines += [f"{p}_{metric}{_labels(direction=d)} {t[field]}" for d, t in transfers.items()]
+
+        lines += [f"# TYPE {p}_peak_rss_bytes gauge", f"{p}_peak_rss_bytes {peak_rss_bytes()}"]
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path):
+        """Escreve atomicamente para o textfile collector do node_exporter."""
+        directory = os.path.dirname(path) or "."
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+    def serve(self, port, host="0.0.0.0"):
+        """Sobe um endpoint HTTP /metrics numa thread daemon."""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        return server
+
+
+# Registros do processo (cada processo do pool de workers tem os seus)
+TRANSFERS = TransferStats()
+REGISTRY = MetricsRegistry(transfers=TRANSFERS)
@@ -1,12 +1,40 @@
 # personal_comparator/utils/openai_feedback.py
 
-import openai
+import hashlib
+import json
+import logging
+import math
+import threading
+from collections import OrderedDict
+from datetime import datetime
 
-def generate_feedback_via_openai(joint_errors, openai_api_key):
-    openai.api_key = openai_api_key
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "gpt-4"  # Pode usar "gpt-3.5-turbo" para custo mais baixo
+# Erros são agrupados em faixas de 5° para reaproveitar feedback de execuções parecidas
+ERROR_BUCKET_DEGREES = 5
+# Sem nenhum erro finito não há o que analisar: nem cache nem chamada ao modelo
+NO_ANALYSIS_FEEDBACK = (
+    "Não foi possível analisar a execução: nenhuma articulação teve ângulos válidos nos dois vídeos. "
+    "Grave novamente com o corpo inteiro visível e boa iluminação."
+)
+
+
+def _finite_errors(joint_errors):
+    """
+    Só os erros finitos: calculate_angle dá NaN quando dois landmarks coincidem
+    (vetor de comprimento zero), e essas articulações ficam fora do cache e do prompt.
+    """
+    return {joint: float(error) for joint, error in joint_errors.items() if math.isfinite(float(error))}
 
+
+def build_messages(joint_errors):
     # Monta a descrição dos erros
-    errors_description = "\n".join([f"{joint}: diferença de {error:.1f} graus" for joint, error in joint_errors.items()])
+    errors_description = "\n".join(
+        [f"{joint}: diferença de {error:.1f} graus" for joint, error in _finite_errors(joint_errors).items()]
+    )
 
     prompt = f"""
                 Você é um personal trainer especialista.  
@@ -18,14 +46,197 @@ def generate_feedback_via_openai(joint_errors, openai_api_key):
                 Gere recomendações específicas para correções técnicas e posturais, de forma clara e profissional.
                 """
 
-    response = openai.chat.completions.create(
-        model="gpt-4",  # Pode usar "gpt-3.5-turbo" para custo mais baixo
-        messages=[
-            {"role": "system", "content": "Você é um personal trainer especialista."},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0.5,
-        max_tokens=500,
-    )
+    return [
+        {"role": "system", "content": "Você é um personal trainer especialista."},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def error_signature(joint_errors, bucket_degrees=ERROR_BUCKET_DEGREES, model=DEFAULT_MODEL):
+    """Chave do cache: erros por articulação arredondados para faixas de bucket_degrees graus."""
+    buckets = {
+        joint: int(round(error / bucket_degrees)) * bucket_degrees
+        for joint, error in sorted(_finite_errors(joint_errors).items())
+    }
+    payload = json.dumps({"model": model, "errors": buckets}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class OpenAIBackend:
+    """
+    Backend real: um único cliente OpenAI reutilizado, com timeout e retries com backoff
+    exponencial. O cliente só é criado na primeira chamada: sem chave de API, falha
+    apenas a etapa de feedback do job, não a inicialização do worker.
+    """
+
+    def __init__(self, api_key, model=DEFAULT_MODEL, timeout=60.0, max_retries=3):
+        self.model = model
+        self.api_key = api_key
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    @property
+    def client(self):
+        with self._client_lock:
+            if self._client is None:
+                import openai  # import pesado, feito só quando o backend real é usado
+
+                self._client = openai.OpenAI(api_key=self.api_key, timeout=self.timeout, max_retries=self.max_retries)
+            return self._client
+
+    def complete(self, joint_errors):
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=build_messages(joint_errors),
+            temperature=0.5,
+            max_tokens=500,
+        )
+        return response.choices[0].message.content
+
+
+class StubFeedbackBackend:
+    """Backend local e determinístico, para testes e benchmarks sem chamar a API."""
+
+    model = "stub"
+
+    def __init__(self):
+        self.calls = 0
 
-    return response.choices[0].message.content
+    def complete(self, joint_errors):
+        self.calls += 1
+        lines = [f"- {joint}: ajuste de {error:.1f} graus" for joint, error in joint_errors.items()]
+        return "Feedback automático (stub):\n" + "\n".join(lines)
+
+
+class _InFlight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class FeedbackService:
+    """
+    Geração de feedback com cache e deduplicação:
+    - LRU em memória por assinatura quantizada dos erros;
+    - coleção Mongo opcional com TTL, compartilhada entre workers;
+    - single-flight: pedidos idênticos simultâneos esperam a mesma chamada ao backend.
+    """
+
+    def __init__(self, backend, collection=None, cache_size=256, ttl_seconds=30 * 24 * 3600,
+                 bucket_degrees=ERROR_BUCKET_DEGREES):
+        self.backend = backend
+        self.collection = collection
+        self.cache_size = cache_size
+        self.bucket_degrees = bucket_degrees
+        self._lru = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        if collection is not None:
+            self._ensure_ttl_index(ttl_seconds)
+
+    def _ensure_ttl_index(self, ttl_seconds):
+        """
+        Índice TTL do cache no Mongo. Se o índice já existe com outro TTL (mudança de
+        FEEDBACK_CACHE_DAYS), atualiza via collMod; se nem isso der, segue sem o cache no Mongo.
+        """
+        try:
+            self.collection.create_index("created_at", expireAfterSeconds=ttl_seconds)
+            return
+        except OperationFailure as e:
+            logger.info(f"Índice TTL do cache de feedback difere ({e}); atualizando para {ttl_seconds}s.")
+        try:
+            self.collection.database.command(
+                "collMod", self.collection.name,
+                index={"keyPattern": {"created_at": 1}, "expireAfterSeconds": ttl_seconds},
+            )
+        except Exception as e:
+            logger.warning(f"Falha ao atualizar o TTL do cache de feedback ({e}); usando só o cache em memória.")
+            self.collection = None
+
+    def _remember(self, key, feedback):
+        with self._lock:
+            self._lru[key] = feedback
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.cache_size:
+                self._lru.popitem(last=False)
+
+    def _lookup_shared(self, key):
+        if self.collection is None:
+            return None
+        try:
+            doc = self.collection.find_one({"_id": key})
+            return doc["feedback"] if doc else None
+        except Exception as e:
+            logger.warning(f"Falha ao ler cache no Mongo: {e}")
+            return None
+
+    def _store_shared(self, key, feedback):
+        if self.collection is None:
+            return
+        try:
+            self.collection.replace_one(
+                {"_id": key},
+                {"_id": key, "feedback": feedback, "created_at": datetime.utcnow()},
+                upsert=True,
+            )
+        except Exception as e:
+            logger.warning(f"Falha ao gravar cache no Mongo: {e}")
+
+    def get_feedback(self, joint_errors):
+        if not _finite_errors(joint_errors):
+            # Todas as articulações deram NaN: todos esses jobs teriam a mesma assinatura
+            # e receberiam um feedback gerado a partir de um prompt vazio
+            logger.warning("Nenhum erro articular válido; feedback padrão sem chamar o modelo.")
+            return NO_ANALYSIS_FEEDBACK
+        key = error_signature(joint_errors, self.bucket_degrees, getattr(self.backend, "model", None))
+
+        with self._lock:
+            if key in self._lru:
+                self._lru.move_to_end(key)
+                return self._lru[key]
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _InFlight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            feedback = self._lookup_shared(key)
+            if feedback is None:
+                feedback = self.backend.complete(joint_errors)
+                self._store_shared(key, feedback)
+            self._remember(key, feedback)
+            flight.result = feedback
+            return feedback
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.done.set()
+
+
+_default_services = {}
+_default_lock = threading.Lock()
+
+
+def get_feedback_service(openai_api_key):
+    """Serviço padrão (apenas cache em memória) por chave de API, reutilizado entre chamadas."""
+    with _default_lock:
+        service = _default_services.get(openai_api_key)
+        if service is None:
+            service = _default_services[openai_api_key] = FeedbackService(OpenAIBackend(openai_api_key))
+        return service
+
+
+def generate_feedback_via_openai(joint_errors, openai_api_key):
+    return get_feedback_service(openai_api_key).get_feedback(joint_errors)
@@ -0,0 +1,313 @@
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LEASE_SECONDS = 120
+# Campo do job que identifica o tenant (treinador) para o fair share
+DEFAULT_TENANT_FIELD = "trainer"
+# Ordem de atendimento: maior prioridade primeiro, depois o mais antigo (_id desempata)
+JOB_ORDER = [("priority", DESCENDING), ("created_at", ASCENDING), ("_id", ASCENDING)]
+
+
+def make_worker_id():
+    """Gera um identificador único para o worker (host + pid + sufixo aleatório)."""
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+def ensure_queue_indexes(queue, tenant_field=DEFAULT_TENANT_FIELD):
+    """Cria os índices usados pelo claim e pelo scheduler de jobs (idempotente)."""
+    queue.create_index([("status", ASCENDING), ("lease_expires_at", ASCENDING)])
+    queue.create_index([("status", ASCENDING)] + JOB_ORDER[:2])
+    queue.create_index([("status", ASCENDING), (tenant_field, ASCENDING)] + JOB_ORDER[:2])
+    queue.create_index([("status", ASCENDING), ("ref_path", ASCENDING)])
+    queue.create_index([("status", ASCENDING), ("not_before", ASCENDING)])
+
+
+def claimable_filter(now=None):
+    """
+    Jobs 'pending' (cujo `not_before` de retry já passou) ou 'processing' com
+    lease expirado (worker que travou ou morreu).
+    """
+    now = now or datetime.utcnow()
+    return {
+        "$or": [
+            {"status": "pending", "not_before": {"$not": {"$gt": now}}},
+            {"status": "processing", "lease_expires_at": {"$lt": now}},
+        ]
+    }
+
+
+def claim_next_job(queue, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS, query=None, count_attempt=True):
+    """
+    Reivindica atomicamente o próximo job disponível, em ordem de prioridade e
+    criação. `query` restringe os candidatos (ex.: um tenant ou um ref_path).
+    Com count_attempt=False a tentativa não é contada no claim (ver
+    JobLease.start_attempt). Retorna o documento já atualizado ou None.
+    """
+    now = datetime.utcnow()
+    job_filter = claimable_filter(now)
+    if query:
+        job_filter = {"$and": [job_filter, query]}
+    update = {
+        "$set": {
+            "status": "processing",
+            "worker_id": worker_id,
+            "lease_expires_at": now + timedelta(seconds=lease_seconds),
+            "started_at": now,
+        },
+    }
+    if count_attempt:
+        update["$inc"] = {"attempts": 1}
+    return queue.find_one_and_update(
+        job_filter,
+        update,
+        sort=JOB_ORDER,
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+class JobScheduler:
+    """
+    Escolhe os próximos jobs de `jobs_fila` para um worker:
+    - prioridade (`priority`, maior primeiro; sem o campo conta como a menor) e `created_at`;
+    - fair share entre tenants: entre os de mesma prioridade máxima, o tenant com
+      menos jobs em execução é atendido primeiro, então um envio em massa de um
+      treinador não bloqueia os demais;
+    - lote por vídeo de referência: junto com o job escolhido vêm até
+      `batch_size - 1` jobs pendentes do mesmo tenant com o mesmo `ref_path`,
+      para a referência ser baixada e extraída uma vez só. Só o primeiro job do
+      lote tem a tentativa contada no claim; os demais contam em
+      `JobLease.start_attempt()` quando chegam a vez, então um worker que morre no
+      meio do lote não gasta tentativas de jobs que nem começaram;
+    - lanes: a lane padrão pega jobs sem `lane` (ou "default"); workers de outra
+      lane (ex.: "large", para jobs adiados pelo controle de admissão) só pegam a sua.
+    """
+
+    def __init__(self, queue, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS, batch_size=4,
+                 tenant_field=DEFAULT_TENANT_FIELD, lane="default"):
+        self.queue = queue
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.batch_size = max(1, batch_size)
+        self.tenant_field = tenant_field
+        self.lane = lane
+        self.lane_query = {"lane": {"$in": [None, "default"]}} if lane == "default" else {"lane": lane}
+
+    def tenant_order(self):
+        """Tenants com jobs disponíveis, na ordem de atendimento do fair share."""
+        now = datetime.utcnow()
+        tenant = f"${self.tenant_field}"
+        candidates = self.queue.aggregate([
+            {"$match": {"$and": [claimable_filter(now), self.lane_query]}},
+            {"$group": {"_id": tenant, "priority": {"$max": "$priority"}, "oldest": {"$min": "$created_at"}}},
+        ])
+        running = {
+            row["_id"]: row["count"]
+            for row in self.queue.aggregate([
+                {"$match": {"status": "processing", "lease_expires_at": {"$gte": now}}},
+                {"$group": {"_id": tenant, "count": {"$sum": 1}}},
+            ])
+        }
+        candidates = list(candidates)
+        candidates.sort(key=lambda row: row["oldest"] or datetime.max)
+        candidates.sort(key=lambda row: running.get(row["_id"], 0))
+        candidates.sort(key=lambda row: row["priority"] if row["priority"] is not None else float("-inf"), reverse=True)
+        return [row["_id"] for row in candidates]
+
+    def claim(self):
+        """Reivindica o próximo lote (lista de documentos, vazia se a fila estiver vazia)."""
+        task = None
+        for tenant in self.tenant_order():
+            task = claim_next_job(
+                self.queue, self.worker_id, self.lease_seconds, {self.tenant_field: tenant, **self.lane_query}
+            )
+            if task:
+                break
+        if task is None:
+            # Outro worker levou os candidatos entre o aggregate e o claim: tenta a ordem global
+            task = claim_next_job(self.queue, self.worker_id, self.lease_seconds, self.lane_query)
+            if task is None:
+                return []
+
+        batch = [task]
+        if task.get("ref_path"):
+            same_reference = {
+                "ref_path": task["ref_path"], self.tenant_field: task.get(self.tenant_field), **self.lane_query
+            }
+            while len(batch) < self.batch_size:
+                extra = claim_next_job(
+                    self.queue, self.worker_id, self.lease_seconds, same_reference, count_attempt=False
+                )
+                if extra is None:
+                    break
+                batch.append(extra)
+        return batch
+
+
+class JobLease:
+    """
+    Mantém o lease de um job enquanto ele é processado.
+    Uma thread de heartbeat renova `lease_expires_at`; se outro worker tomar
+    o job (lease perdido), `lost` é sinalizado e as escritas finais deixam de
+    casar com o filtro de `owner_filter()`.
+    """
+
+    def __init__(self, queue, job_id, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS, heartbeat_interval=None):
+        self.queue = queue
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.heartbeat_interval = heartbeat_interval or max(1.0, lease_seconds / 3)
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def owner_filter(self):
+        """Filtro que só casa enquanto este worker ainda é dono do job."""
+        return {"_id": self.job_id, "worker_id": self.worker_id, "status": "processing"}
+
+    def start_attempt(self):
+        """
+        Conta a tentativa de um job reivindicado sem contá-la (extras de um lote) no
+        momento em que ele começa. Retorna o documento atualizado, ou None se o lease
+        foi perdido.
+        """
+        task = self.queue.find_one_and_update(
+            self.owner_filter(), {"$inc": {"attempts": 1}}, return_document=ReturnDocument.AFTER
+        )
+        if task is None:
+            self.lost.set()
+        return task
+
+    def renew(self):
+        result = self.queue.update_one(
+            self.owner_filter(),
+            {"$set": {"lease_expires_at": datetime.utcnow() + timedelta(seconds=self.lease_seconds)}},
+        )
+        if result.matched_count == 0:
+            self.lost.set()
+        return not self.lost.is_set()
+
+    def _heartbeat(self):
+        while not self._stop.wait(self.heartbeat_interval):
+            try:
+                if not self.renew():
+                    logger.warning(f"Lease perdido para o job {self.job_id}")
+                    return
+            except Exception as e:
+                logger.warning(f"Falha ao renovar lease do job {self.job_id}: {e}")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._heartbeat, name=f"lease-{self.job_id}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.heartbeat_interval)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+
+class QueueWaker:
+    """
+    Acorda o loop do worker quando surgem jobs novos.
+    Usa um change stream em `jobs_fila` (inserts e updates para status
+    'pending'); quando change streams não estão disponíveis (mongod
+    standalone, stand-ins locais) cai para polling com backoff exponencial.
+    """
+
+    PIPELINE = [
+        {
+            "$match": {
+                "$or": [
+                    {"operationType": "insert"},
+                    {"operationType": "update", "updateDescription.updatedFields.status": "pending"},
+                ]
+            }
+        }
+    ]
+
+    def __init__(self, queue, use_change_stream=True, min_delay=0.5, max_delay=15.0, max_wait=60.0):
+        self.queue = queue
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        # Mesmo com change stream, refaz o claim periodicamente para pegar leases expirados
+        self.max_wait = max_wait
+        self.mode = "polling"
+        self._delay = min_delay
+        self._event = threading.Event()
+        if use_change_stream:
+            self._start_change_stream()
+
+    def _start_change_stream(self):
+        try:
+            stream = self.queue.watch(self.PIPELINE)
+        except (PyMongoError, NotImplementedError, AttributeError, TypeError) as e:
+            logger.warning(f"Change streams indisponíveis ({e}); usando polling com backoff.")
+            return
+        self.mode = "change_stream"
+        threading.Thread(target=self._consume, args=(stream,), name="queue-watch", daemon=True).start()
+        logger.info("Aguardando jobs via change stream.")
+
+    def _consume(self, stream):
+        try:
+            with stream:
+                for _ in stream:
+                    self._event.set()
+        except Exception as e:
+            logger.warning(f"Change stream encerrado ({e}); voltando para polling.")
+        self.mode = "polling"
+        self._event.set()
+
+    def clear(self):
+        """Chamado antes de cada tentativa de claim, para não perder eventos entre o claim e o wait."""
+        self._event.clear()
+
+    def found(self):
+        """Chamado quando um job foi encontrado: zera o backoff do polling."""
+        self._delay = self.min_delay
+
+    def seconds_until_due(self):
+        """
+        Segundos até o `not_before` mais próximo entre os jobs 'pending' em espera de retry
+        (None se não houver). O único evento de um retry chega quando o job volta para
+        'pending', ainda antes do `not_before`, então o wait precisa acordar nesse horário.
+        """
+        now = datetime.utcnow()
+        try:
+            job = self.queue.find_one(
+                {"status": "pending", "not_before": {"$gt": now}}, {"not_before": 1}, sort=[("not_before", ASCENDING)]
+            )
+        except PyMongoError as e:
+            logger.warning(f"Falha ao consultar retries agendados: {e}")
+            return None
+        return max((job["not_before"] - now).total_seconds(), 0.0) if job else None
+
+    def wait(self):
+        """
+        Bloqueia até um evento de job novo (ou o timeout/backoff), sem passar do próximo
+        retry agendado. Retorna True se acordou por evento.
+        """
+        due = self.seconds_until_due()
+        if self.mode == "change_stream":
+            timeout = self.max_wait if due is None else min(self.max_wait, due)
+            return self._event.wait(timeout)
+        time.sleep(self._delay if due is None else min(self._delay, due))
+        self._delay = min(self._delay * 2, self.max_delay)
+        return False
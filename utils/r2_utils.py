@@ -1,24 +1,162 @@
 import boto3
+from boto3.s3.transfer import TransferConfig
 from botocore.client import Config
-import streamlit as st
+import io
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.metrics import TRANSFERS
 
 R2_KEY = os.environ.get("R2_KEY")
 R2_SECRET_KEY = os.environ.get("R2_SECRET_KEY")
 ENDPOINT_URL = os.environ.get("ENDPOINT_URL")
 BUCKET_NAME = os.environ.get("R2_BUCKET_NAME")
 
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024            # 1 MiB por leitura do stream
+RANGED_DOWNLOAD_THRESHOLD = 32 * 1024 * 1024  # acima disso, GETs paralelos por range
+RANGED_PART_SIZE = 8 * 1024 * 1024
+RANGED_MAX_WORKERS = 4
+
+# Pool HTTP do cliente: um cliente por processo, compartilhado por todas as etapas e
+# jobs em paralelo; precisa cobrir jobs simultâneos x partes em paralelo de cada transferência
+R2_MAX_POOL_CONNECTIONS = int(os.environ.get("R2_MAX_POOL_CONNECTIONS", "50"))
+R2_MAX_ATTEMPTS = int(os.environ.get("R2_MAX_ATTEMPTS", "5"))
+R2_CONNECT_TIMEOUT = float(os.environ.get("R2_CONNECT_TIMEOUT", "10"))
+R2_READ_TIMEOUT = float(os.environ.get("R2_READ_TIMEOUT", "60"))
+
+# Uploads acima do limiar vão em multipart, com as partes subindo em paralelo
+MULTIPART_THRESHOLD = int(os.environ.get("R2_MULTIPART_THRESHOLD_MB", "16")) * 1024 * 1024
+MULTIPART_CHUNK_SIZE = int(os.environ.get("R2_MULTIPART_CHUNK_MB", "8")) * 1024 * 1024
+TRANSFER_MAX_CONCURRENCY = int(os.environ.get("R2_TRANSFER_CONCURRENCY", "8"))
+
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=MULTIPART_THRESHOLD,
+    multipart_chunksize=MULTIPART_CHUNK_SIZE,
+    max_concurrency=TRANSFER_MAX_CONCURRENCY,
+    use_threads=True,
+)
+
 
-def get_r2_client(R2_KEY, R2_SECRET_KEY, ENDPOINT_URL):
+def get_r2_client(R2_KEY, R2_SECRET_KEY, ENDPOINT_URL, max_pool_connections=R2_MAX_POOL_CONNECTIONS,
+                  max_attempts=R2_MAX_ATTEMPTS):
+    """
+    Cliente S3 do R2. É thread-safe: crie um por processo e compartilhe entre as
+    etapas, para as conexões (keep-alive) serem reaproveitadas entre jobs. Erros
+    transitórios (throttling, 5xx, timeouts) são repetidos com backoff pelo botocore.
+    """
     return boto3.client(
         's3',
         aws_access_key_id=R2_KEY,
         aws_secret_access_key=R2_SECRET_KEY,
         endpoint_url=ENDPOINT_URL,
-        config=Config(signature_version='s3v4')
+        config=Config(
+            signature_version='s3v4',
+            max_pool_connections=max_pool_connections,
+            tcp_keepalive=True,
+            connect_timeout=R2_CONNECT_TIMEOUT,
+            read_timeout=R2_READ_TIMEOUT,
+            retries={"max_attempts": max_attempts, "mode": "standard"},
+            # Checksums só quando a operação exige: sem corpo aws-chunked nos PUTs (compatível com o R2)
+            request_checksum_calculation="when_required",
+            response_checksum_validation="when_required",
+        )
+    )
+
+def upload_file(client, file_path, bucket, key, content_type=None, config=TRANSFER_CONFIG):
+    """Sobe um arquivo do disco (multipart com partes paralelas acima do limiar). Retorna o tamanho."""
+    size = os.path.getsize(file_path)
+    start = time.perf_counter()
+    client.upload_file(
+        Filename=file_path, Bucket=bucket, Key=key,
+        ExtraArgs={"ContentType": content_type} if content_type else None, Config=config
+    )
+    TRANSFERS.record("upload", size, time.perf_counter() - start)
+    return size
+
+def upload_bytes(client, data, bucket, key, content_type=None, config=TRANSFER_CONFIG):
+    """Como upload_file, para conteúdo já em memória (ex.: o PDF). Retorna o tamanho."""
+    start = time.perf_counter()
+    client.upload_fileobj(
+        io.BytesIO(data), bucket, key,
+        ExtraArgs={"ContentType": content_type} if content_type else None, Config=config
     )
+    TRANSFERS.record("upload", len(data), time.perf_counter() - start)
+    return len(data)
 
 def upload_to_r2(client, file_path, r2_bucket, object_name):
-    
-    with open(file_path, "rb") as f:
-        client.upload_fileobj(f, r2_bucket, object_name)
+    return upload_file(client, file_path, r2_bucket, object_name)
+
+
+def head_object(client, bucket, key):
+    """Verifica a existência do objeto via HEAD e retorna tamanho e ETag (sem baixar o corpo)."""
+    response = client.head_object(Bucket=bucket, Key=key)
+    return {
+        "key": key,
+        "size": response["ContentLength"],
+        "etag": response.get("ETag", "").strip('"'),
+    }
+
+def _write_stream(body, f, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    written = 0
+    for chunk in body.iter_chunks(chunk_size):
+        f.write(chunk)
+        written += len(chunk)
+    return written
+
+def _download_range(client, bucket, key, etag, dest_path, start, end):
+    kwargs = {"Bucket": bucket, "Key": key, "Range": f"bytes={start}-{end}"}
+    if etag:
+        kwargs["IfMatch"] = etag  # garante que todas as partes são da mesma versão
+    body = client.get_object(**kwargs)["Body"]
+    with open(dest_path, "r+b") as f:
+        f.seek(start)
+        return _write_stream(body, f)
+
+def download_to_path(client, bucket, key, dest_path, head=None):
+    """
+    Baixa um objeto do R2 direto para o disco, em chunks.
+    Objetos grandes são divididos em GETs paralelos por range.
+    Retorna os metadados do HEAD (key, size, etag).
+    """
+    head = head or head_object(client, bucket, key)
+    size = head["size"]
+    start = time.perf_counter()
+
+    if size < RANGED_DOWNLOAD_THRESHOLD:
+        kwargs = {"Bucket": bucket, "Key": key}
+        if head["etag"]:
+            kwargs["IfMatch"] = head["etag"]
+        body = client.get_object(**kwargs)["Body"]
+        with open(dest_path, "wb") as f:
+            _write_stream(body, f)
+        TRANSFERS.record("download", size, time.perf_counter() - start)
+        return head
+
+    with open(dest_path, "wb") as f:
+        f.truncate(size)
+    ranges = [(start, min(start + RANGED_PART_SIZE, size) - 1) for start in range(0, size, RANGED_PART_SIZE)]
+    with ThreadPoolExecutor(max_workers=RANGED_MAX_WORKERS) as pool:
+        futures = [
+            pool.submit(_download_range, client, bucket, key, head["etag"], dest_path, start, end)
+            for start, end in ranges
+        ]
+        total = sum(f.result() for f in futures)
+    if total != size:
+        raise IOError(f"Download incompleto de {key}: {total} de {size} bytes")
+    TRANSFERS.record("download", size, time.perf_counter() - start)
+    return head
+
+def head_many(client, bucket, keys):
+    """HEAD de vários objetos em paralelo; retorna os metadados na mesma ordem."""
+    with ThreadPoolExecutor(max_workers=max(1, len(keys))) as pool:
+        return list(pool.map(lambda key: head_object(client, bucket, key), keys))
+
+def download_many(client, bucket, items):
+    """
+    Baixa vários objetos em paralelo. `items` é uma lista de (key, dest_path) ou
+    (key, dest_path, head) quando o HEAD já foi feito; retorna os HEADs na mesma ordem.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, len(items))) as pool:
+        futures = [pool.submit(download_to_path, client, bucket, *item) for item in items]
+        return [f.result() for f in futures]
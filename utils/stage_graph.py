@@ -0,0 +1,131 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class StageFailed(Exception):
+    """Falha de uma etapa do grafo; a exceção original fica em __cause__."""
+
+    def __init__(self, stage, error):
+        super().__init__(f"Etapa '{stage}' falhou: {error}")
+        self.stage = stage
+        self.error = error
+
+
+class Stage:
+    """Etapa do grafo: `func(ctx, results)` roda assim que todas as `deps` terminarem."""
+
+    def __init__(self, name, func, deps=()):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+
+    def __repr__(self):
+        return f"Stage({self.name!r}, deps={list(self.deps)})"
+
+
+class StageGraph:
+    """
+    Grafo de dependências entre etapas, declarado uma vez e executado por job
+    num pool de threads: cada etapa começa assim que suas dependências terminam,
+    então ramos independentes rodam em paralelo.
+    """
+
+    def __init__(self, stages):
+        self.stages = {}
+        for stage in stages:
+            if stage.name in self.stages:
+                raise ValueError(f"Etapa duplicada: {stage.name}")
+            self.stages[stage.name] = stage
+        for stage in self.stages.values():
+            missing = [d for d in stage.deps if d not in self.stages]
+            if missing:
+                raise ValueError(f"Etapa {stage.name} depende de etapas inexistentes: {missing}")
+        self.order = self._topological_order()
+
+    def _topological_order(self):
+        order = []
+        state = {}
+
+        def visit(name):
+            if state.get(name) == "done":
+                return
+            if state.get(name) == "visiting":
+                raise ValueError(f"Ciclo no grafo de etapas envolvendo {name}")
+            state[name] = "visiting"
+            for dep in self.stages[name].deps:
+                visit(dep)
+            state[name] = "done"
+            order.append(name)
+
+        for name in self.stages:
+            visit(name)
+        return order
+
+    @staticmethod
+    def _call(stage, ctx, results, observer):
+        if observer is None:
+            return stage.func(ctx, results)
+        with observer(stage.name):
+            return stage.func(ctx, results)
+
+    def needed(self, completed):
+        """
+        Etapas que ainda precisam rodar dado o conjunto `completed`: as que não
+        terminaram e que são finais ou alimentam alguma etapa que vai rodar.
+        Uma etapa cujos dependentes já estão todos concluídos não roda de novo.
+        """
+        dependents = {name: [] for name in self.stages}
+        for stage in self.stages.values():
+            for dep in stage.deps:
+                dependents[dep].append(stage.name)
+
+        needed = set()
+        for name in reversed(self.order):
+            if name in completed:
+                continue
+            if not dependents[name] or any(d in needed for d in dependents[name]):
+                needed.add(name)
+        return needed
+
+    def run(self, ctx, max_workers=4, results=None, observer=None, on_complete=None):
+        """
+        Executa o grafo e retorna {nome da etapa: resultado}.
+        Etapas já presentes em `results` são consideradas concluídas e não rodam,
+        assim como as que só serviriam a etapas concluídas (retomada de checkpoint).
+        `observer(nome)`, se dado, retorna um context manager que envolve cada
+        etapa na thread em que ela roda (ex.: `JobMetrics.stage`).
+        `on_complete(nome, resultado)` é chamado assim que cada etapa termina com sucesso.
+        Na primeira falha nenhuma etapa nova é iniciada; as que já estão rodando
+        terminam e então StageFailed é lançada.
+        """
+        results = dict(results or {})
+        needed = self.needed(results)
+        pending = [name for name in self.order if name in needed]
+        running = {}
+        failure = None
+
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="stage") as pool:
+            while pending or running:
+                if failure is None:
+                    for name in list(pending):
+                        if all(dep in results for dep in self.stages[name].deps):
+                            running[pool.submit(self._call, self.stages[name], ctx, results, observer)] = name
+                            pending.remove(name)
+
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                        if on_complete:
+                            on_complete(name, results[name])
+                    except Exception as e:
+                        if failure is None:
+                            failure = StageFailed(name, e)
+                            failure.__cause__ = e
+
+        if failure is not None:
+            raise failure
+        return results
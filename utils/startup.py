@@ -0,0 +1,58 @@
+import importlib
+import logging
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Módulos pesados do worker (OpenCV, NumPy, fpdf, boto3, OpenAI), carregados em
+# segundo plano enquanto o loop da fila já está conectado ao Mongo
+WORKER_WARM_UP_MODULES = (
+    "services.job_pipeline",
+    "services.extraction_pool",
+    "services.landmark_cache",
+    "utils.openai_feedback",
+    "openai",
+)
+
+
+def timed_imports(module_names):
+    """
+    Importa os módulos em ordem e retorna {módulo: segundos}. O tempo de cada um
+    inclui só as dependências que ainda não estavam carregadas.
+    """
+    report = {}
+    for name in module_names:
+        if name in sys.modules:
+            report[name] = 0.0
+            continue
+        started = time.perf_counter()
+        importlib.import_module(name)
+        report[name] = round(time.perf_counter() - started, 4)
+    return report
+
+
+def start_warm_up(module_names, then=None):
+    """
+    Carrega os módulos numa thread daemon e depois chama `then()` (ex.: criar
+    clientes e pools). Quem importar um desses módulos antes do fim apenas
+    espera pelo lock de import do Python. Retorna a thread.
+    """
+    def run():
+        started = time.perf_counter()
+        try:
+            imports = timed_imports(module_names)
+            if then:
+                then()
+        except Exception:
+            logger.exception("Falha no warm-up; os módulos serão carregados no primeiro job.")
+            return
+        logger.info(
+            f"Warm-up concluído em {time.perf_counter() - started:.2f}s",
+            extra={"imports": imports, "seconds": round(time.perf_counter() - started, 4)},
+        )
+
+    thread = threading.Thread(target=run, name="warm-up", daemon=True)
+    thread.start()
+    return thread
@@ -1,23 +1,30 @@
-print("[BOOT] Worker iniciado... carregando módulos")
 import time
+_BOOT_STARTED = time.perf_counter()
 import os
+import argparse
+import logging
+import multiprocessing
 import tempfile
+import threading
 import urllib.parse
+from contextlib import ExitStack
 from datetime import datetime
-from urllib.parse import urlparse
 from dotenv import load_dotenv
 from pymongo import MongoClient
-import traceback
 
-from services.pose_extractor import extract_landmarks_from_video
-from services.pose_analyzer import analyze_poses
-from services.video_generator import save_and_upload_comparative_video
-from utils.helpers import generate_and_upload_pdf
-from utils.openai_feedback import generate_feedback_via_openai
-from utils.r2_utils import get_r2_client
+# Só o necessário para falar com a fila; OpenCV, MediaPipe, OpenAI, fpdf e boto3
+# carregam no warm-up (utils/startup.py) ou no primeiro job
+from utils.logging_utils import configure_logging
+from utils.memory_budget import MemoryBudget
+from utils.metrics import REGISTRY
+from utils.queue_utils import ensure_queue_indexes, make_worker_id, JobLease, JobScheduler, QueueWaker
+from utils.startup import WORKER_WARM_UP_MODULES, start_warm_up
 
 # Carrega variáveis de ambiente
 load_dotenv()
+configure_logging()
+logger = logging.getLogger("worker")
+logger.info("Worker iniciado... carregando módulos")
 
 # --- Configurações ---
 MONGO_USER = urllib.parse.quote_plus(os.getenv("MONGO_USER"))
@@ -29,141 +36,290 @@ R2_SECRET_KEY = os.getenv("R2_SECRET_KEY")
 ENDPOINT_URL = os.getenv("ENDPOINT_URL")
 R2_BUCKET = os.getenv("R2_BUCKET")
 API_KEY = os.getenv("OPENAI_API_KEY")
+LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "120"))
+QUEUE_WAKEUP = os.getenv("QUEUE_WAKEUP", "change_stream")  # change_stream | polling
+# Scheduler: jobs com o mesmo ref_path (e tenant) são reivindicados em lotes de até JOB_BATCH_SIZE
+JOB_BATCH_SIZE = int(os.getenv("JOB_BATCH_SIZE", "4"))
+TENANT_FIELD = os.getenv("JOB_TENANT_FIELD", "trainer")
+# Retry: erros transitórios voltam o job para a fila (retomando dos checkpoints) até JOB_MAX_ATTEMPTS
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_BASE_SECONDS = int(os.getenv("JOB_RETRY_BASE_SECONDS", "30"))
+# Controle de admissão: memória estimada dos jobs em execução no host (todos os processos) fica
+# abaixo de ADMISSION_MEMORY_MB. Jobs acima de LARGE_JOB_MEMORY_MB / LARGE_JOB_CPU_SECONDS vão
+# para a lane "large" (0 desativa; só ative com workers rodando --lane large)
+WORKER_LANE = os.getenv("WORKER_LANE", "default")
+ADMISSION_MEMORY_MB = int(os.getenv("ADMISSION_MEMORY_MB", "1536"))
+LARGE_JOB_MEMORY_MB = int(os.getenv("LARGE_JOB_MEMORY_MB", "0"))
+LARGE_JOB_CPU_SECONDS = float(os.getenv("LARGE_JOB_CPU_SECONDS", "0"))
+# Espera máxima por memória no orçamento; ao esgotar, o job volta para a fila como erro transitório
+ADMISSION_WAIT_SECONDS = float(os.getenv("ADMISSION_WAIT_SECONDS", "600"))
+LANDMARK_CACHE_DIR = os.getenv("LANDMARK_CACHE_DIR", os.path.join(tempfile.gettempdir(), "landmark_cache"))
+LANDMARK_CACHE_MAX_MB = int(os.getenv("LANDMARK_CACHE_MAX_MB", "512"))
+LANDMARK_CACHE_SHARED = os.getenv("LANDMARK_CACHE_SHARED", "").lower() == "r2"
+# Orçamento de memória para frames por job; FRAME_MODE força full | small | none
+JOB_FRAME_MEMORY_MB = int(os.getenv("JOB_FRAME_MEMORY_MB", "512"))
+FRAME_MODE = os.getenv("FRAME_MODE", "")
+# Pareamento de frames ref/exec: "none" (posição a posição) ou "dtw" (alinhamento temporal)
+POSE_ALIGNMENT = os.getenv("POSE_ALIGNMENT", "none")
+# "batch" ou "streaming" (extração, análise e vídeo sobrepostos; o job pode sobrescrever com o campo `pipeline`)
+JOB_PIPELINE = os.getenv("JOB_PIPELINE", "batch")
+
+def _env_number(name, cast=int):
+    value = os.getenv(name)
+    return cast(value) if value else None
+
+# Opções do extrator (ver benchmarks/extraction_report.py para o trade-off precisão x velocidade)
+EXTRACTION_OVERRIDES = dict(
+    max_frames=_env_number("EXTRACT_MAX_FRAMES"),
+    max_seconds=_env_number("EXTRACT_MAX_SECONDS", float),
+    frame_stride=_env_number("EXTRACT_FRAME_STRIDE"),
+    target_fps=_env_number("EXTRACT_TARGET_FPS", float),
+    max_inference_side=_env_number("EXTRACT_MAX_SIDE"),
+    model_complexity=_env_number("EXTRACT_MODEL_COMPLEXITY"),
+    decoder=os.getenv("EXTRACT_DECODER"),  # opencv | ffmpeg (o job pode sobrescrever com o campo `decoder`)
+)
+# Encoder do vídeo comparativo (x264): preset, CRF e movflags (faststart | fragmented)
+VIDEO_ENCODER_OPTIONS = {
+    "preset": os.getenv("VIDEO_PRESET", "veryfast"),
+    "crf": int(os.getenv("VIDEO_CRF", "23")),
+    "movflags": os.getenv("VIDEO_MOVFLAGS", "faststart"),
+}
+# Processos do pool de extração (0 desativa: extrai no próprio processo, em sequência)
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", "2"))
+# Cliente OpenAI: timeout (s) e tentativas; feedback fica em cache no Mongo por FEEDBACK_CACHE_DAYS
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4")
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "3"))
+FEEDBACK_CACHE_DAYS = int(os.getenv("FEEDBACK_CACHE_DAYS", "30"))
+# Threads que executam as etapas independentes de um job (vídeo, feedback, PDF)
+STAGE_THREADS = int(os.getenv("STAGE_THREADS", "4"))
+# Exposição das métricas em formato Prometheus: endpoint HTTP (porta + slot no modo pool)
+# e/ou textfile para o node_exporter
+METRICS_PORT = _env_number("METRICS_PORT")
+METRICS_TEXTFILE_DIR = os.getenv("METRICS_TEXTFILE_DIR", "")
 
 # --- Inicializações ---
 client = MongoClient(MONGO_URI)
 db = client.personalAI
 queue = db.jobs_fila  # Coleção de fila
-s3_client = get_r2_client(R2_KEY, R2_SECRET_KEY, ENDPOINT_URL)
+references = db.references  # Referências pré-computadas pelos jobs "reference"
 
-print("[Worker] Iniciado. Monitorando fila...")
+_services = None
+_services_lock = threading.Lock()
+# Lane e orçamento de memória deste processo, definidos em run_worker
+_runtime = {"lane": WORKER_LANE, "memory_budget": None}
 
 # --- Utilitários ---
-def extract_key_from_url(url):
-    if not url:
-        print("[Erro] URL fornecida é None ou vazia!")
-        return None
-    try:
-        parsed = urlparse(url)
-        return os.path.basename(parsed.path) if parsed.path else None
-    except Exception as e:
-        print(f"[Erro] Falha ao extrair chave da URL: {e}")
-        return None
+def get_services():
+    """
+    Clientes e pools dos jobs (R2, feedback, cache de landmarks, pool de extração),
+    criados uma vez por processo: pelo warm-up ou, se ele ainda não terminou, no primeiro job.
+    """
+    global _services
+    with _services_lock:
+        if _services is None:
+            from services.admission import AdmissionController
+            from services.extraction_pool import ExtractionPool
+            from services.landmark_cache import LandmarkCache
+            from services.pose_extractor import extraction_options
+            from services.reference_templates import ReferenceStore
+            from utils.openai_feedback import FeedbackService, OpenAIBackend
+            from utils.r2_utils import get_r2_client
+
+            options = extraction_options(**EXTRACTION_OVERRIDES)
+            # Um cliente por processo, compartilhado por todas as etapas e jobs (pool em R2_MAX_POOL_CONNECTIONS)
+            s3_client = get_r2_client(R2_KEY, R2_SECRET_KEY, ENDPOINT_URL)
+            _services = {
+                "s3_client": s3_client,
+                "extraction_options": options,
+                "feedback_service": FeedbackService(
+                    OpenAIBackend(API_KEY, model=OPENAI_MODEL, timeout=OPENAI_TIMEOUT, max_retries=OPENAI_MAX_RETRIES),
+                    collection=db.feedback_cache,
+                    ttl_seconds=FEEDBACK_CACHE_DAYS * 24 * 3600,
+                ),
+                "landmark_cache": LandmarkCache(
+                    LANDMARK_CACHE_DIR,
+                    LANDMARK_CACHE_MAX_MB * 1024 * 1024,
+                    s3_client=s3_client if LANDMARK_CACHE_SHARED else None,
+                    bucket_name=R2_BUCKET,
+                ),
+                "references": ReferenceStore(references, s3_client, R2_BUCKET),
+                "admission": AdmissionController(
+                    _runtime["memory_budget"],
+                    lane=_runtime["lane"],
+                    large_memory_bytes=LARGE_JOB_MEMORY_MB * 1024 * 1024,
+                    large_cpu_seconds=LARGE_JOB_CPU_SECONDS,
+                    wait_timeout=ADMISSION_WAIT_SECONDS or None,
+                ),
+                # Pool de extração (None se desativado); os processos carregam o MediaPipe em segundo plano
+                "extraction_pool": (
+                    ExtractionPool(EXTRACTION_WORKERS, (options["model_complexity"],)) if EXTRACTION_WORKERS > 0 else None
+                ),
+            }
+    return _services
+
+def build_job_context(task, shared_reference=None):
+    from services.job_pipeline import JobContext
+
+    services = get_services()
+    return JobContext(
+        task,
+        s3_client=services["s3_client"],
+        bucket_name=R2_BUCKET,
+        feedback_fn=services["feedback_service"].get_feedback,
+        landmark_cache=services["landmark_cache"],
+        extraction_pool=services["extraction_pool"],
+        extraction_options=services["extraction_options"],
+        frame_mode=FRAME_MODE,
+        frame_memory_bytes=JOB_FRAME_MEMORY_MB * 1024 * 1024,
+        alignment=POSE_ALIGNMENT,
+        encoder_options=VIDEO_ENCODER_OPTIONS,
+        shared_reference=shared_reference,
+        admission=services["admission"],
+        pipeline=JOB_PIPELINE,
+        references=services["references"],
+    )
 
 # --- Processamento principal ---
-def process_task(task):
-    print(f"[Worker] Processando: {task.get('student', 'Desconhecido')}")
+def publish_metrics(slot=0):
+    if METRICS_TEXTFILE_DIR:
+        try:
+            REGISTRY.write_textfile(os.path.join(METRICS_TEXTFILE_DIR, f"worker-{slot}.prom"))
+        except OSError as e:
+            logger.warning(f"Falha ao escrever métricas em {METRICS_TEXTFILE_DIR}: {e}")
 
+def process_task(task, lease=None, shared_reference=None):
+    # Com lease, as escritas finais só valem enquanto este worker for o dono do job
+    job_filter = lease.owner_filter() if lease else {"_id": task["_id"]}
     try:
-        ref_key = extract_key_from_url(task.get('ref_path'))
-        exec_key = extract_key_from_url(task.get('exec_path'))
-
-        if not ref_key or not exec_key:
-            raise ValueError("Chaves de vídeo inválidas")
-
-        # Verifica existência no R2
-        print("[Info] Verificando arquivos no R2...")
-        s3_client.get_object(Bucket=R2_BUCKET, Key=ref_key)
-        s3_client.get_object(Bucket=R2_BUCKET, Key=exec_key)
-
-        # Baixa vídeos temporários
-        print("[Info] Baixando vídeos temporários...")
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as ref_temp:
-            ref_data = s3_client.get_object(Bucket=R2_BUCKET, Key=ref_key)['Body'].read()
-            print(f"[Info] Tamanho do arquivo de referência: {len(ref_data)} bytes")
-            ref_temp.write(ref_data)
-
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as exec_temp:
-            exec_data = s3_client.get_object(Bucket=R2_BUCKET, Key=exec_key)['Body'].read()
-            print(f"[Info] Tamanho do arquivo de execução: {len(exec_data)} bytes")
-            exec_temp.write(exec_data)
-
-        # Processamento com MediaPipe
-        print("[Info] Processando vídeos para extração de landmarks...")
-        print("[Worker] Começando extração de frames...", flush=True)
-        frames_ref, landmarks_ref = extract_landmarks_from_video(ref_temp.name)
-        print("[Worker] Frames de referência extraídos!", flush=True)
-        frames_exec, landmarks_exec = extract_landmarks_from_video(exec_temp.name)
-        print("[Worker] Frames de execução extraídos!", flush=True)
-
-        if not frames_ref or not landmarks_ref:
-            print(f"[Erro] Falha ao extrair landmarks do vídeo de referência.", flush=True)
-        if not frames_exec or not landmarks_exec:
-            print(f"[Erro] Falha ao extrair landmarks do vídeo de execução.", flush=True)
-
-        if not frames_ref or not landmarks_ref or not frames_exec or not landmarks_exec:
-            raise ValueError("Falha na extração de landmarks")
-
-        print("[Info] Analisando poses...", flush=True)
-        insights, avg_error, avg_errors = analyze_poses(landmarks_ref, landmarks_exec)
-
-        # Gera e envia vídeo
-        print("[Info] Gerando e enviando vídeo comparativo...", flush=True)
-        video_key = f"comparativos/{task['student']}_comparativo.mp4"
-        video_url = save_and_upload_comparative_video(
-            frames_ref, landmarks_ref, frames_exec, landmarks_exec,
-            upload_path=video_key,
-            s3_client=s3_client,
-            bucket_name=R2_BUCKET
-        )
-        
-        if not video_url:
-            raise ValueError("Falha ao gerar ou enviar vídeo comparativo para o R2.")
-        
-        # Gera e envia PDF
-        print("[Info] Gerando e enviando PDF...", flush=True)
-        pdf_key = f"relatorios/{task['student']}_relatorio.pdf"
-        local_pdf_path = os.path.join("temp", f"{task['student']}_relatorio.pdf")
-        full_feedback = generate_feedback_via_openai(avg_errors, API_KEY)
-        pdf_url = generate_and_upload_pdf(
-            student_name=task['student'],
-            insights=insights,
-            avg_error=avg_error,
-            video_url=video_url,
-            output_path_local=local_pdf_path,
-            output_path_r2=pdf_key,
-            s3_client=s3_client,
-            bucket_name=R2_BUCKET,
-            full_feedback=full_feedback
-        )
-
-        if not pdf_url:
-            raise ValueError("Falha ao gerar ou enviar o PDF para o R2.")
+        from services.job_pipeline import process_job
 
-        # Atualiza job no MongoDB
-        print("[Info] Atualizando status do job no MongoDB para 'done'...", flush=True)
+        ctx = build_job_context(task, shared_reference)
+    except Exception as e:
+        # Serviços criados sob demanda podem falhar aqui (import, índice do cache...): o job
+        # termina com erro e libera o lease, em vez de derrubar o worker e ficar preso em
+        # 'processing' até o lease expirar e derrubar o próximo worker
+        logger.exception(f"Falha ao preparar o job {task['_id']}: {e}", extra={"job_id": str(task["_id"]), "status": "error"})
         queue.update_one(
-            {"_id": task["_id"]},
+            job_filter,
             {
-                "$set": {
-                    "status": "done",
-                    "video_url": video_url,
-                    "report_url": pdf_url,
-                    "feedback": full_feedback,
-                    "processed_at": datetime.utcnow()
-                }
+                "$set": {"status": "error", "error_message": str(e), "processed_at": datetime.utcnow()},
+                "$unset": {"lease_expires_at": ""},
             }
         )
+        REGISTRY.observe_job({"wall_seconds": 0.0, "stages": {}}, "error")
+        return
 
-        # Limpeza de arquivos temporários
-        os.remove(ref_temp.name)
-        os.remove(exec_temp.name)
-        os.remove(local_pdf_path)
+    status, metrics = process_job(
+        queue, ctx, job_filter, max_workers=STAGE_THREADS,
+        max_attempts=JOB_MAX_ATTEMPTS, retry_base_seconds=JOB_RETRY_BASE_SECONDS,
+    )
+    # Job de outro worker (lease perdido): o resultado foi descartado e não entra nas métricas
+    if status != "lost":
+        REGISTRY.observe_job(metrics, status)
 
-        print(f"[Worker] ✅ Finalizado: {task['student']}", flush=True)
+def process_batch(batch, worker_id, slot=0):
+    """Processa em sequência um lote de jobs com a mesma referência, baixada e extraída uma vez."""
+    from services.job_pipeline import SharedReference
 
-    except Exception as e:
-        print(f"[Erro ao processar {task.get('student')}] {e}", flush=True)
-        traceback.print_exc()
-        queue.update_one(
-            {"_id": task["_id"]},
-            {"$set": {"status": "error", "error_message": str(e), "processed_at": datetime.utcnow()}}
-        )
+    with ExitStack() as stack:
+        # Todos os jobs do lote mantêm o lease enquanto esperam a vez
+        leases = [stack.enter_context(JobLease(queue, task["_id"], worker_id, LEASE_SECONDS)) for task in batch]
+        shared_reference = SharedReference() if len(batch) > 1 else None
+        if shared_reference:
+            stack.callback(shared_reference.close)
+            logger.info(f"Lote de {len(batch)} jobs com a referência {batch[0].get('ref_path')}")
+        for index, (task, lease) in enumerate(zip(batch, leases)):
+            # Os jobs extras do lote só contam a tentativa agora, ao começar
+            if index > 0 and not lease.lost.is_set():
+                task = lease.start_attempt() or task
+            if lease.lost.is_set():
+                logger.warning(f"Lease do job {task['_id']} perdido antes do processamento; pulando.")
+                continue
+            process_task(task, lease, shared_reference)
+            publish_metrics(slot)
 
 # --- Loop de monitoramento ---
-while True:
-    task = queue.find_one({"status": "pending"})
-    if task:
-        process_task(task)
-    else:
+def make_memory_budget(slots=1):
+    return MemoryBudget(ADMISSION_MEMORY_MB * 1024 * 1024, slots) if ADMISSION_MEMORY_MB > 0 else None
+
+def run_worker(worker_id=None, wakeup=QUEUE_WAKEUP, slot=0, lane=WORKER_LANE, memory_budget=None):
+    worker_id = worker_id or make_worker_id()
+    # No modo pool o orçamento vem do processo pai, compartilhado entre os workers do host
+    memory_budget = memory_budget or make_memory_budget(slot + 1)
+    _runtime.update(lane=lane, memory_budget=memory_budget.bind(slot) if memory_budget else None)
+    # Módulos pesados carregam em paralelo; o claim não espera por eles
+    start_warm_up(WORKER_WARM_UP_MODULES, then=get_services)
+    if METRICS_PORT:
+        REGISTRY.serve(METRICS_PORT + slot)
+    waker = QueueWaker(queue, use_change_stream=(wakeup == "change_stream"), max_wait=LEASE_SECONDS)
+    scheduler = JobScheduler(
+        queue, worker_id, LEASE_SECONDS, batch_size=JOB_BATCH_SIZE, tenant_field=TENANT_FIELD, lane=lane
+    )
+    logger.info(
+        f"{worker_id} (lane {lane}) pronto em {time.perf_counter() - _BOOT_STARTED:.2f}s. Monitorando fila...",
+        extra={"worker_id": worker_id, "ready_seconds": round(time.perf_counter() - _BOOT_STARTED, 4)},
+    )
+
+    while True:
+        waker.clear()
+        batch = scheduler.claim()
+        if batch:
+            waker.found()
+            process_batch(batch, worker_id, slot)
+        else:
+            waker.wait()
+
+def run_pool(concurrency, wakeup=QUEUE_WAKEUP, lane=WORKER_LANE):
+    """Mantém `concurrency` processos worker vivos neste host, recriando os que morrerem."""
+    ctx = multiprocessing.get_context("spawn")
+    base_id = make_worker_id()
+    memory_budget = make_memory_budget(concurrency)
+    procs = {}
+
+    def spawn(slot):
+        proc = ctx.Process(
+            target=run_worker, args=(f"{base_id}-{slot}", wakeup, slot, lane, memory_budget), name=f"worker-{slot}"
+        )
+        proc.start()
+        procs[slot] = proc
+
+    for slot in range(concurrency):
+        spawn(slot)
+
+    logger.info(f"Pool com {concurrency} processos iniciado.")
+    while True:
         time.sleep(5)
+        for slot, proc in list(procs.items()):
+            if not proc.is_alive():
+                logger.warning(f"Processo {proc.name} saiu (código {proc.exitcode}); reiniciando.")
+                # Reservas do processo morto (ex.: OOM kill no meio do job) voltam ao orçamento
+                freed = memory_budget.release_slot(slot) if memory_budget else 0
+                if freed:
+                    logger.warning(f"{freed / 2**20:.0f} MB reservados por {proc.name} devolvidos ao orçamento.")
+                spawn(slot)
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker da fila jobs_fila.")
+    parser.add_argument(
+        "--concurrency", type=int, default=int(os.getenv("WORKER_CONCURRENCY", "1")),
+        help="Número de processos worker neste host (padrão: 1)."
+    )
+    parser.add_argument(
+        "--wakeup", choices=["change_stream", "polling"], default=QUEUE_WAKEUP,
+        help="Como aguardar jobs novos: change stream do MongoDB ou polling com backoff."
+    )
+    parser.add_argument(
+        "--lane", default=WORKER_LANE,
+        help="Lane de jobs atendida: 'default' ou 'large' (jobs adiados pelo controle de admissão)."
+    )
+    args = parser.parse_args()
+
+    ensure_queue_indexes(queue, TENANT_FIELD)
+    if args.concurrency > 1:
+        run_pool(args.concurrency, args.wakeup, args.lane)
+    else:
+        run_worker(wakeup=args.wakeup, lane=args.lane)
+
+if __name__ == "__main__":
+    main()